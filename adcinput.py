@@ -0,0 +1,120 @@
+#!/usr/bin/python
+
+# Analog input sampling for the Snake Eyes Bonnet's ADS1015 ADC.  The
+# renderers formerly read all four ADC channels in a tight loop in a
+# thread (at data_rate 250, about 75 Hz per channel) whether configured or
+# not, storing the latest raw values in a list: the frame loop got values
+# up to ~13 ms old with no way to tell how old.  ADCSampler reads only the
+# channels in use, each at its own rate, and stores timestamped samples in
+# a small ring buffer per channel; the frame loop asks for a channel's
+# value at the frame's time, interpolated (or briefly extrapolated) from
+# the most recent samples.  Fewer, faster conversions also mean less time
+# holding the I2C bus.
+
+import threading
+import time
+
+# ADC input range is +- 4.096V, output is -2048 to +2047.  Analog inputs
+# will be 0 to ~3.3V, thus 0 to 1649-ish; values are clipped and scaled
+# to 0.0 to 1.0.
+ADC_MAX = 1649
+
+
+# Ring buffer of (time, value) samples, written by one thread and read by
+# another without locking: the writer fills a slot and only then bumps
+# 'count', and the reader checks 'count' again after reading to make sure
+# the writer didn't reach the slots it read in the meantime.
+class SampleRing(object):
+
+	def __init__(self, size=16):
+		self.size   = size
+		self.times  = [0.0] * size
+		self.values = [0.0] * size
+		self.count  = 0 # Total samples written
+
+	# Add sample (writer thread only)
+	def push(self, t, value):
+		i = self.count % self.size
+		self.times [i] = t
+		self.values[i] = value
+		self.count    += 1
+
+	# Return (times, values) lists of the latest n samples, oldest first;
+	# fewer if not yet written.
+	def latest(self, n):
+		while True:
+			c      = self.count
+			k      = min(n, c)
+			slots  = [(c - k + j) % self.size for j in range(k)]
+			times  = [self.times [i] for i in slots]
+			values = [self.values[i] for i in slots]
+			# Writer overwrites sample s's slot while writing sample s+size
+			if self.count < c - k + self.size: return times, values
+
+	# Value at time t: interpolated between the last two samples, or
+	# extrapolated from them if t is past the latest, by up to one sample
+	# interval (further out, noise would be amplified more than latency
+	# is hidden).  Result is clipped to 0.0 to 1.0.
+	def at(self, t):
+		times, values = self.latest(2)
+		if not values: return 0.0
+		if len(values) < 2 or times[1] <= times[0]: return values[-1]
+		t0, t1 = times
+		v0, v1 = values
+		dt = min(t - t0, (t1 - t0) * 2.0)
+		if dt <= 0.0: return v0
+		v = v0 + (v1 - v0) * dt / (t1 - t0)
+		if   v < 0.0: v = 0.0
+		elif v > 1.0: v = 1.0
+		return v
+
+
+class ADCSampler(object):
+
+	# adc: Adafruit_ADS1x15.ADS1015 (or compatible) object.  rates: dict of
+	# channel number: samples per second, for the channels in use.
+	# dataRate: ADS1015 conversion rate; faster conversions keep sample
+	# timestamps tight (each is the middle of its conversion).  clock must
+	# be the same clock the frame loop's times come from.
+	def __init__(self, adc, rates, dataRate=1600, clock=time.time,
+	  sleep=time.sleep):
+		self.adc      = adc
+		self.dataRate = dataRate
+		self.clock    = clock
+		self.sleep    = sleep
+		self.period   = dict((c, 1.0 / r) for c, r in rates.items())
+		self.rings    = dict((c, SampleRing()) for c in rates)
+
+	# Start sampling in a daemon thread
+	def start(self):
+		thread = threading.Thread(target=self.run)
+		thread.daemon = True
+		thread.start()
+
+	# Sampling loop: read whichever channel is due next, then sleep until
+	# the next one is due.  A channel that falls behind (e.g. I2C bus
+	# contention) resumes from now rather than reading in a burst.
+	def run(self):
+		now = self.clock()
+		due = dict((c, now) for c in self.period)
+		while True:
+			channel = min(due, key=due.get)
+			wait    = due[channel] - self.clock()
+			if wait > 0: self.sleep(wait)
+			t0 = self.clock()
+			n  = self.adc.read_adc(channel, gain=1, data_rate=self.dataRate)
+			t1 = self.clock()
+			if   n <       0: n =       0
+			elif n > ADC_MAX: n = ADC_MAX
+			self.rings[channel].push((t0 + t1) * 0.5, n / float(ADC_MAX))
+			due[channel] = max(due[channel] + self.period[channel], t1)
+
+	# Value (0.0 to 1.0) of channel at time t; see SampleRing.at()
+	def value(self, channel, t):
+		return self.rings[channel].at(t)
+
+	# Seconds since channel's latest sample (None if none yet)
+	def age(self, channel):
+		ring = self.rings[channel]
+		times, values = ring.latest(1)
+		return self.clock() - times[0] if times else None
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+# Check for the 'batch' shader (shaders/batch.vs): renders a two-eye rig
+# (right eye mirrored, different texture offsets, gaze, pupil and eyelid
+# positions per eye) into an offscreen framebuffer once drawing each eye's
+# meshes in turn and once through the batched meshes, with and without
+# the 'morph' shader, and compares the resulting pixels.  Batched drawing
+# must also regenerate iris and eyelid geometry no more often than per-eye
+# drawing: once per distinct mesh, not once per eye (some poses give both
+# eyes the same pupil and eyelid weights).  Like
+# morphcheck.py this needs only EGL and OpenGL ES 3 (pi3d is given a
+# stand-in Display), so it runs headless with Mesa's software renderer:
+#   EGL_PLATFORM=surfaceless LIBGL_ALWAYS_SOFTWARE=1 python batchcheck.py
+# Exits with status 1 if any pixel channel differs by more than
+# 'tolerance' (0-255), or the regen counts differ.
+
+import ctypes
+import sys
+import numpy as np
+import pi3d
+import headless
+import morphcheck
+from pi3d.constants import *
+
+tolerance = 2
+size      = 640
+
+# Eye positions, mirroring and texture offsets, as eyes.py
+positions = [(160, 0), (-160, 0)]
+mirror    = [False, True]
+irisOfs   = [0.5, 0.0]
+scleraOfs = [0.0, 0.5]
+
+# Gaze, pupil, upper and lower eyelid per eye, one frame per line
+poses = (
+  ((10, -20), (0.3, 0.7), (0.2, 0.6), (0.4, 0.1)),
+  ((-25, 15), (0.8, 0.1), (0.9, 0.5), (0.0, 0.3)),
+  (( 0,   0), (0.5, 0.5), (1.0, 0.0), (1.0, 0.0)),
+  (( 5,   5), (0.4, 0.4), (0.5, 0.5), (0.2, 0.2)))
+
+# Enough of a pi3d Display for textures, shaders and Buffer.draw()
+class CheckDisplay(headless.NullDisplay):
+	def __init__(self, w, h):
+		headless.NullDisplay.__init__(self, w, h)
+		self.last_textures = [None] * 8
+		self.last_shader   = None
+		self.offscreen_tex = False
+
+# Render each pose with one rig (morph and batch shaders may be None);
+# returns a list of RGBA arrays and the rig's (iris, eyelid) regens.
+def render(assets, shaders, textures, target, morph, batch):
+	rig = EyeRig(assets, 128, shaders[0], textures[0], textures[1],
+	  textures[2], positions, mirror, irisOfs, scleraOfs, 0.25, morph, 0.25,
+	  batch)
+	frames = []
+	for gaze, pupil, upper, lower in poses:
+		rig.gaze[:]     = gaze
+		rig.pupil[:]    = pupil
+		rig.upperLid[:] = upper
+		rig.lowerLid[:] = lower
+		rig.update()
+		rig.update() # Second pass picks up any meshes queued by the first
+		opengles.glClearColor(ctypes.c_float(0.0), ctypes.c_float(0.0),
+		  ctypes.c_float(0.2), ctypes.c_float(1.0))
+		target.begin()
+		rig.draw()
+		target.end()
+		a = np.zeros((size, size, 4), dtype=np.uint8)
+		target.bind()
+		glRead(0, 0, size, size, a)
+		target.end()
+		frames.append(a)
+	return frames, (rig.irisRegens(), rig.lidRegens())
+
+
+if __name__ == "__main__":
+	print("Renderer: %s" % morphcheck.initGL().decode())
+	disp = CheckDisplay(size, 480)
+	pi3d.Display.Display.INSTANCE = disp
+	from eyeasset import *
+	from eyerig import *
+	from texcache import loadTexture
+	from gfxutil import RenderTarget
+	from panelout import glRead
+
+	opengles.glEnable(GL_CULL_FACE)
+	opengles.glFrontFace(GL_CW)
+	cam      = pi3d.Camera(is_3d=False, at=(0, 0, 0), eye=(0, 0, -1000))
+	light    = pi3d.Light(lightpos=(0, -500, -500),
+	  lightamb=(0.2, 0.2, 0.2))
+	shaders  = (pi3d.Shader("uv_light"), pi3d.Shader("shaders/morph"),
+	  pi3d.Shader("shaders/batch"))
+	assets   = loadEye("graphics/eye.svg")
+	mapSize  = mapSizes(assets, 128)
+	textures = (
+	  loadTexture("graphics/iris.jpg"  , mapSize["iris"]  , mipmap=False,
+	    filter=GL_LINEAR),
+	  loadTexture("graphics/sclera.png", mapSize["sclera"], mipmap=False,
+	    filter=GL_LINEAR, blend=True),
+	  loadTexture("graphics/lid.png"   , mapSize["lid"]   , mipmap=False,
+	    filter=GL_LINEAR, blend=True))
+	target   = RenderTarget(size, disp, 0, -80, size)
+	worst    = 0
+	regensOK = True
+
+	for name, morph in (("plain", None), ("morph", shaders[1])):
+		single, regens   = render(assets, shaders, textures, target, morph,
+		  None)
+		batched, bRegens = render(assets, shaders, textures, target, morph,
+		  shaders[2])
+		for n, (a, b) in enumerate(zip(single, batched)):
+			# Destination alpha isn't shown; compare colour only
+			d = np.abs(a[:, :, :3].astype(int) - b[:, :, :3].astype(int))
+			print("%-5s pose %d  max diff %d, %d pixels over tolerance, "
+			  "%d pixels drawn" % (name, n, d.max(),
+			  (d.max(axis=2) > tolerance).sum(),
+			  (a[:, :, :3] != (0, 0, 51)).any(axis=2).sum()))
+			worst = max(worst, d.max())
+		print("%-5s regens iris %d, eyelid %d; batched iris %d, eyelid %d" %
+		  ((name,) + regens + bRegens))
+		regensOK = regensOK and bRegens == regens
+
+	ok = worst <= tolerance and regensOK
+	print("%s (worst %d, tolerance %d%s)" % ("OK" if ok else "FAIL",
+	  worst, tolerance, "" if regensOK else "; regen counts differ"))
+	sys.exit(0 if ok else 1)
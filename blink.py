@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+# Blink and wink state for any number of eyes.  The renderers formerly
+# ran a hand-copied blink state machine per eye (blinkState, blinkStartTime
+# and blinkDuration lists, or scalars in cyclops.py), interleaved with the
+# button checks, then worked out each eye's eyelid weights in another
+# loop.  BlinkTable holds the same state as arrays indexed by eye (state,
+# start time, duration, hold flag, tracking position, blinks started);
+# each frame, start() begins blinks for whichever eyes a button or timer
+# picks, advance() moves every eye on through its blink, and lids()
+# returns all eyes' eyelid weights at once, shaped by a blink curve.  More
+# eyes, other curves or blinks started by group are then just different
+# arrays.
+
+import numpy as np
+
+NOBLINK = 0 # Eyelids where tracking puts them
+ENBLINK = 1 # Eyelids closing (or held closed, once shut)
+DEBLINK = 2 # Eyelids opening; takes twice as long as closing
+
+
+# Blink curves: eyelid closure (0.0 to 1.0) at a fraction of the way
+# through a closing or opening phase (0.0 to 1.0; opening is reversed).
+def linearBlink(n):
+	return n
+
+# Ease in/out curve: 3*t^2-2*t^3, as the eyes' motion
+def easeBlink(n):
+	return n * n * (3.0 - 2.0 * n)
+
+
+class BlinkTable(object):
+
+	# count: number of eyes, tracking: initial eyelid tracking position
+	# (0.0 = fully up, 1.0 = fully down), curve: blink curve (see above).
+	def __init__(self, count, tracking=0.3, curve=linearBlink):
+		self.count     = count
+		self.curve     = curve
+		self.state     = np.zeros(count, dtype=np.int8)
+		self.startTime = np.zeros(count)
+		self.duration  = np.full(count, 0.1)
+		self.hold      = np.zeros(count, dtype=bool) # Held shut once closed
+		self.tracking  = np.full(count, tracking)
+		self.blinks    = np.zeros(count, dtype=int) # Started, for metrics
+
+	# Start closing eyes flagged True in array 'eyes' at time(s) 'start',
+	# taking 'duration' seconds (scalars, or arrays per eye).
+	def start(self, eyes, start, duration):
+		eyes = np.asarray(eyes, dtype=bool)
+		self.state    [eyes]  = ENBLINK
+		self.startTime[eyes]  = np.broadcast_to(start, eyes.shape)[eyes]
+		self.duration [eyes]  = np.broadcast_to(duration, eyes.shape)[eyes]
+		self.blinks   [eyes] += 1
+
+	# Set hold flags (scalar or array; e.g. buttons held) and move each
+	# blinking eye to its next phase once its current one has elapsed:
+	# closing to opening (unless held; the eye stays shut), opening to
+	# not blinking.
+	def advance(self, now, hold=False):
+		self.hold[:] = hold
+		if not self.state.any(): return # No eye blinking (most frames)
+		done   = ((self.state != NOBLINK) &
+		          (now - self.startTime >= self.duration))
+		done  &= ~((self.state == ENBLINK) & self.hold)
+		reopen = done & (self.state == ENBLINK)
+		self.state[done]       = np.where(reopen[done], DEBLINK, NOBLINK)
+		self.duration[reopen] *= 2.0
+		self.startTime[reopen] = now
+
+	# Ease eyelid tracking positions 1/4 of the way toward 'target' (0.0
+	# to 1.0, scalar or array).
+	def track(self, target):
+		self.tracking *= 3.0
+		self.tracking += target
+		self.tracking *= 0.25
+
+	# Upper and lower eyelid weights (arrays, 0.0 = open, 1.0 = shut) at
+	# time 'now': tracking position, closed by each eye's blink so far.
+	def lids(self, now):
+		t = self.tracking
+		if not self.state.any(): return t, 1.0 - t
+		n = np.clip((now - self.startTime) / self.duration, 0.0, 1.0)
+		n = np.where(self.state == DEBLINK, 1.0 - n, n)
+		n = np.where(self.state == NOBLINK, 0.0, self.curve(n))
+		return t + n * (1.0 - t), (1.0 - t) + n * t
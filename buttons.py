@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+# Blink and wink button input.  The renderers formerly polled each button
+# with GPIO.input() (a syscall-backed read) up to six times per frame, with
+# no debouncing, so a bouncing contact could restart a blink, and a press
+# was only noticed (and timed) whenever the next frame got around to it.
+# Buttons registers GPIO edge callbacks once; edges are debounced and
+# timestamped in RPi.GPIO's callback thread, and each frame takes one
+# immutable ButtonSnapshot of all buttons: no GPIO access in the frame
+# loop, and a blink can be timed from the real press.  Presses are
+# counted, so a tap pressed and released between two frames is still seen.
+
+import threading
+import time
+from collections import namedtuple
+
+# State of one button in a snapshot: whether it's held, time of latest
+# (debounced) press and release (None if none yet), and count of presses.
+ButtonState = namedtuple("ButtonState",
+  "pressed pressTime releaseTime presses")
+RELEASED    = ButtonState(False, None, None, 0) # Unused pins (-1) read as this
+
+
+# Buttons as of one frame.  snapshot[pin] is a ButtonState.
+class ButtonSnapshot(object):
+	__slots__ = ("time", "prevTime", "states", "prevStates")
+
+	def __init__(self, now, prevTime, states, prevStates=None):
+		self.time       = now
+		self.prevTime   = prevTime # Time of previous snapshot
+		self.states     = states
+		self.prevStates = prevStates or {} # States in previous snapshot
+
+	def __getitem__(self, pin):
+		return self.states.get(pin, RELEASED)
+
+	def held(self, pin):
+		return self[pin].pressed
+
+	# Number of presses of 'pin' since the previous snapshot, including
+	# any released again before this one (a tap held() never sees).
+	def newPresses(self, pin):
+		return self[pin].presses - self.prevStates.get(pin, RELEASED).presses
+
+	# True if 'pin' is held or was pressed since the previous snapshot
+	def tapped(self, pin):
+		return self[pin].pressed or self.newPresses(pin) > 0
+
+	# Start time for something triggered by a press of 'pin': the press
+	# time, if it was pressed since the previous snapshot, else 'default'
+	# (e.g. button already held before something else finished).
+	def pressedAt(self, pin, default):
+		t = self[pin].pressTime
+		if t is not None and self.prevTime is not None and t > self.prevTime:
+			return t
+		return default
+
+
+# Debounced state of one button, updated under Buttons.lock
+class ButtonTracker(object):
+
+	def __init__(self, pressed):
+		self.pressed     = pressed
+		self.pressTime   = None
+		self.releaseTime = None
+		self.presses     = 0
+		self.changed     = 0.0     # Time of last accepted change
+		self.level       = pressed # Pin level as of last edge
+		self.lastEdge    = 0.0
+
+	def change(self, pressed, t):
+		self.pressed = pressed
+		self.changed = t
+		if pressed:
+			self.pressTime  = t
+			self.presses   += 1
+		else:
+			self.releaseTime = t
+
+	def state(self):
+		return ButtonState(self.pressed, self.pressTime, self.releaseTime,
+		  self.presses)
+
+
+class Buttons(object):
+
+	# gpio: RPi.GPIO module.  pins: GPIO pins (BCM numbers) of buttons,
+	# active low with pull-ups; pins < 0 are ignored.  bounce: seconds an
+	# edge must follow the last accepted change to be accepted itself.
+	def __init__(self, gpio, pins, bounce=0.02, clock=time.time):
+		self.gpio     = gpio
+		self.bounce   = bounce
+		self.clock    = clock
+		self.lock     = threading.Lock()
+		self.trackers = {} # Pin: ButtonTracker
+		self.prevTime = None
+		self.prev     = None # States in previous snapshot
+		for pin in pins:
+			if pin < 0 or pin in self.trackers: continue
+			gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+			self.trackers[pin] = ButtonTracker(gpio.input(pin) == gpio.LOW)
+			gpio.add_event_detect(pin, gpio.BOTH, callback=self.edge)
+
+	# GPIO callback (RPi.GPIO's thread).  The first edge that changes a
+	# button's state is accepted at once (so the press time is the real
+	# edge); further edges within 'bounce' of it are contact bounce, but
+	# the pin level they read is kept, in case the button really was
+	# released (or pressed) in that time; see snapshot().
+	def edge(self, pin):
+		t     = self.clock()
+		level = self.gpio.input(pin) == self.gpio.LOW
+		with self.lock:
+			b          = self.trackers[pin]
+			b.level    = level
+			b.lastEdge = t
+			if level != b.pressed and t - b.changed >= self.bounce:
+				b.change(level, t)
+
+	# Return ButtonSnapshot of all buttons as of now; call once per frame.
+	# A pin level differing from a button's state is accepted once it's
+	# been steady for 'bounce' seconds (the last edge of a bounce window
+	# was the real one).
+	def snapshot(self):
+		now = self.clock()
+		with self.lock:
+			states = {}
+			for pin, b in self.trackers.items():
+				if b.level != b.pressed and now - b.lastEdge >= self.bounce:
+					b.change(b.level, b.lastEdge)
+				states[pin] = b.state()
+		snap = ButtonSnapshot(now, self.prevTime, states, self.prev)
+		self.prevTime = now
+		self.prev     = states
+		return snap
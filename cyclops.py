@@ -10,12 +10,20 @@ import Adafruit_ADS1x15
 import math
 import pi3d
 import random
-import thread
 import time
 import RPi.GPIO as GPIO
-from svg.path import Path, parse_path
-from xml.dom.minidom import parse
 from gfxutil import *
+from eyeasset import *
+from eyerig import *
+from framepace import *
+from pupil import *
+from adcinput import *
+from buttons import *
+from blink import *
+from inputtrace import *
+from profiler import *
+from metrics import *
+from texcache import *
 
 # INPUT CONFIG for eye motion ----------------------------------------------
 # ANALOG INPUTS REQUIRE SNAKE EYES BONNET
@@ -23,6 +31,8 @@ from gfxutil import *
 JOYSTICK_X_IN   = -1    # Analog input for eye horiz pos (-1 = auto)
 JOYSTICK_Y_IN   = -1    # Analog input for eye vert position (")
 PUPIL_IN        = -1    # Analog input for pupil control (-1 = auto)
+JOYSTICK_RATE   = 100   # Samples/sec for each joystick input
+PUPIL_RATE      = 20    # Samples/sec for PUPIL_IN
 JOYSTICK_X_FLIP = False # If True, reverse stick X axis
 JOYSTICK_Y_FLIP = False # If True, reverse stick Y axis
 PUPIL_IN_FLIP   = False # If True, reverse reading from PUPIL_IN
@@ -32,67 +42,57 @@ PUPIL_MIN       = 0.0   # Lower analog range from PUPIL_IN
 PUPIL_MAX       = 1.0   # Upper "
 BLINK_PIN       = 23    # GPIO pin for blink button
 AUTOBLINK       = True  # If True, eye blinks autonomously
+BLINK_EASE      = False # If True, eyelids ease in/out of blinks
+TRACE_RECORD    = None  # File to record inputs to (see inputtrace.py)
+TRACE_REPLAY    = None  # File to replay recorded inputs from
+TRACE_REALTIME  = True  # If True, replay at recorded pace, else flat out
+
+
+# RENDER CONFIG ------------------------------------------------------------
+
+SHADER_MORPH    = False # If True, morph iris & eyelids in vertex shader
+IDLE_SKIP       = True  # If True, don't redraw frames where nothing moved
+FRAME_RATE      = 60    # Target frames/sec (0 = unpaced)
+LATE_REPORT     = 0     # If > 0, print late frame count every N sec
+METRICS         = None  # Localhost TCP port or Unix socket path for
+                        # live metrics (see metrics.py), None = off
+PROFILE         = False # If True, time frame stages (see profiler.py)
+PROFILE_SLOW    = 50    # If PROFILE, log frames slower than this (ms)
 
 
 # GPIO initialization ------------------------------------------------------
 
+# Button is debounced and timestamped by edge callbacks (see buttons.py);
+# frame() takes one snapshot of it per frame rather than polling the pin.
 GPIO.setmode(GPIO.BCM)
-if BLINK_PIN >= 0: GPIO.setup(BLINK_PIN , GPIO.IN, pull_up_down=GPIO.PUD_UP)
+buttons = Buttons(GPIO, (BLINK_PIN,))
 
 
 # ADC stuff ----------------------------------------------------------------
 
-if JOYSTICK_X_IN >= 0 or JOYSTICK_Y_IN >= 0 or PUPIL_IN >= 0:
-	adc      = Adafruit_ADS1x15.ADS1015()
-	adcValue = [0] * 4
+# Only the configured analog inputs are sampled, each at its own rate, in
+# a separate thread (see adcinput.py).  The frame loop reads each input's
+# value at the frame's time, interpolated from timestamped samples.
+# Replaying a trace (see below), recorded values stand in for the ADC.
+adcRates = {}
+if JOYSTICK_X_IN >= 0: adcRates[JOYSTICK_X_IN] = JOYSTICK_RATE
+if JOYSTICK_Y_IN >= 0: adcRates[JOYSTICK_Y_IN] = JOYSTICK_RATE
+if PUPIL_IN      >= 0: adcRates[PUPIL_IN     ] = PUPIL_RATE
+if adcRates and not TRACE_REPLAY:
+	adc = ADCSampler(Adafruit_ADS1x15.ADS1015(), adcRates)
+	adc.start()
 else:
 	adc = None
 
-# Because ADC reads are blocking operations, they normally would slow down
-# the animation loop noticably, especially when reading multiple channels
-# (even when using high data rate settings).  To avoid this, ADC channels
-# are read in a separate thread and stored in the global list adcValue[],
-# which the animation loop can read at its leisure (with immediate results,
-# no slowdown).  Since there's a finite limit to the animation frame rate,
-# we intentionally use a slower data rate (rather than sleep()) to lessen
-# the impact of this thread.  data_rate of 250 w/4 ADC channels provides
-# at most 75 Hz update from the ADC, which is plenty for this task.
-def adcThread(adc, dest):
-	while True:
-		for i in range(len(dest)):
-			# ADC input range is +- 4.096V
-			# ADC output is -2048 to +2047
-			# Analog inputs will be 0 to ~3.3V,
-			# thus 0 to 1649-ish.  Read & clip:
-			n = adc.read_adc(i, gain=1, data_rate=250)
-			if   n <    0: n =    0
-			elif n > 1649: n = 1649
-			dest[i] = n / 1649.0 # Store as 0.0 to 1.0
-
-# Start ADC sampling thread if needed:
-if adc:
-	thread.start_new_thread(adcThread, (adc, adcValue))
-
 
-# Load SVG file, extract paths & convert to point lists --------------------
+# Load eye design: SVG paths, precompiled to a bundle (see eyeasset.py) ---
 
 # Thanks Glen Akins for the symmetrical-lidded cyclops eye SVG!
 # Iris & pupil have been scaled down slightly in this version to compensate
 # for how the WorldEye distorts things...looks OK on WorldEye now but might
 # seem small and silly if used with the regular OLED/TFT code.
-dom               = parse("graphics/cyclops-eye.svg")
-vb                = getViewBox(dom)
-pupilMinPts       = getPoints(dom, "pupilMin"      , 32, True , True )
-pupilMaxPts       = getPoints(dom, "pupilMax"      , 32, True , True )
-irisPts           = getPoints(dom, "iris"          , 32, True , True )
-scleraFrontPts    = getPoints(dom, "scleraFront"   ,  0, False, False)
-scleraBackPts     = getPoints(dom, "scleraBack"    ,  0, False, False)
-upperLidClosedPts = getPoints(dom, "upperLidClosed", 33, False, True )
-upperLidOpenPts   = getPoints(dom, "upperLidOpen"  , 33, False, True )
-upperLidEdgePts   = getPoints(dom, "upperLidEdge"  , 33, False, False)
-lowerLidClosedPts = getPoints(dom, "lowerLidClosed", 33, False, False)
-lowerLidOpenPts   = getPoints(dom, "lowerLidOpen"  , 33, False, False)
-lowerLidEdgePts   = getPoints(dom, "lowerLidEdge"  , 33, False, False)
+eyeAssets = loadEye("graphics/cyclops-eye.svg",
+  ("graphics/iris.jpg", "graphics/sclera.png", "graphics/lid.png"))
 
 
 # Set up display and initialize pi3d ---------------------------------------
@@ -119,169 +119,137 @@ light  = pi3d.Light(lightpos=(0, -500, -500), lightamb=(0.2, 0.2, 0.2))
 
 # Load texture maps --------------------------------------------------------
 
-irisMap   = pi3d.Texture("graphics/iris.jpg"  , mipmap=False,
-              filter=pi3d.GL_LINEAR)
-scleraMap = pi3d.Texture("graphics/sclera.png", mipmap=False,
-              filter=pi3d.GL_LINEAR, blend=True)
-lidMap    = pi3d.Texture("graphics/lid.png"   , mipmap=False,
-              filter=pi3d.GL_LINEAR, blend=True)
+# Maps are loaded (see texcache.py) at the size the eye is drawn, no larger
+# than each map spans
+mapSize   = mapSizes(eyeAssets, eyeRadius)
+irisMap   = loadTexture("graphics/iris.jpg"  , mapSize["iris"]  ,
+              mipmap=False, filter=pi3d.GL_LINEAR)
+scleraMap = loadTexture("graphics/sclera.png", mapSize["sclera"],
+              mipmap=False, filter=pi3d.GL_LINEAR, blend=True)
+lidMap    = loadTexture("graphics/lid.png"   , mapSize["lid"]   ,
+              mipmap=False, filter=pi3d.GL_LINEAR, blend=True)
 # U/V map may be useful for debugging texture placement; not normally used
 #uvMap     = pi3d.Texture("graphics/uv.png"    , mipmap=False,
 #              filter=pi3d.GL_LINEAR, blend=False, m_repeat=True)
 
 
-# Initialize static geometry -----------------------------------------------
-
-# Transform point lists to eye dimensions
-scalePoints(pupilMinPts      , vb, eyeRadius)
-scalePoints(pupilMaxPts      , vb, eyeRadius)
-scalePoints(irisPts          , vb, eyeRadius)
-scalePoints(scleraFrontPts   , vb, eyeRadius)
-scalePoints(scleraBackPts    , vb, eyeRadius)
-scalePoints(upperLidClosedPts, vb, eyeRadius)
-scalePoints(upperLidOpenPts  , vb, eyeRadius)
-scalePoints(upperLidEdgePts  , vb, eyeRadius)
-scalePoints(lowerLidClosedPts, vb, eyeRadius)
-scalePoints(lowerLidOpenPts  , vb, eyeRadius)
-scalePoints(lowerLidEdgePts  , vb, eyeRadius)
-
-# Regenerating flexible object geometry (such as eyelids during blinks, or
-# iris during pupil dilation) is CPU intensive, can noticably slow things
-# down, especially on single-core boards.  To reduce this load somewhat,
-# determine a size change threshold below which regeneration will not occur;
-# roughly equal to 1/2 pixel, since 2x2 area sampling is used.
-
-# Determine change in pupil size to trigger iris geometry regen
-irisRegenThreshold = 0.0
-a = pointsBounds(pupilMinPts) # Bounds of pupil at min size (in pixels)
-b = pointsBounds(pupilMaxPts) # " at max size
-maxDist = max(abs(a[0] - b[0]), abs(a[1] - b[1]), # Determine distance of max
-              abs(a[2] - b[2]), abs(a[3] - b[3])) # variance around each edge
-# maxDist is motion range in pixels as pupil scales between 0.0 and 1.0.
-# 1.0 / maxDist is one pixel's worth of scale range.  Need 1/2 that...
-if maxDist > 0: irisRegenThreshold = 0.5 / maxDist
-
-# Determine change in eyelid values needed to trigger geometry regen.
-# This is done a little differently than the pupils...instead of bounds,
-# the distance between the middle points of the open and closed eyelid
-# paths is evaluated, then similar 1/2 pixel threshold is determined.
-upperLidRegenThreshold = 0.0
-lowerLidRegenThreshold = 0.0
-p1 = upperLidOpenPts[len(upperLidOpenPts) / 2]
-p2 = upperLidClosedPts[len(upperLidClosedPts) / 2]
-dx = p2[0] - p1[0]
-dy = p2[1] - p1[1]
-d  = dx * dx + dy * dy
-if d > 0: upperLidRegenThreshold = 0.5 / math.sqrt(d)
-p1 = lowerLidOpenPts[len(lowerLidOpenPts) / 2]
-p2 = lowerLidClosedPts[len(lowerLidClosedPts) / 2]
-dx = p2[0] - p1[0]
-dy = p2[1] - p1[1]
-d  = dx * dx + dy * dy
-if d > 0: lowerLidRegenThreshold = 0.5 / math.sqrt(d)
-
-# Generate initial iris mesh; vertex elements will get replaced on
-# a per-frame basis in the main loop, this just sets up textures, etc.
-iris = meshInit(32, 4, True, 0, 0.5/irisMap.iy, False)
-iris.set_textures([irisMap])
-iris.set_shader(shader)
-irisZ = zangle(irisPts, eyeRadius)[0] * 0.99 # Get iris Z depth, for later
-
-# Eyelid meshes are likewise temporary; texture coordinates are
-# assigned here but geometry is dynamically regenerated in main loop.
-upperEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-upperEyelid.set_textures([lidMap])
-upperEyelid.set_shader(shader)
-lowerEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-lowerEyelid.set_textures([lidMap])
-lowerEyelid.set_shader(shader)
-
-# Generate sclera for eye...start with a 2D shape for lathing...
-angle1 = zangle(scleraFrontPts, eyeRadius)[1] # Sclera front angle
-angle2 = zangle(scleraBackPts , eyeRadius)[1] # " back angle
-aRange = 180 - angle1 - angle2
-pts    = []
-for i in range(24):
-	ca, sa = pi3d.Utility.from_polar((90 - angle1) - aRange * i / 23)
-	pts.append((ca * eyeRadius, sa * eyeRadius))
-
-eye = pi3d.Lathe(path=pts, sides=64)
-eye.set_textures([scleraMap])
-eye.set_shader(shader)
-reAxis(eye, 0.0)
+# Initialize eye -----------------------------------------------------------
+
+# One eye, centered.  Eyelids are mirrored, as this eye design is drawn
+# for the right eye.  Iris and eyelid geometry is only regenerated for
+# changes of >= 1/2 pixel, since 2x2 area sampling is used; with
+# SHADER_MORPH it's instead moved by the 'morph' vertex shader
+# (shaders/morph.vs, checked by morphcheck.py).  Curves are likewise
+# tessellated finely enough to be within 1/2 pixel.
+if SHADER_MORPH: morphShader = pi3d.Shader("shaders/morph")
+else:            morphShader = None
+rig = EyeRig(eyeAssets, eyeRadius, shader, irisMap, scleraMap, lidMap,
+  positions    = [(0, 0)],
+  mirror       = [True],
+  regenPixels  = 0.5,
+  morphShader  = morphShader,
+  detailPixels = 0.5)
 
 
 # Init global stuff --------------------------------------------------------
 
 mykeys = pi3d.Keyboard() # For capturing key presses
 
-startX       = random.uniform(-30.0, 30.0)
-n            = math.sqrt(900.0 - startX * startX)
-startY       = random.uniform(-n, n)
-destX        = startX
-destY        = startY
-curX         = startX
-curY         = startY
-moveDuration = random.uniform(0.075, 0.175)
-holdDuration = random.uniform(0.1, 1.1)
+# Frames are paced to FRAME_RATE (see framepace.py)
+pacer = FramePacer(FRAME_RATE, report=LATE_REPORT)
+
+# Inputs (clock, random numbers, ADC values and button states) can be
+# recorded to a trace file, or replayed from one for a repeatable run.
+traceConfig = { "JOYSTICK_X_IN": JOYSTICK_X_IN,
+                "JOYSTICK_Y_IN": JOYSTICK_Y_IN, "PUPIL_IN": PUPIL_IN }
+if TRACE_REPLAY:
+	time, random, adc, buttons = replayInputs(TRACE_REPLAY, traceConfig,
+	  TRACE_REALTIME)
+	pacer = FramePacer(0) # Replayed clock sets the pace
+elif TRACE_RECORD:
+	# Header also names the renderer, for headless.py --replay; inputs
+	# are live, so there's no seed or scripted workload.
+	time, random, adc, buttons = recordInputs(TRACE_RECORD,
+	  dict(traceConfig, renderer="cyclops", seed=None, workload=None),
+	  time, random, adc, buttons)
+
+# Frame stage timing and counters (see profiler.py); with PROFILE off
+# the marks in frame() do nothing.
+profiler = makeProfiler(PROFILE, PROFILE_SLOW / 1000.0)
+profiler.gauge("iris regens"   , rig.irisRegens)
+profiler.gauge("eyelid regens" , rig.lidRegens)
+profiler.gauge("skipped regens", rig.skippedRegens)
+profiler.gauge("late frames"   , lambda: pacer.late)
+profiler.gauge("idle frames"   , lambda: idleFrames)
+
+# Live metrics (see metrics.py): frame stats are recorded each frame and
+# served, with the counters below, from the metrics server's own thread.
+if METRICS:
+	frameStats = FrameStats()
+	metrics    = MetricsServer(METRICS, frameStats)
+	metrics.gauge("iris_regens_total"   , rig.irisRegens)
+	metrics.gauge("eyelid_regens_total" , rig.lidRegens)
+	metrics.gauge("skipped_regens_total", rig.skippedRegens)
+	metrics.gauge("late_frames_total"   , lambda: pacer.late)
+	metrics.gauge("idle_frames_total"   , lambda: idleFrames)
+	metrics.gauge("idle_ratio"          ,
+	  lambda: float(idleFrames) / frames if frames else None)
+	metrics.gauge("blinks_total", lambda: eyeBlinks.blinks[0])
+	for c in adcRates:
+		metrics.gauge('adc_sample_age_seconds{channel="%d"}' % c,
+		  lambda c=c: adc.age(c))
+	metrics.start()
+else:
+	frameStats = NullFrameStats()
+
+# Starting gaze and timing, drawn when mainLoop() starts rather than at
+# import, so a trace's inputs (see inputtrace.py) start with the main
+# loop's whether recorded with TRACE_RECORD or by headless.py.
+def startState():
+	global startX, startY, destX, destY, curX, curY
+	global moveDuration, holdDuration, beginningTime
+	startX        = random.uniform(-30.0, 30.0)
+	n             = math.sqrt(900.0 - startX * startX)
+	startY        = random.uniform(-n, n)
+	destX         = startX
+	destY         = startY
+	curX          = startX
+	curY          = startY
+	moveDuration  = random.uniform(0.075, 0.175)
+	holdDuration  = random.uniform(0.1, 1.1)
+	beginningTime = time.time()
+
 startTime    = 0.0
 isMoving     = False
 
 frames        = 0
-beginningTime = time.time()
-
-eye.positionX(0.0)
-iris.positionX(0.0)
-upperEyelid.positionX(0.0)
-upperEyelid.positionZ(-eyeRadius - 42)
-lowerEyelid.positionX(0.0)
-lowerEyelid.positionZ(-eyeRadius - 42)
+idleFrames    = 0 # Frames not drawn, nothing having changed
 
-currentPupilScale  =  0.5
-prevPupilScale     = -1.0 # Force regen on first frame
-prevUpperLidWeight = 0.5
-prevLowerLidWeight = 0.5
-prevUpperLidPts    = pointsInterp(upperLidOpenPts, upperLidClosedPts, 0.5)
-prevLowerLidPts    = pointsInterp(lowerLidOpenPts, lowerLidClosedPts, 0.5)
-
-ruRegen = True
-rlRegen = True
+currentPupilScale = 0.5
 
 timeOfLastBlink = 0.0
 timeToNextBlink = 1.0
-blinkState      = 0
-blinkDuration   = 0.1
-blinkStartTime  = 0
+# Blink state and eyelid tracking position; see blink.py
+eyeBlinks       = BlinkTable(1, 0.3, easeBlink if BLINK_EASE else
+  linearBlink)
 
-trackingPos = 0.3
 
 # Generate one frame of imagery
 def frame(p):
 
 	global startX, startY, destX, destY, curX, curY
 	global moveDuration, holdDuration, startTime, isMoving
-	global frames
-	global iris
-	global pupilMinPts, pupilMaxPts, irisPts, irisZ
-	global eye
-	global upperEyelid, lowerEyelid
-	global upperLidOpenPts, upperLidClosedPts, lowerLidOpenPts, lowerLidClosedPts
-	global upperLidEdgePts, lowerLidEdgePts
-	global prevUpperLidPts, prevLowerLidPts
-	global prevUpperLidWeight, prevLowerLidWeight
-	global prevPupilScale
-	global irisRegenThreshold, upperLidRegenThreshold, lowerLidRegenThreshold
-	global luRegen, llRegen, ruRegen, rlRegen
+	global frames, idleFrames
 	global timeOfLastBlink, timeToNextBlink
-	global blinkState
-	global blinkDuration
-	global blinkStartTime
-	global trackingPos
 
-	DISPLAY.loop_running()
+	pacer.wait() # Sleep until this frame is due
+	profiler.begin()
+	frameStats.begin()
 
-	now = time.time()
-	dt  = now - startTime
+	now     = time.time()
+	dt      = now - startTime
+	pressed = buttons.snapshot() # Button state for this frame
+	profiler.mark("input")
 
 	frames += 1
 #	if(now > beginningTime):
@@ -289,8 +257,8 @@ def frame(p):
 
 	if JOYSTICK_X_IN >= 0 and JOYSTICK_Y_IN >= 0:
 		# Eye position from analog inputs
-		curX = adcValue[JOYSTICK_X_IN]
-		curY = adcValue[JOYSTICK_Y_IN]
+		curX = adc.value(JOYSTICK_X_IN, now)
+		curY = adc.value(JOYSTICK_Y_IN, now)
 		if JOYSTICK_X_FLIP: curX = 1.0 - curX
 		if JOYSTICK_Y_FLIP: curY = 1.0 - curY
 		curX = -30.0 + curX * 60.0
@@ -323,16 +291,11 @@ def frame(p):
 				moveDuration = random.uniform(0.12, 0.35)
 				startTime    = now
 				isMoving     = True
+	profiler.mark("motion")
 
 
-	# Regenerate iris geometry only if size changed by >= 1/2 pixel
-	if abs(p - prevPupilScale) >= irisRegenThreshold:
-		# Interpolate points between min and max pupil sizes
-		interPupil = pointsInterp(pupilMinPts, pupilMaxPts, p)
-		# Generate mesh between interpolated pupil and iris bounds
-		mesh = pointsMesh(None, interPupil, irisPts, 4, -irisZ, True)
-		iris.re_init(pts=mesh)
-		prevPupilScale = p
+	# Pupil scale; iris geometry is brought up to date in rig.update()
+	rig.pupil[0] = p
 
 	# Eyelid WIP
 
@@ -340,146 +303,83 @@ def frame(p):
 		# Similar to movement, eye blinks are slower in this version
 		timeOfLastBlink = now
 		duration        = random.uniform(0.06, 0.12)
-		if blinkState != 1:
-			blinkState     = 1 # ENBLINK
-			blinkStartTime = now
-			blinkDuration  = duration
+		eyeBlinks.start(eyeBlinks.state != ENBLINK, now, duration)
 		timeToNextBlink = duration * 3 + random.uniform(0.0, 4.0)
 
-	if blinkState: # Eye currently winking/blinking?
-		# Check if blink time has elapsed...
-		if (now - blinkStartTime) >= blinkDuration:
-			# Yes...increment blink state, unless...
-			if (blinkState == 1 and # Enblinking and...
-			    (BLINK_PIN >= 0 and    # blink pin held
-			     GPIO.input(BLINK_PIN) == GPIO.LOW)):
-				# Don't advance yet; eye is held closed
-				pass
-			else:
-				blinkState += 1
-				if blinkState > 2:
-					blinkState = 0 # NOBLINK
-				else:
-					blinkDuration *= 2.0
-					blinkStartTime = now
-	else:
-		if BLINK_PIN >= 0 and GPIO.input(BLINK_PIN) == GPIO.LOW:
-			blinkState     = 1 # ENBLINK
-			blinkStartTime = now
-			blinkDuration  = random.uniform(0.035, 0.06)
+	# Eye is held shut while the blink button is held; a press (or a tap
+	# pressed and released since the last frame) starts a blink if the eye
+	# wasn't already blinking.
+	blinkHeld = pressed.held(BLINK_PIN)
+	idle      = eyeBlinks.state == NOBLINK
+	eyeBlinks.advance(now, blinkHeld)
+	if pressed.tapped(BLINK_PIN) and idle[0]:
+		eyeBlinks.start(idle, pressed.pressedAt(BLINK_PIN, now),
+		  random.uniform(0.035, 0.06))
 
 	if TRACKING:
 		# 0 = fully up, 1 = fully down
 		n = 0.5 - curY / 70.0
 		if   n < 0.0: n = 0.0
 		elif n > 1.0: n = 1.0
-		trackingPos = (trackingPos * 3.0 + n) * 0.25
+		eyeBlinks.track(n)
 
-	if blinkState:
-		n = (now - blinkStartTime) / blinkDuration
-		if n > 1.0: n = 1.0
-		if blinkState == 2: n = 1.0 - n
-	else:
-		n = 0.0
-	newUpperLidWeight = trackingPos + (n * (1.0 - trackingPos))
-	newLowerLidWeight = (1.0 - trackingPos) + (n * trackingPos)
-
-	if (ruRegen or (abs(newUpperLidWeight - prevUpperLidWeight) >=
-	  upperLidRegenThreshold)):
-		newUpperLidPts = pointsInterp(upperLidOpenPts,
-		  upperLidClosedPts, newUpperLidWeight)
-		if newUpperLidWeight > prevUpperLidWeight:
-			upperEyelid.re_init(pts=pointsMesh(
-			  upperLidEdgePts, prevUpperLidPts,
-			  newUpperLidPts, 5, 0, False, True))
-		else:
-			upperEyelid.re_init(pts=pointsMesh(
-			  upperLidEdgePts, newUpperLidPts,
-			  prevUpperLidPts, 5, 0, False, True))
-		prevUpperLidWeight = newUpperLidWeight
-		prevUpperLidPts    = newUpperLidPts
-		ruRegen = True
-	else:
-		ruRegen = False
-
-	if (rlRegen or (abs(newLowerLidWeight - prevLowerLidWeight) >=
-	  lowerLidRegenThreshold)):
-		newLowerLidPts = pointsInterp(lowerLidOpenPts,
-		  lowerLidClosedPts, newLowerLidWeight)
-		if newLowerLidWeight > prevLowerLidWeight:
-			lowerEyelid.re_init(pts=pointsMesh(
-			  lowerLidEdgePts, prevLowerLidPts,
-			  newLowerLidPts, 5, 0, False, True))
-		else:
-			lowerEyelid.re_init(pts=pointsMesh(
-			  lowerLidEdgePts, newLowerLidPts,
-			  prevLowerLidPts, 5, 0, False, True))
-		prevLowerLidWeight = newLowerLidWeight
-		prevLowerLidPts    = newLowerLidPts
-		rlRegen = True
-	else:
-		rlRegen = False
+	rig.upperLid[:], rig.lowerLid[:] = eyeBlinks.lids(now)
+	profiler.mark("blink")
+	rig.gaze[0] = (curY, curX)
+	rig.update()
+	profiler.mark("regen")
 
-	# Draw eye
+	# Draw eye, unless nothing visibly moved (see EyeRig.idle()) and the
+	# screen is already up to date
 
-	iris.rotateToX(curY)
-	iris.rotateToY(curX)
-	iris.draw()
-	eye.rotateToX(curY)
-	eye.rotateToY(curX)
-	eye.draw()
-        upperEyelid.draw()
-        lowerEyelid.draw()
+	if IDLE_SKIP and rig.idle():
+		idleFrames += 1
+	else:
+		DISPLAY.loop_running()
+		profiler.mark("display")
+		rig.draw()
+		profiler.mark("draw")
 
 	k = mykeys.read()
+	profiler.mark("keys")
+	profiler.end()
+	frameStats.end()
 	if k==27:
 		mykeys.close()
 		DISPLAY.stop()
 		exit(0)
 
 
-def split( # Recursive simulated pupil response when no analog sensor
-  startValue, # Pupil scale starting value (0.0 to 1.0)
-  endValue,   # Pupil scale ending value (")
-  duration,   # Start-to-end time, floating-point seconds
-  range):     # +/- random pupil scale at midpoint
-	startTime = time.time()
-	if range >= 0.125: # Limit subdvision count, because recursion
-		duration *= 0.5 # Split time & range in half for subdivision,
-		range    *= 0.5 # then pick random center point within range:
-		midValue  = ((startValue + endValue - range) * 0.5 +
-		             random.uniform(0.0, range))
-		split(startValue, midValue, duration, range)
-		split(midValue  , endValue, duration, range)
-	else: # No more subdivisons, do iris motion...
-		dv = endValue - startValue
-		while True:
-			dt = time.time() - startTime
-			if dt >= duration: break
-			v = startValue + dv * dt / duration
+# MAIN LOOP -- runs continuously -------------------------------------------
+
+def mainLoop():
+	global currentPupilScale
+	startState()
+	# Fractal auto pupil scale (see pupil.py), when no sensor
+	autoPupil = pupilTrajectory(time.time, currentPupilScale, rng=random)
+	while True:
+		if PUPIL_IN >= 0: # Pupil scale from sensor
+			v = adc.value(PUPIL_IN, time.time())
+			if PUPIL_IN_FLIP: v = 1.0 - v
+			# If you need to calibrate PUPIL_MIN and MAX,
+			# add a 'print v' here for testing.
 			if   v < PUPIL_MIN: v = PUPIL_MIN
 			elif v > PUPIL_MAX: v = PUPIL_MAX
-			frame(v) # Draw frame w/interim pupil scale value
+			# Scale to 0.0 to 1.0:
+			v = (v - PUPIL_MIN) / (PUPIL_MAX - PUPIL_MIN)
+			if PUPIL_SMOOTH > 0:
+				v = ((currentPupilScale * (PUPIL_SMOOTH - 1) + v) /
+				     PUPIL_SMOOTH)
+		else: # Fractal auto pupil scale
+			v = next(autoPupil)
+			if   v < PUPIL_MIN: v = PUPIL_MIN
+			elif v > PUPIL_MAX: v = PUPIL_MAX
+		frame(v)
+		currentPupilScale = v
 
 
-# MAIN LOOP -- runs continuously -------------------------------------------
-
-while True:
-
-	if PUPIL_IN >= 0: # Pupil scale from sensor
-		v = adcValue[PUPIL_IN]
-		if PUPIL_IN_FLIP: v = 1.0 - v
-		# If you need to calibrate PUPIL_MIN and MAX,
-		# add a 'print v' here for testing.
-		if   v < PUPIL_MIN: v = PUPIL_MIN
-		elif v > PUPIL_MAX: v = PUPIL_MAX
-		# Scale to 0.0 to 1.0:
-		v = (v - PUPIL_MIN) / (PUPIL_MAX - PUPIL_MIN)
-		if PUPIL_SMOOTH > 0:
-			v = ((currentPupilScale * (PUPIL_SMOOTH - 1) + v) /
-			     PUPIL_SMOOTH)
-		frame(v)
-	else: # Fractal auto pupil scale
-		v = random.random()
-		split(currentPupilScale, v, 4.0, 1.0)
-	currentPupilScale = v
+if __name__ == "__main__":
+	try:
+		mainLoop()
+	except TraceEnd: # Replay finished
+		DISPLAY.stop()
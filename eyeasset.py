@@ -0,0 +1,256 @@
+#!/usr/bin/python
+
+# Compiled eye assets.  Parsing an eye design's SVG with minidom and
+# sampling each path through svg.path is a large share of startup time on
+# a Pi Zero, and none of it changes unless the design does.  This compiles
+# a design (SVG plus its texture maps) into one binary bundle holding the
+# sampled point lists, pre-scaled to a unit eye radius, their path tables
+# (see pathTable() in gfxutil.py; for resampling at other point counts
+# without the SVG) and the sclera's profile angles.  Loading a bundle
+# memory-maps it; svg.path and minidom aren't touched.  Iris, eyelids and
+# sclera are then tessellated at the detail the eye's size on screen calls
+# for (see eyeDetail() and scleraShape()).  The bundle stores a content
+# hash of the design files and is recompiled automatically when it no
+# longer matches.
+# Can also be run directly to (re)compile a design ahead of time, e.g.:
+#   python eyeasset.py graphics/eye.svg graphics/iris.jpg \
+#     graphics/sclera.png graphics/lid.png
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import numpy as np
+import pi3d
+from gfxutil import *
+
+# Paths extracted from the SVG: id, default number of points, closed,
+# reversed.  Same for all eye designs; renderers index the loaded assets
+# by id.
+EYE_PATHS = (
+  ("pupilMin"      , 32, True , True ),
+  ("pupilMax"      , 32, True , True ),
+  ("iris"          , 32, True , True ),
+  ("scleraFront"   ,  0, False, False),
+  ("scleraBack"    ,  0, False, False),
+  ("upperLidClosed", 33, False, True ),
+  ("upperLidOpen"  , 33, False, True ),
+  ("upperLidEdge"  , 33, False, False),
+  ("lowerLidClosed", 33, False, False),
+  ("lowerLidOpen"  , 33, False, False),
+  ("lowerLidEdge"  , 33, False, False))
+
+SCLERA_POINTS = 24 # Default points along lathe profile
+SCLERA_SIDES  = 64 # Default lathe segments around eye
+
+# Bundle layout: fixed header, JSON index describing each array (dtype,
+# shape, byte offset from start of file), then raw little-endian array
+# data, each array aligned to 16 bytes so it can be used in-place from
+# the memory map.
+BUNDLE_MAGIC   = b"EYEB"
+BUNDLE_VERSION = 3
+BUNDLE_HEADER  = struct.Struct("<4sI20sI") # magic, version, sha1, index len
+BUNDLE_ALIGN   = 16
+
+
+# Hash of everything a compiled bundle depends on: bundle version, path
+# table and the bytes of the SVG and texture files.
+def designHash(svgPath, textures=()):
+	h = hashlib.sha1()
+	h.update(repr((BUNDLE_VERSION, EYE_PATHS)).encode("utf-8"))
+	for path in (svgPath,) + tuple(textures):
+		with open(path, "rb") as f: h.update(f.read())
+	return h.digest()
+
+
+# Default bundle filename for a given SVG: same name, .bundle extension
+def bundlePathFor(svgPath):
+	return os.path.splitext(svgPath)[0] + ".bundle"
+
+
+# Parse SVG and sample paths at unit radius.  Returns dict
+# of arrays as stored in a bundle.
+def compileArrays(svgPath):
+	from xml.dom.minidom import parse
+
+	dom    = parse(svgPath)
+	vb     = getViewBox(dom)
+	arrays = { "viewBox" : np.array(vb, dtype=np.float32) }
+	for id, numPoints, closed, reverse in EYE_PATHS:
+		table = getTable(dom, id).astype(np.float32)
+		scaleArray(table[:, 1:3], vb, 1.0)
+		arrays[id + "Table"] = table
+		arrays[id] = tablePoints(table, numPoints, closed, reverse)
+
+	# Sclera: start and end angles (degrees from the Z axis) of the arc
+	# that's lathed to form it; see scleraShape().
+	arrays["scleraAngles"] = np.array([
+	  zangle(arrays["scleraFront"], 1.0)[1],
+	  zangle(arrays["scleraBack"] , 1.0)[1]], dtype=np.float32)
+
+	return arrays
+
+
+# Write compiled arrays to a bundle file, tagged with design hash.
+def writeBundle(bundlePath, arrays, digest, textures=()):
+	# Assign aligned offsets following header + index.  Offsets appear
+	# in the index itself, so iterate until the index length settles.
+	names  = sorted(arrays.keys())
+	offset = 0
+	while True:
+		index = { "textures" : list(textures), "arrays" : {} }
+		pos   = offset
+		for name in names:
+			a    = arrays[name]
+			pos += -pos % BUNDLE_ALIGN
+			index["arrays"][name] = [a.dtype.str, list(a.shape), pos]
+			pos += a.nbytes
+		indexBytes = json.dumps(index, sort_keys=True).encode("utf-8")
+		start = BUNDLE_HEADER.size + len(indexBytes)
+		if start <= offset: break
+		offset = start + (-start % BUNDLE_ALIGN)
+
+	tmpPath = bundlePath + ".tmp"
+	with open(tmpPath, "wb") as f:
+		f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, digest,
+		  len(indexBytes)))
+		f.write(indexBytes)
+		for name in names:
+			dtype, shape, pos = index["arrays"][name]
+			f.write(b"\0" * (pos - f.tell()))
+			f.write(np.ascontiguousarray(arrays[name]).tobytes())
+	os.rename(tmpPath, bundlePath) # Replace atomically
+
+
+# Compile eye design to a bundle file.  textures is a list of texture
+# map filenames used with the SVG (only hashed, so edits to them also
+# invalidate the bundle).  Returns the arrays that were written.
+def compileEye(svgPath, textures=(), bundlePath=None):
+	if bundlePath is None: bundlePath = bundlePathFor(svgPath)
+	arrays = compileArrays(svgPath)
+	writeBundle(bundlePath, arrays, designHash(svgPath, textures), textures)
+	return arrays
+
+
+# Memory-map a bundle and return dict of read-only arrays backed by the
+# map, or None if the file is missing, malformed or its hash doesn't
+# match 'digest' (if given).
+def readBundle(bundlePath, digest=None):
+	try:
+		with open(bundlePath, "rb") as f:
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	except (IOError, OSError, ValueError):
+		return None
+	if len(m) < BUNDLE_HEADER.size: return None
+	magic, version, fileHash, indexLen = BUNDLE_HEADER.unpack_from(m, 0)
+	if ((magic != BUNDLE_MAGIC) or (version != BUNDLE_VERSION) or
+	    (digest is not None and fileHash != digest)):
+		return None
+	if BUNDLE_HEADER.size + indexLen > len(m): return None # Truncated
+	try:
+		index  = json.loads(m[BUNDLE_HEADER.size:
+		  BUNDLE_HEADER.size + indexLen].decode("utf-8"))
+		arrays = {}
+		for name, (dtype, shape, pos) in index["arrays"].items():
+			dtype = np.dtype(str(dtype))
+			count = int(np.prod(shape))
+			if pos < 0 or pos + count * dtype.itemsize > len(m): return None
+			arrays[str(name)] = np.frombuffer(m, dtype=dtype, count=count,
+			  offset=pos).reshape(shape)
+	except (ValueError, KeyError, TypeError, struct.error):
+		return None # Corrupt index
+	return arrays
+
+
+# Load an eye design, compiling (and caching to disk, if the directory is
+# writable) when there's no up-to-date bundle.  Returns dict of arrays:
+# each path id in EYE_PATHS as a unit-radius point array, the same id plus
+# 'Table' for its path table (resample with eyePoints()), 'viewBox', and
+# 'scleraAngles' (see scleraShape()).  Scale point arrays by the eye
+# radius before use; the originals are read-only.
+def loadEye(svgPath, textures=(), bundlePath=None):
+	if bundlePath is None: bundlePath = bundlePathFor(svgPath)
+	digest = designHash(svgPath, textures)
+	arrays = readBundle(bundlePath, digest)
+	if arrays is None:
+		arrays = compileArrays(svgPath)
+		try:
+			writeBundle(bundlePath, arrays, digest, textures)
+		except (IOError, OSError):
+			pass # Not writable; use compiled data as-is
+	return arrays
+
+
+# Point array for path 'id' of loaded eye assets, resampled from its path
+# table at numPoints (closed paths get one more, repeating the first), or
+# as stored (default point count) if numPoints is None.  Unit radius.
+def eyePoints(assets, id, numPoints=None):
+	if numPoints is None: return assets[id]
+	for pathId, n, closed, reverse in EYE_PATHS:
+		if pathId == id: break
+	return tablePoints(assets[id + "Table"], numPoints, closed, reverse)
+
+
+# Number of points to tessellate paths 'ids' (which share a mesh, so need
+# the same count) for an eye 'radius' pixels across, so no edge strays
+# more than 'error' pixels from the design's curves (see tableDetail()).
+# Default point count if error is None.
+def eyeDetail(assets, ids, radius, error=None):
+	n = 0
+	for pathId, default, closed, reverse in EYE_PATHS:
+		if pathId in ids:
+			n = max(n, default if error is None else
+			  tableDetail(assets[pathId + "Table"], radius, error, closed))
+	return n
+
+
+# Create sclera Mesh from loaded eye assets at given radius, with texture
+# map U offset (e.g. 0.5 rotates the map 180 degrees on one eye so the
+# repetition isn't obvious).  The lathe has enough sides and profile points
+# to be within 'error' pixels of a sphere, or the defaults (SCLERA_SIDES,
+# SCLERA_POINTS) if error is None.  Other eyes can share its buffer via
+# clone().
+def scleraShape(assets, radius, texOffset, error=None):
+	angle1, angle2 = assets["scleraAngles"]
+	aRange = 180 - angle1 - angle2
+	if error is None:
+		sides, points = SCLERA_SIDES, SCLERA_POINTS
+	else:
+		sides  = arcDetail(radius, 2.0 * math.pi, error)
+		points = arcDetail(radius, math.radians(aRange), error) + 1
+	pts    = [pi3d.Utility.from_polar(
+	  (90 - angle1) - aRange * i / (points - 1)) for i in range(points)]
+	buf, idx = latheArrays(pts, sides)
+	verts  = buf[:, 0:3] * radius
+	tex    = buf[:, 6:8] + (texOffset, 0.0)
+	shape  = Mesh()
+	shape.buf = [pi3d.Buffer(shape, verts, tex, idx, buf[:, 3:6], False)]
+	return shape
+
+
+# On-screen size (width, height in pixels) each texture map of an eye
+# 'radius' pixels across spans at most, for loadTexture() (see
+# texcache.py).  The iris map wraps the iris, and the eyelid map covers
+# eyelids no wider than the eye, so each needs about its diameter.  The
+# sclera map wraps all the way around (U) but runs (V) only along the
+# lathe's profile arc from the iris opening back (see scleraShape()),
+# drawn at most 'radius' pixels per radian where it faces the screen.
+def mapSizes(assets, radius):
+	iris = 2.0 * radius * np.hypot(*assets["iris"].T).max()
+	angle1, angle2 = assets["scleraAngles"]
+	arc  = math.radians(180 - angle1 - angle2)
+	return { "iris"  : (iris, iris),
+	         "sclera": (2.0 * math.pi * radius, radius * arc),
+	         "lid"   : (2.0 * radius, 2.0 * radius) }
+
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2:
+		print("Usage: eyeasset.py design.svg [texture ...]")
+		sys.exit(1)
+	arrays = compileEye(sys.argv[1], sys.argv[2:])
+	print("%s: %d arrays, %d bytes" % (bundlePathFor(sys.argv[1]),
+	  len(arrays), os.path.getsize(bundlePathFor(sys.argv[1]))))
@@ -0,0 +1,442 @@
+#!/usr/bin/python
+
+# Rendering engine for any number of eyes sharing one design.  Formerly
+# eyes.py and cyclops.py each set up their own iris, sclera and eyelid
+# shapes per eye, with separate module variables and a copy-pasted regen
+# block for every eyelid.  EyeRig holds per-eye state (position, gaze,
+# pupil scale, eyelid weights and regen steps) in arrays indexed by eye,
+# so one frame's update and draw is the same code for 1 or 12 eyes.
+#
+# Geometry is shared: each feature (iris, upper and lower eyelid) has a
+# small pool of vertex buffers, and eyes whose quantized weights match
+# (e.g. both eyes blinking together, or tracking the same gaze) draw
+# from the same buffer, regenerated and uploaded once.  Eyes set as
+# mirrored (the right eye of a pair) use the same eyelid geometry as the
+# others, mirrored by their transform rather than by regenerating a
+# flipped mesh.  Optionally (batchShader), each feature is instead drawn
+# for all eyes at once from a BatchMesh holding a copy per eye, with the
+# per-eye transforms applied in the vertex shader: four draw calls per
+# frame however many eyes there are.
+#
+# Eyelids are drawn last, over the iris and sclera, so while they're
+# closed the eye underneath was drawn for nothing.  update() works out
+# from the eyelid paths how much of each eye is left open between the
+# eyelids' opaque parts; an eye covered entirely isn't drawn at all, and
+# while one is mostly covered the eyelids' opaque bands are first drawn
+# into the depth buffer, so the GPU skips the covered part of the eye.
+
+import math
+import numpy as np
+import pi3d
+from gfxutil import *
+from eyeasset import scleraShape, eyePoints, eyeDetail
+
+LID_STEPS  = 5  # Rows spanning eyelid motion since last regen
+IRIS_RINGS = 4  # Rings from pupil to iris edge
+LID_CLIP   = 0.5 # Open fraction of eye below which eyelids clip it
+LID_COVER  = 32 # Eyelid positions (open to shut) coverage is measured at
+
+
+# One feature's pool of shared vertex buffers.  Holds one Mesh 'slot' per
+# eye (the most that can differ in a frame), each remembering the cache
+# key its buffer was last loaded with.  assign() points every eye's shape
+# at a slot holding its key, loading keys not already present into slots
+# no eye needs this frame.  With 'morph' set (SHADER_MORPH), geometry is
+# static morph targets in a single slot and eyes differ only by shader
+# weights; see Mesh.setMorph().  After batchInit(), all eyes are drawn
+# from one BatchMesh instead, and assign() loads each eye's copy in it.
+class SharedMeshes(object):
+
+	def __init__(self, make, cache, count, morph=None):
+		self.cache  = cache
+		self.morph  = morph is not None
+		self.batch  = None
+		if morph is not None:
+			self.slots = [make()]
+			self.slots[0].morphInit(*morph)
+		else:
+			self.slots = [make() for i in range(count)]
+		self.keys   = [None] * len(self.slots)
+		self.regens = 0 # Number of slot (re)loads; i.e. mesh uploads
+		self.skips  = 0 # Number of assignments to an already loaded slot
+
+	# Create per-eye shape drawing from this pool, with given texture
+	# U offset and mirroring.
+	def shape(self, texOffset=(0.0, 0.0), mirror=False):
+		shape = self.slots[0].clone(texOffset)
+		shape.mirror = mirror
+		return shape
+
+	# Draw eyes (mirrored as flagged in 'mirror') from a BatchMesh with
+	# the 'batch' shader; returns the BatchMesh.
+	def batchInit(self, mirror, shader):
+		self.batch   = BatchMesh(self.slots[0], mirror, shader, self.morph)
+		self.eyeKeys = [None] * len(mirror)
+		return self.batch
+
+	# Point each of 'shapes' at a buffer holding geometry for the
+	# corresponding key in 'keys' (tuples of steps; see MeshCache.get()).
+	# If batched, load each eye's copy in the BatchMesh instead: a key
+	# another eye's copy already holds is copied from there rather than
+	# regenerated, as eyes share a slot unbatched, and the frame's
+	# changes go to the GPU in one upload.
+	def assign(self, shapes, keys):
+		if self.batch is not None:
+			held  = list(self.eyeKeys) # Copies' keys before this frame
+			saved = None
+			if any(k != h and k in held for k, h in zip(keys, held)):
+				saved = self.batch.eyeVerts().copy() # e.g. eyes swap keys
+			for i, key in enumerate(keys):
+				if key == held[i]:
+					self.skips += 1
+					continue
+				if key in keys[:i]: # Loaded in an earlier eye's copy
+					verts = self.batch.eyeVerts()[keys.index(key)]
+				elif key in held:
+					verts = saved[held.index(key)]
+				else:
+					verts = self.cache.get(key)
+					self.regens += 1
+				self.batch.load(i, verts)
+				self.eyeKeys[i] = key
+			self.batch.flush()
+			return
+		wanted = set(keys)
+		free   = [i for i, k in enumerate(self.keys) if k not in wanted]
+		slotOf = {}
+		for shape, key in zip(shapes, keys):
+			i = slotOf.get(key)
+			if i is None:
+				if key in self.keys:
+					i = self.keys.index(key)
+					self.skips += 1
+				else:
+					i = free.pop()
+					self.slots[i].update(self.cache.get(key))
+					self.keys[i] = key
+					self.regens += 1
+				slotOf[key] = i
+			shape.buf = self.slots[i].buf
+
+
+# Regen threshold (weight change) for a feature moving between two point
+# lists: 'pixels' divided by the largest distance (in pixels) any edge of
+# the bounds moves.  Used for the iris (between pupil sizes).
+def boundsThreshold(points1, points2, pixels):
+	a = pointsBounds(points1)
+	b = pointsBounds(points2)
+	maxDist = max(abs(a[0] - b[0]), abs(a[1] - b[1]),
+	              abs(a[2] - b[2]), abs(a[3] - b[3]))
+	return pixels / maxDist if maxDist > 0 else 0.0
+
+# As above, but measuring the distance between the middle points of two
+# paths (eyelid open and closed positions).
+def midpointThreshold(points1, points2, pixels):
+	p1 = points1[len(points1) // 2]
+	p2 = points2[len(points2) // 2]
+	d  = math.hypot(p2[0] - p1[0], p2[1] - p1[1])
+	return pixels / d if d > 0 else 0.0
+
+
+class EyeRig(object):
+
+	# assets: loaded eye design (see loadEye()), radius: eye radius in
+	# pixels, shader/irisMap/scleraMap/lidMap as the scripts formerly set
+	# up, positions: list of eye centers (x, y) in pixels, mirror: list of
+	# flags, True to mirror an eye's eyelids, irisOffsets/scleraOffsets:
+	# per-eye texture map U offsets (so the same map doesn't look the same
+	# on every eye).  regenPixels is the on-screen motion, in pixels, below
+	# which iris and eyelid geometry isn't regenerated (1/4 pixel for 4x4
+	# area sampling, etc.).  morphShader, if set, animates iris and eyelids
+	# in the vertex shader instead (see shaders/morph.vs).  detailPixels is
+	# the largest distance, in pixels, any edge of the iris, eyelid or
+	# sclera tessellation may stray from the design's curves, setting
+	# their point counts for the eye's size; None = the designs' default
+	# counts regardless of size.  batchShader, if set (shaders/batch),
+	# draws every eye's iris, sclera and eyelids in one call each.
+	def __init__(self, assets, radius, shader, irisMap, scleraMap, lidMap,
+	  positions, mirror=None, irisOffsets=None, scleraOffsets=None,
+	  regenPixels=0.25, morphShader=None, detailPixels=None,
+	  batchShader=None):
+		n = len(positions)
+		self.count      = n
+		self.radius     = radius
+		self.position   = np.array(positions, dtype=np.float32).reshape(n, 2)
+		self.mirror     = np.zeros(n, dtype=bool)
+		if mirror is not None: self.mirror[:] = mirror
+		self.gaze       = np.zeros((n, 2), dtype=np.float32) # X, Y rotation
+		self.pupil      = np.full(n, 0.5, dtype=np.float32)
+		self.upperLid   = np.full(n, 0.5, dtype=np.float32) # Weights,
+		self.lowerLid   = np.full(n, 0.5, dtype=np.float32) # 0=open 1=shut
+		self.morph      = morphShader is not None
+
+		# Point counts for the eye's size (pupil and iris share a mesh, as
+		# do each eyelid's paths), then point lists transformed to eye
+		# dimensions (assets are at unit radius).
+		irisPoints = eyeDetail(assets, ("pupilMin", "pupilMax", "iris"),
+		  radius, detailPixels)
+		lidPoints  = [eyeDetail(assets, (name + "Edge", name + "Open",
+		  name + "Closed"), radius, detailPixels)
+		  for name in ("upperLid", "lowerLid")]
+		def points(id, n):
+			return eyePoints(assets, id, n) * radius
+		pupilMin = points("pupilMin", irisPoints)
+		pupilMax = points("pupilMax", irisPoints)
+		iris     = points("iris"    , irisPoints)
+		lids     = [] # (edge, open, closed) per eyelid
+		for name, k in zip(("upperLid", "lowerLid"), lidPoints):
+			lids.append((points(name + "Edge"  , k),
+			             points(name + "Open"  , k),
+			             points(name + "Closed", k)))
+		irisZ = zangle(iris, radius)[0] * 0.99 # Iris Z depth
+
+		# Regenerating flexible geometry (eyelids during blinks, iris
+		# during pupil dilation) is CPU intensive, so it's quantized to
+		# steps of about regenPixels of motion and cached (see MeshCache).
+		self.irisMeshes = irisCache(pupilMin, pupilMax, iris, IRIS_RINGS,
+		  -irisZ, boundsThreshold(pupilMin, pupilMax, regenPixels))
+		lidMeshes = [lidCache(lid[0], lid[1], lid[2], LID_STEPS,
+		  midpointThreshold(lid[1], lid[2], regenPixels)) for lid in lids]
+
+		def irisMesh():
+			mesh = meshInit(irisPoints, IRIS_RINGS, True, 0, 0.5 / irisMap.iy,
+			  False)
+			mesh.set_textures([irisMap])
+			mesh.set_shader(morphShader or shader)
+			return mesh
+		def lidMesh(numPoints):
+			mesh = meshInit(numPoints, LID_STEPS, False, 0, 0.5 / lidMap.iy, True)
+			mesh.set_textures([lidMap])
+			mesh.set_shader(morphShader or shader)
+			return mesh
+
+		self.irises = SharedMeshes(irisMesh, self.irisMeshes, n,
+		  irisMorph(pupilMin, pupilMax, iris, IRIS_RINGS, -irisZ)
+		  if self.morph else None)
+		self.lids   = [SharedMeshes(lambda k=k: lidMesh(k), cache, n,
+		  lidMorph(lid[0], lid[1], lid[2], LID_STEPS) if self.morph else None)
+		  for cache, lid, k in zip(lidMeshes, lids, lidPoints)]
+
+		# Per-eye shapes.  Scleras share one buffer, as do irises with
+		# equal pupil steps and eyelids with equal spans of steps.
+		sclera = scleraShape(assets, radius, 0.0, detailPixels)
+		sclera.set_textures([scleraMap])
+		sclera.set_shader(shader)
+		self.irisShapes   = []
+		self.scleraShapes = []
+		self.lidShapes    = [[], []] # Upper, lower
+		lidZ = -radius - 42
+		for i in range(n):
+			x, y = self.position[i]
+			s = self.irises.shape((irisOffsets[i] if irisOffsets else 0.0,
+			  0.0))
+			s.position(x, y, 0.0)
+			self.irisShapes.append(s)
+			s = sclera.clone((scleraOffsets[i] if scleraOffsets else 0.0,
+			  0.0))
+			s.position(x, y, 0.0)
+			self.scleraShapes.append(s)
+			for pool, shapes in zip(self.lids, self.lidShapes):
+				s = pool.shape(mirror=self.mirror[i])
+				s.position(x, y, lidZ)
+				if self.mirror[i]: s.scale(-1.0, 1.0, 1.0)
+				shapes.append(s)
+
+		# With batchShader, each feature's geometry for all eyes is one
+		# BatchMesh, drawn instead of the per-eye shapes (see draw()).
+		self.batches = None
+		if batchShader is not None:
+			irises = self.irises.batchInit([False] * n, batchShader)
+			irises.setPositions(self.position, irisOffsets)
+			scleras = BatchMesh(sclera, [False] * n, batchShader)
+			scleras.setPositions(self.position, scleraOffsets)
+			self.batches = [irises, scleras]
+			for pool in self.lids:
+				batch = pool.batchInit(self.mirror, batchShader)
+				batch.setPositions(self.position)
+				batch.position(0.0, 0.0, lidZ)
+				self.batches.append(batch)
+
+		# Eyelid meshes span the lid's motion since the previous regen
+		# (lower to upper quantized step), per eye; see update().
+		self.lidCaches = lidMeshes
+		self.lidStep   = [[cache.step(0.5)] * n for cache in lidMeshes]
+		self.lidPrev   = np.full((2, n), 0.5, dtype=np.float32) # Morph
+
+		# Eyes entirely covered by their eyelids, and eyes mostly covered
+		# (but not entirely) whose eyelids clip them; see aperture().
+		# Coverage is measured in columns about 2 pixels wide, ignoring
+		# gaps under regenPixels, with eyelids at LID_COVER positions.
+		self.lidPaths  = lids
+		self.covered   = np.zeros(n, dtype=bool)
+		self.clipped   = np.zeros(n, dtype=bool)
+		self.apertures = {}
+		self.lidSpans  = [{}, {}] # Per eyelid, position: (low, high) Ys
+		m              = max(int(radius), 8)
+		self.columns   = (np.arange(m) + 0.5) * (2.0 * radius / m) - radius
+		self.chords    = np.sqrt(radius * radius - self.columns ** 2)
+		self.gapPixels = regenPixels
+
+		# Pose as of the last update() (see poseKey()), and the number of
+		# updates in a row since it last changed; see idle().
+		self.gazeStep  = math.degrees(regenPixels / radius)
+		self.pose      = None
+		self.still     = 0
+
+	# Fraction of the eye left open between its eyelids' opaque parts,
+	# edge to lip, with eyelids at the given (upper, lower) positions, 0
+	# to LID_COVER.  Mirrored eyes' eyelids are mirrored with them, so
+	# it's the same for every eye.  Kept for each pair of positions.
+	def aperture(self, upper, lower):
+		key      = (upper, lower)
+		fraction = self.apertures.get(key)
+		if fraction is not None: return fraction
+		c     = self.chords
+		spans = []
+		for (edge, open, closed), known, position in zip(self.lidPaths,
+		  self.lidSpans, key):
+			span = known.get(position)
+			if span is None:
+				lo, hi = bandSpan(edge, arrayInterp(open, closed,
+				  position / float(LID_COVER)), self.columns)
+				span = known[position] = (np.clip(lo, -c, c),
+				                          np.clip(hi, -c, c))
+			spans.append(span)
+		(a0, a1), (b0, b1) = spans
+		covered = (np.maximum(a1 - a0, 0.0) + np.maximum(b1 - b0, 0.0) -
+		  np.maximum(np.minimum(a1, b1) - np.maximum(a0, b0), 0.0))
+		gaps     = np.maximum(2.0 * c - covered - self.gapPixels, 0.0)
+		fraction = gaps.sum() / (2.0 * c).sum()
+		self.apertures[key] = fraction
+		return fraction
+
+	# Set covered and clipped flags from eyelid weights (per eye, upper
+	# and lower; each the lower end of the eyelid mesh's span, where its
+	# opaque band ends), rounded down to LID_COVER positions so an eye is
+	# never taken for more covered than it is, give or take a regen step
+	# (weights are quantized to those, so fully shut may be just short).
+	def cover(self, upperWeights, lowerWeights):
+		hidden = self.covered.copy()
+		u, l   = [cache.threshold for cache in self.lidCaches]
+		for i in range(self.count):
+			a = self.aperture(min(int((upperWeights[i] + u) * LID_COVER),
+			  LID_COVER), min(int((lowerWeights[i] + l) * LID_COVER),
+			  LID_COVER))
+			self.covered[i] = a <= 0.0
+			self.clipped[i] = 0.0 < a < LID_CLIP
+		if self.batches is not None and (hidden != self.covered).any():
+			for batch in self.batches[:2]: # Irises, scleras
+				batch.setHidden(self.covered)
+
+	# Regen counters, for benchmarks and stats
+	def irisRegens(self): return self.irises.regens
+	def lidRegens(self): return sum(pool.regens for pool in self.lids)
+	def skippedRegens(self):
+		return self.irises.skips + sum(pool.skips for pool in self.lids)
+
+	# Pose of all eyes, quantized to the same regen steps as geometry:
+	# gaze in steps moving the eye's surface about regenPixels, pupil and
+	# eyelid weights in their mesh caches' steps.  Equal keys draw the
+	# same image, near as can be seen.
+	def poseKey(self):
+		gaze = np.floor(self.gaze / self.gazeStep + 0.5).astype(int)
+		return (tuple(gaze.ravel()),
+		  tuple(self.irisMeshes.step(p) for p in self.pupil),
+		  tuple(cache.step(w) for cache, weights in
+		  zip(self.lidCaches, (self.upperLid, self.lowerLid))
+		  for w in weights))
+
+	# True if the pose hasn't changed in the last two update()s: the frame
+	# on screen and the one drawn since (pending in the back buffer) both
+	# show it already, so this frame's drawing and buffer swap can be
+	# skipped, and the next change still follows on from the right image.
+	def idle(self):
+		return self.still >= 2
+
+	# Bring iris and eyelid geometry up to date with current pupil and
+	# eyelid weights (set gaze first too; see idle()): regenerate (or
+	# find already loaded) meshes for each distinct quantized weight, or
+	# just set shader weights if morphing.
+	def update(self):
+		pose = self.poseKey()
+		self.still = self.still + 1 if pose == self.pose else 0
+		self.pose  = pose
+		lows = [] # Per eyelid, each eye's lower weight; see cover()
+		if self.morph:
+			if self.batches is not None:
+				self.irises.batch.setMorph(self.pupil)
+			else:
+				for i in range(self.count):
+					self.irisShapes[i].setMorph(self.pupil[i])
+			for j, weights in enumerate((self.upperLid, self.lowerLid)):
+				lo = np.minimum(self.lidPrev[j], weights)
+				hi = np.maximum(self.lidPrev[j], weights)
+				if self.batches is not None:
+					self.lids[j].batch.setMorph(lo, hi)
+				else:
+					for i, shape in enumerate(self.lidShapes[j]):
+						shape.setMorph(lo[i], hi[i])
+				self.lidPrev[j] = weights
+				lows.append(np.clip(lo, 0.0, 1.0))
+			self.cover(*lows)
+			return
+
+		irisKeys = [(self.irisMeshes.step(p),) for p in self.pupil]
+		self.irises.assign(self.irisShapes, irisKeys)
+
+		# Eyelid key is the span of steps since last frame, so rows
+		# in-between cover the lid's motion; it collapses to a single
+		# position (one more regen) once the lid stops.
+		for j, weights in enumerate((self.upperLid, self.lowerLid)):
+			cache = self.lidCaches[j]
+			steps = [cache.step(w) for w in weights]
+			prev  = self.lidStep[j]
+			keys  = [(min(a, b), max(a, b)) for a, b in zip(prev, steps)]
+			self.lids[j].assign(self.lidShapes[j], keys)
+			self.lidStep[j] = steps
+			lows.append([cache.weight(key[0]) for key in keys])
+		self.cover(*lows)
+
+	# Draw all eyes: iris and sclera rotated to gaze, then eyelids (eyes
+	# don't overlap, so each eye's eyelids can follow it directly).  If
+	# 'targets' (RenderTargets, see gfxutil.py) are passed, one per eye,
+	# each eye is drawn into its own instead of the display.  Batched, all
+	# eyes are drawn with one call per feature, in the same order (with
+	# targets, into each in turn; other eyes fall outside its viewport).
+	# Covered eyes' iris and sclera are left out, and clipped eyes'
+	# eyelid bands drawn into the depth buffer first (see update()).
+	def draw(self, targets=None):
+		if self.batches is not None:
+			irises, scleras = self.batches[:2]
+			lids            = self.batches[2:]
+			clip            = self.clipped.any()
+			for batch in (irises, scleras):
+				batch.setRotation(self.gaze)
+			for target in targets or (None,):
+				if target: target.begin()
+				if clip:
+					for batch in lids: batch.drawDepth(batch.edgeTris)
+				if not self.covered.all():
+					irises.draw()
+					scleras.draw()
+				for batch in lids:
+					if clip: batch.drawOver()
+					else:    batch.draw()
+				if target: target.end()
+			return
+		for i in range(self.count):
+			if targets: targets[i].begin()
+			lids = [shapes[i] for shapes in self.lidShapes]
+			clip = self.clipped[i]
+			if clip:
+				for shape in lids: shape.drawDepth(shape.edgeTris)
+			if not self.covered[i]:
+				rx, ry = self.gaze[i]
+				for shape in (self.irisShapes[i], self.scleraShapes[i]):
+					shape.rotateToX(rx)
+					shape.rotateToY(ry)
+					shape.draw()
+			for shape in lids:
+				if clip: shape.drawOver()
+				else:    shape.draw()
+			if targets: targets[i].end()
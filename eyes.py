@@ -6,14 +6,24 @@
 
 import Adafruit_ADS1x15
 import math
+import numpy as np
 import pi3d
 import random
-import thread
 import time
 import RPi.GPIO as GPIO
-from svg.path import Path, parse_path
-from xml.dom.minidom import parse
 from gfxutil import *
+from eyeasset import *
+from eyerig import *
+from framepace import *
+from pupil import *
+from adcinput import *
+from buttons import *
+from blink import *
+from inputtrace import *
+from profiler import *
+from metrics import *
+from texcache import *
+from panelout import *
 
 # INPUT CONFIG for eye motion ----------------------------------------------
 # ANALOG INPUTS REQUIRE SNAKE EYES BONNET
@@ -21,6 +31,8 @@ from gfxutil import *
 JOYSTICK_X_IN   = -1    # Analog input for eye horiz pos (-1 = auto)
 JOYSTICK_Y_IN   = -1    # Analog input for eye vert position (")
 PUPIL_IN        = -1    # Analog input for pupil control (-1 = auto)
+JOYSTICK_RATE   = 100   # Samples/sec for each joystick input
+PUPIL_RATE      = 20    # Samples/sec for PUPIL_IN
 JOYSTICK_X_FLIP = False # If True, reverse stick X axis
 JOYSTICK_Y_FLIP = False # If True, reverse stick Y axis
 PUPIL_IN_FLIP   = False # If True, reverse reading from PUPIL_IN
@@ -32,70 +44,68 @@ WINK_L_PIN      = 22    # GPIO pin for LEFT eye wink button
 BLINK_PIN       = 23    # GPIO pin for blink button (BOTH eyes)
 WINK_R_PIN      = 24    # GPIO pin for RIGHT eye wink button
 AUTOBLINK       = True  # If True, eyes blink autonomously
+BLINK_EASE      = False # If True, eyelids ease in/out of blinks
+TRACE_RECORD    = None  # File to record inputs to (see inputtrace.py)
+TRACE_REPLAY    = None  # File to replay recorded inputs from
+TRACE_REALTIME  = True  # If True, replay at recorded pace, else flat out
+
+
+# RENDER CONFIG ------------------------------------------------------------
+
+SHADER_MORPH    = False # If True, morph iris & eyelids in vertex shader
+BATCH_DRAW      = False # If True, draw both eyes in one call per feature
+IDLE_SKIP       = True  # If True, don't redraw frames where nothing moved
+FRAME_RATE      = -1    # Target frames/sec (0 = unpaced, -1 = fbx2)
+LATE_REPORT     = 0     # If > 0, print late frame count every N sec
+METRICS         = None  # Localhost TCP port or Unix socket path for
+                        # live metrics (see metrics.py), None = off
+PROFILE         = False # If True, time frame stages (see profiler.py)
+PROFILE_SLOW    = 50    # If PROFILE, log frames slower than this (ms)
+PANEL_OUTPUT    = None  # Output to screens in-process (see panelout.py):
+                        # "spi", "shm" or file path; None = fbx2 copies
+PANEL_SCREEN    = "oled" # Screen type for "spi", "oled" or "tft"
+PANEL_SIZE      = 128   # Screen resolution (pixels, square)
+RENDER_SCALE    = 0     # With PANEL_OUTPUT, if > 0, render each eye
+                        # offscreen at this multiple of PANEL_SIZE
 
 
 # GPIO initialization ------------------------------------------------------
 
+# Buttons are debounced and timestamped by edge callbacks (see buttons.py);
+# frame() takes one snapshot of them per frame rather than polling pins.
 GPIO.setmode(GPIO.BCM)
-if WINK_L_PIN >= 0: GPIO.setup(WINK_L_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-if BLINK_PIN  >= 0: GPIO.setup(BLINK_PIN , GPIO.IN, pull_up_down=GPIO.PUD_UP)
-if WINK_R_PIN >= 0: GPIO.setup(WINK_R_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+buttons = Buttons(GPIO, (WINK_L_PIN, BLINK_PIN, WINK_R_PIN))
 
 
 # ADC stuff ----------------------------------------------------------------
 
-if JOYSTICK_X_IN >= 0 or JOYSTICK_Y_IN >= 0 or PUPIL_IN >= 0:
-	adc      = Adafruit_ADS1x15.ADS1015()
-	adcValue = [0] * 4
+# Only the configured analog inputs are sampled, each at its own rate, in
+# a separate thread (see adcinput.py).  The frame loop reads each input's
+# value at the frame's time, interpolated from timestamped samples.
+# Replaying a trace (see below), recorded values stand in for the ADC.
+adcRates = {}
+if JOYSTICK_X_IN >= 0: adcRates[JOYSTICK_X_IN] = JOYSTICK_RATE
+if JOYSTICK_Y_IN >= 0: adcRates[JOYSTICK_Y_IN] = JOYSTICK_RATE
+if PUPIL_IN      >= 0: adcRates[PUPIL_IN     ] = PUPIL_RATE
+if adcRates and not TRACE_REPLAY:
+	adc = ADCSampler(Adafruit_ADS1x15.ADS1015(), adcRates)
+	adc.start()
 else:
 	adc = None
 
-# Because ADC reads are blocking operations, they normally would slow down
-# the animation loop noticably, especially when reading multiple channels
-# (even when using high data rate settings).  To avoid this, ADC channels
-# are read in a separate thread and stored in the global list adcValue[],
-# which the animation loop can read at its leisure (with immediate results,
-# no slowdown).  Since there's a finite limit to the animation frame rate,
-# we intentionally use a slower data rate (rather than sleep()) to lessen
-# the impact of this thread.  data_rate of 250 w/4 ADC channels provides
-# at most 75 Hz update from the ADC, which is plenty for this task.
-def adcThread(adc, dest):
-	while True:
-		for i in range(len(dest)):
-			# ADC input range is +- 4.096V
-			# ADC output is -2048 to +2047
-			# Analog inputs will be 0 to ~3.3V,
-			# thus 0 to 1649-ish.  Read & clip:
-			n = adc.read_adc(i, gain=1, data_rate=250)
-			if   n <    0: n =    0
-			elif n > 1649: n = 1649
-			dest[i] = n / 1649.0 # Store as 0.0 to 1.0
-
-# Start ADC sampling thread if needed:
-if adc:
-	thread.start_new_thread(adcThread, (adc, adcValue))
-
-
-# Load SVG file, extract paths & convert to point lists --------------------
-
-dom               = parse("graphics/eye.svg")
-vb                = getViewBox(dom)
-pupilMinPts       = getPoints(dom, "pupilMin"      , 32, True , True )
-pupilMaxPts       = getPoints(dom, "pupilMax"      , 32, True , True )
-irisPts           = getPoints(dom, "iris"          , 32, True , True )
-scleraFrontPts    = getPoints(dom, "scleraFront"   ,  0, False, False)
-scleraBackPts     = getPoints(dom, "scleraBack"    ,  0, False, False)
-upperLidClosedPts = getPoints(dom, "upperLidClosed", 33, False, True )
-upperLidOpenPts   = getPoints(dom, "upperLidOpen"  , 33, False, True )
-upperLidEdgePts   = getPoints(dom, "upperLidEdge"  , 33, False, False)
-lowerLidClosedPts = getPoints(dom, "lowerLidClosed", 33, False, False)
-lowerLidOpenPts   = getPoints(dom, "lowerLidOpen"  , 33, False, False)
-lowerLidEdgePts   = getPoints(dom, "lowerLidEdge"  , 33, False, False)
+
+# Load eye design: SVG paths, precompiled to a bundle (see eyeasset.py) ---
+
+eyeAssets = loadEye("graphics/eye.svg",
+  ("graphics/iris.jpg", "graphics/sclera.png", "graphics/lid.png"))
 
 
 # Set up display and initialize pi3d ---------------------------------------
 
-DISPLAY = pi3d.Display.create(samples=4)
+# Eyes rendered offscreen (RENDER_SCALE) are antialiased by the output
+# stage's downscale instead; the display itself goes unused.
+OFFSCREEN = bool(PANEL_OUTPUT) and RENDER_SCALE > 0
+DISPLAY   = pi3d.Display.create(samples=0 if OFFSCREEN else 4)
 DISPLAY.set_background(0, 0, 0, 1) # r,g,b,alpha
 
 # eyeRadius is the size, in pixels, at which the whole eye will be rendered
@@ -121,206 +131,171 @@ light  = pi3d.Light(lightpos=(0, -500, -500), lightamb=(0.2, 0.2, 0.2))
 
 # Load texture maps --------------------------------------------------------
 
-irisMap   = pi3d.Texture("graphics/iris.jpg"  , mipmap=False,
-              filter=pi3d.GL_LINEAR)
-scleraMap = pi3d.Texture("graphics/sclera.png", mipmap=False,
-              filter=pi3d.GL_LINEAR, blend=True)
-lidMap    = pi3d.Texture("graphics/lid.png"   , mipmap=False,
-              filter=pi3d.GL_LINEAR, blend=True)
+# Maps are loaded (see texcache.py) at the size the eyes are drawn (eyeRadius
+# pixels, or the offscreen render size), no larger than each map spans.
+texRadius = PANEL_SIZE * RENDER_SCALE * 0.5 if OFFSCREEN else eyeRadius
+mapSize   = mapSizes(eyeAssets, texRadius)
+irisMap   = loadTexture("graphics/iris.jpg"  , mapSize["iris"]  ,
+              mipmap=False, filter=pi3d.GL_LINEAR)
+scleraMap = loadTexture("graphics/sclera.png", mapSize["sclera"],
+              mipmap=False, filter=pi3d.GL_LINEAR, blend=True)
+lidMap    = loadTexture("graphics/lid.png"   , mapSize["lid"]   ,
+              mipmap=False, filter=pi3d.GL_LINEAR, blend=True)
 # U/V map may be useful for debugging texture placement; not normally used
 #uvMap     = pi3d.Texture("graphics/uv.png"    , mipmap=False,
 #              filter=pi3d.GL_LINEAR, blend=False, m_repeat=True)
 
 
-# Initialize static geometry -----------------------------------------------
-
-# Transform point lists to eye dimensions
-scalePoints(pupilMinPts      , vb, eyeRadius)
-scalePoints(pupilMaxPts      , vb, eyeRadius)
-scalePoints(irisPts          , vb, eyeRadius)
-scalePoints(scleraFrontPts   , vb, eyeRadius)
-scalePoints(scleraBackPts    , vb, eyeRadius)
-scalePoints(upperLidClosedPts, vb, eyeRadius)
-scalePoints(upperLidOpenPts  , vb, eyeRadius)
-scalePoints(upperLidEdgePts  , vb, eyeRadius)
-scalePoints(lowerLidClosedPts, vb, eyeRadius)
-scalePoints(lowerLidOpenPts  , vb, eyeRadius)
-scalePoints(lowerLidEdgePts  , vb, eyeRadius)
-
-# Regenerating flexible object geometry (such as eyelids during blinks, or
-# iris during pupil dilation) is CPU intensive, can noticably slow things
-# down, especially on single-core boards.  To reduce this load somewhat,
-# determine a size change threshold below which regeneration will not occur;
-# roughly equal to 1/4 pixel, since 4x4 area sampling is used.
-
-# Determine change in pupil size to trigger iris geometry regen
-irisRegenThreshold = 0.0
-a = pointsBounds(pupilMinPts) # Bounds of pupil at min size (in pixels)
-b = pointsBounds(pupilMaxPts) # " at max size
-maxDist = max(abs(a[0] - b[0]), abs(a[1] - b[1]), # Determine distance of max
-              abs(a[2] - b[2]), abs(a[3] - b[3])) # variance around each edge
-# maxDist is motion range in pixels as pupil scales between 0.0 and 1.0.
-# 1.0 / maxDist is one pixel's worth of scale range.  Need 1/4 that...
-if maxDist > 0: irisRegenThreshold = 0.25 / maxDist
-
-# Determine change in eyelid values needed to trigger geometry regen.
-# This is done a little differently than the pupils...instead of bounds,
-# the distance between the middle points of the open and closed eyelid
-# paths is evaluated, then similar 1/4 pixel threshold is determined.
-upperLidRegenThreshold = 0.0
-lowerLidRegenThreshold = 0.0
-p1 = upperLidOpenPts[len(upperLidOpenPts) / 2]
-p2 = upperLidClosedPts[len(upperLidClosedPts) / 2]
-dx = p2[0] - p1[0]
-dy = p2[1] - p1[1]
-d  = dx * dx + dy * dy
-if d > 0: upperLidRegenThreshold = 0.25 / math.sqrt(d)
-p1 = lowerLidOpenPts[len(lowerLidOpenPts) / 2]
-p2 = lowerLidClosedPts[len(lowerLidClosedPts) / 2]
-dx = p2[0] - p1[0]
-dy = p2[1] - p1[1]
-d  = dx * dx + dy * dy
-if d > 0: lowerLidRegenThreshold = 0.25 / math.sqrt(d)
-
-# Generate initial iris meshes; vertex elements will get replaced on
-# a per-frame basis in the main loop, this just sets up textures, etc.
-rightIris = meshInit(32, 4, True, 0, 0.5/irisMap.iy, False)
-rightIris.set_textures([irisMap])
-rightIris.set_shader(shader)
-# Left iris map U value is offset by 0.5; effectively a 180 degree
-# rotation, so it's less obvious that the same texture is in use on both.
-leftIris = meshInit(32, 4, True, 0.5, 0.5/irisMap.iy, False)
-leftIris.set_textures([irisMap])
-leftIris.set_shader(shader)
-irisZ = zangle(irisPts, eyeRadius)[0] * 0.99 # Get iris Z depth, for later
-
-# Eyelid meshes are likewise temporary; texture coordinates are
-# assigned here but geometry is dynamically regenerated in main loop.
-leftUpperEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-leftUpperEyelid.set_textures([lidMap])
-leftUpperEyelid.set_shader(shader)
-leftLowerEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-leftLowerEyelid.set_textures([lidMap])
-leftLowerEyelid.set_shader(shader)
-
-rightUpperEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-rightUpperEyelid.set_textures([lidMap])
-rightUpperEyelid.set_shader(shader)
-rightLowerEyelid = meshInit(33, 5, False, 0, 0.5/lidMap.iy, True)
-rightLowerEyelid.set_textures([lidMap])
-rightLowerEyelid.set_shader(shader)
-
-# Generate scleras for each eye...start with a 2D shape for lathing...
-angle1 = zangle(scleraFrontPts, eyeRadius)[1] # Sclera front angle
-angle2 = zangle(scleraBackPts , eyeRadius)[1] # " back angle
-aRange = 180 - angle1 - angle2
-pts    = []
-for i in range(24):
-	ca, sa = pi3d.Utility.from_polar((90 - angle1) - aRange * i / 23)
-	pts.append((ca * eyeRadius, sa * eyeRadius))
-
-# Scleras are generated independently (object isn't re-used) so each
-# may have a different image map (heterochromia, corneal scar, or the
-# same image map can be offset on one so the repetition isn't obvious).
-leftEye = pi3d.Lathe(path=pts, sides=64)
-leftEye.set_textures([scleraMap])
-leftEye.set_shader(shader)
-reAxis(leftEye, 0)
-rightEye = pi3d.Lathe(path=pts, sides=64)
-rightEye.set_textures([scleraMap])
-rightEye.set_shader(shader)
-reAxis(rightEye, 0.5) # Image map offset = 180 degree rotation
+# Initialize eyes ----------------------------------------------------------
+
+# Eye 0 is the left eye (on screen right), eye 1 the right eye (on screen
+# left), each eyePosition pixels from center; the right eye's eyelids are
+# mirrored.  Map U offsets of 0.5 are effectively a 180 degree rotation,
+# so it's less obvious that the same texture is in use on both.  Iris and
+# eyelid geometry is only regenerated for changes of >= 1/4 pixel, since
+# 4x4 area sampling is used; with SHADER_MORPH it's instead moved by the
+# 'morph' vertex shader (shaders/morph.vs, checked by morphcheck.py).
+# Likewise, curves are tessellated finely enough to be within 1/4 pixel
+# (of the offscreen render size, with RENDER_SCALE).  With BATCH_DRAW,
+# both irises, scleras, etc. are drawn together by the 'batch' shader
+# (shaders/batch.vs), one draw call each rather than one per eye.
+if SHADER_MORPH: morphShader = pi3d.Shader("shaders/morph")
+else:            morphShader = None
+if BATCH_DRAW:   batchShader = pi3d.Shader("shaders/batch")
+else:            batchShader = None
+rig = EyeRig(eyeAssets, eyeRadius, shader, irisMap, scleraMap, lidMap,
+  positions     = [(eyePosition, 0), (-eyePosition, 0)],
+  mirror        = [False, True],
+  irisOffsets   = [0.5, 0.0],
+  scleraOffsets = [0.0, 0.5],
+  regenPixels   = 0.25,
+  morphShader   = morphShader,
+  detailPixels  = 0.25 * eyeRadius / texRadius,
+  batchShader   = batchShader)
+LEFT, RIGHT = 0, 1
+WINK_PINS   = (WINK_L_PIN, WINK_R_PIN) # Per eye
+
+# With PANEL_OUTPUT, each frame's eye squares are read back, scaled and
+# sent to the screens from here, rather than by fbx2.  With RENDER_SCALE
+# too, each eye is drawn into its own offscreen target, just the size of
+# its square on the screen (at that multiple), and read back from there.
+if OFFSCREEN:
+	targets = [RenderTarget(PANEL_SIZE * RENDER_SCALE, DISPLAY,
+	  DISPLAY.width  * 0.5 + x - eyeRadius,
+	  DISPLAY.height * 0.5 + y - eyeRadius, eyeRadius * 2)
+	  for x, y in rig.position]
+else:
+	targets = None
+output = makeOutput(PANEL_OUTPUT, DISPLAY.width, DISPLAY.height, rig.count,
+  PANEL_SIZE, PANEL_SCREEN, GPIO,
+  targets and [targets[RIGHT], targets[LEFT]]) # Screen left to right
 
 
 # Init global stuff --------------------------------------------------------
 
 mykeys = pi3d.Keyboard() # For capturing key presses
 
-startX       = random.uniform(-30.0, 30.0)
-n            = math.sqrt(900.0 - startX * startX)
-startY       = random.uniform(-n, n)
-destX        = startX
-destY        = startY
-curX         = startX
-curY         = startY
-moveDuration = random.uniform(0.075, 0.175)
-holdDuration = random.uniform(0.1, 1.1)
+# Frames are paced to FRAME_RATE (see framepace.py); any rendered faster
+# than fbx2 copies them to the screens would just be discarded.
+pacer = FramePacer(copierFPS() if FRAME_RATE < 0 else FRAME_RATE,
+  report=LATE_REPORT)
+
+# Inputs (clock, random numbers, ADC values and button states) can be
+# recorded to a trace file, or replayed from one for a repeatable run.
+traceConfig = { "JOYSTICK_X_IN": JOYSTICK_X_IN,
+                "JOYSTICK_Y_IN": JOYSTICK_Y_IN, "PUPIL_IN": PUPIL_IN }
+if TRACE_REPLAY:
+	time, random, adc, buttons = replayInputs(TRACE_REPLAY, traceConfig,
+	  TRACE_REALTIME)
+	pacer = FramePacer(0) # Replayed clock sets the pace
+elif TRACE_RECORD:
+	# Header also names the renderer, for headless.py --replay; inputs
+	# are live, so there's no seed or scripted workload.
+	time, random, adc, buttons = recordInputs(TRACE_RECORD,
+	  dict(traceConfig, renderer="eyes", seed=None, workload=None),
+	  time, random, adc, buttons)
+
+# Frame stage timing and counters (see profiler.py); with PROFILE off
+# the marks in frame() do nothing.
+profiler = makeProfiler(PROFILE, PROFILE_SLOW / 1000.0)
+profiler.gauge("iris regens"   , rig.irisRegens)
+profiler.gauge("eyelid regens" , rig.lidRegens)
+profiler.gauge("skipped regens", rig.skippedRegens)
+profiler.gauge("late frames"   , lambda: pacer.late)
+profiler.gauge("output dropped", lambda: output.dropped)
+profiler.gauge("idle frames"   , lambda: idleFrames)
+
+# Live metrics (see metrics.py): frame stats are recorded each frame and
+# served, with the counters below, from the metrics server's own thread.
+if METRICS:
+	frameStats = FrameStats()
+	metrics    = MetricsServer(METRICS, frameStats)
+	metrics.gauge("iris_regens_total"   , rig.irisRegens)
+	metrics.gauge("eyelid_regens_total" , rig.lidRegens)
+	metrics.gauge("skipped_regens_total", rig.skippedRegens)
+	metrics.gauge("late_frames_total"   , lambda: pacer.late)
+	metrics.gauge("output_dropped_total", lambda: output.dropped)
+	metrics.gauge("idle_frames_total"   , lambda: idleFrames)
+	metrics.gauge("idle_ratio"          ,
+	  lambda: float(idleFrames) / frames if frames else None)
+	for i in range(rig.count):
+		metrics.gauge('blinks_total{eye="%d"}' % i,
+		  lambda i=i: eyeBlinks.blinks[i])
+	for c in adcRates:
+		metrics.gauge('adc_sample_age_seconds{channel="%d"}' % c,
+		  lambda c=c: adc.age(c))
+	metrics.start()
+else:
+	frameStats = NullFrameStats()
+
+# Starting gaze and timing, drawn when mainLoop() starts rather than at
+# import, so a trace's inputs (see inputtrace.py) start with the main
+# loop's whether recorded with TRACE_RECORD or by headless.py.
+def startState():
+	global startX, startY, destX, destY, curX, curY
+	global moveDuration, holdDuration, beginningTime
+	startX        = random.uniform(-30.0, 30.0)
+	n             = math.sqrt(900.0 - startX * startX)
+	startY        = random.uniform(-n, n)
+	destX         = startX
+	destY         = startY
+	curX          = startX
+	curY          = startY
+	moveDuration  = random.uniform(0.075, 0.175)
+	holdDuration  = random.uniform(0.1, 1.1)
+	beginningTime = time.time()
+
 startTime    = 0.0
 isMoving     = False
 
 frames        = 0
-beginningTime = time.time()
-
-rightEye.positionX(-eyePosition)
-rightIris.positionX(-eyePosition)
-rightUpperEyelid.positionX(-eyePosition)
-rightUpperEyelid.positionZ(-eyeRadius - 42)
-rightLowerEyelid.positionX(-eyePosition)
-rightLowerEyelid.positionZ(-eyeRadius - 42)
-
-leftEye.positionX(eyePosition)
-leftIris.positionX(eyePosition)
-leftUpperEyelid.positionX(eyePosition)
-leftUpperEyelid.positionZ(-eyeRadius - 42)
-leftLowerEyelid.positionX(eyePosition)
-leftLowerEyelid.positionZ(-eyeRadius - 42)
-
-currentPupilScale       =  0.5
-prevPupilScale          = -1.0 # Force regen on first frame
-prevLeftUpperLidWeight  = 0.5
-prevLeftLowerLidWeight  = 0.5
-prevRightUpperLidWeight = 0.5
-prevRightLowerLidWeight = 0.5
-prevLeftUpperLidPts  = pointsInterp(upperLidOpenPts, upperLidClosedPts, 0.5)
-prevLeftLowerLidPts  = pointsInterp(lowerLidOpenPts, lowerLidClosedPts, 0.5)
-prevRightUpperLidPts = pointsInterp(upperLidOpenPts, upperLidClosedPts, 0.5)
-prevRightLowerLidPts = pointsInterp(lowerLidOpenPts, lowerLidClosedPts, 0.5)
-
-luRegen = True
-llRegen = True
-ruRegen = True
-rlRegen = True
+idleFrames    = 0 # Frames not drawn, nothing having changed
+
+currentPupilScale = 0.5
 
 timeOfLastBlink = 0.0
 timeToNextBlink = 1.0
-# These are per-eye (left, right) to allow winking:
-blinkStateLeft      = 0 # NOBLINK
-blinkStateRight     = 0
-blinkDurationLeft   = 0.1
-blinkDurationRight  = 0.1
-blinkStartTimeLeft  = 0
-blinkStartTimeRight = 0
+# Blinks are per-eye (LEFT, RIGHT) to allow winking; see blink.py
+eyeBlinks = BlinkTable(rig.count, 0.3, easeBlink if BLINK_EASE else
+  linearBlink)
 
-trackingPos = 0.3
 
 # Generate one frame of imagery
 def frame(p):
 
 	global startX, startY, destX, destY, curX, curY
 	global moveDuration, holdDuration, startTime, isMoving
-	global frames
-	global leftIris, rightIris
-	global pupilMinPts, pupilMaxPts, irisPts, irisZ
-	global leftEye, rightEye
-	global leftUpperEyelid, leftLowerEyelid, rightUpperEyelid, rightLowerEyelid
-	global upperLidOpenPts, upperLidClosedPts, lowerLidOpenPts, lowerLidClosedPts
-	global upperLidEdgePts, lowerLidEdgePts
-	global prevLeftUpperLidPts, prevLeftLowerLidPts, prevRightUpperLidPts, prevRightLowerLidPts
-	global leftUpperEyelid, leftLowerEyelid, rightUpperEyelid, rightLowerEyelid
-	global prevLeftUpperLidWeight, prevLeftLowerLidWeight, prevRightUpperLidWeight, prevRightLowerLidWeight
-	global prevPupilScale
-	global irisRegenThreshold, upperLidRegenThreshold, lowerLidRegenThreshold
-	global luRegen, llRegen, ruRegen, rlRegen
+	global frames, idleFrames
 	global timeOfLastBlink, timeToNextBlink
-	global blinkStateLeft, blinkStateRight
-	global blinkDurationLeft, blinkDurationRight
-	global blinkStartTimeLeft, blinkStartTimeRight
-	global trackingPos
 
-	DISPLAY.loop_running()
+	pacer.wait() # Sleep until this frame is due
+	profiler.begin()
+	frameStats.begin()
 
-	now = time.time()
-	dt  = now - startTime
+	now     = time.time()
+	dt      = now - startTime
+	pressed = buttons.snapshot() # Button states for this frame
+	profiler.mark("input")
 
 	frames += 1
 #	if(now > beginningTime):
@@ -328,8 +303,8 @@ def frame(p):
 
 	if JOYSTICK_X_IN >= 0 and JOYSTICK_Y_IN >= 0:
 		# Eye position from analog inputs
-		curX = adcValue[JOYSTICK_X_IN]
-		curY = adcValue[JOYSTICK_Y_IN]
+		curX = adc.value(JOYSTICK_X_IN, now)
+		curY = adc.value(JOYSTICK_Y_IN, now)
 		if JOYSTICK_X_FLIP: curX = 1.0 - curX
 		if JOYSTICK_Y_FLIP: curY = 1.0 - curY
 		curX = -30.0 + curX * 60.0
@@ -359,263 +334,106 @@ def frame(p):
 				moveDuration = random.uniform(0.075, 0.175)
 				startTime    = now
 				isMoving     = True
+	profiler.mark("motion")
 
 
-	# Regenerate iris geometry only if size changed by >= 1/4 pixel
-	if abs(p - prevPupilScale) >= irisRegenThreshold:
-		# Interpolate points between min and max pupil sizes
-		interPupil = pointsInterp(pupilMinPts, pupilMaxPts, p)
-		# Generate mesh between interpolated pupil and iris bounds
-		mesh = pointsMesh(None, interPupil, irisPts, 4, -irisZ, True)
-		# Assign to both eyes
-		leftIris.re_init(pts=mesh)
-		rightIris.re_init(pts=mesh)
-		prevPupilScale = p
+	# Same pupil scale for all eyes; geometry is regenerated (if needed)
+	# once lid weights are also known, below.
+	rig.pupil[:] = p
 
 	# Eyelid WIP
 
 	if AUTOBLINK and (now - timeOfLastBlink) >= timeToNextBlink:
 		timeOfLastBlink = now
 		duration        = random.uniform(0.035, 0.06)
-		if blinkStateLeft != 1:
-			blinkStateLeft     = 1 # ENBLINK
-			blinkStartTimeLeft = now
-			blinkDurationLeft  = duration
-		if blinkStateRight != 1:
-			blinkStateRight     = 1 # ENBLINK
-			blinkStartTimeRight = now
-			blinkDurationRight  = duration
+		eyeBlinks.start(eyeBlinks.state != ENBLINK, now, duration)
 		timeToNextBlink = duration * 3 + random.uniform(0.0, 4.0)
 
-	if blinkStateLeft: # Left eye currently winking/blinking?
-		# Check if blink time has elapsed...
-		if (now - blinkStartTimeLeft) >= blinkDurationLeft:
-			# Yes...increment blink state, unless...
-			if (blinkStateLeft == 1 and # Enblinking and...
-			    ((BLINK_PIN >= 0 and    # blink pin held, or...
-			      GPIO.input(BLINK_PIN) == GPIO.LOW) or
-			    (WINK_L_PIN >= 0 and    # wink pin held
-			      GPIO.input(WINK_L_PIN) == GPIO.LOW))):
-				# Don't advance yet; eye is held closed
-				pass
-			else:
-				blinkStateLeft += 1
-				if blinkStateLeft > 2:
-					blinkStateLeft = 0 # NOBLINK
-				else:
-					blinkDurationLeft *= 2.0
-					blinkStartTimeLeft = now
-	else:
-		if WINK_L_PIN >= 0 and GPIO.input(WINK_L_PIN) == GPIO.LOW:
-			blinkStateLeft     = 1 # ENBLINK
-			blinkStartTimeLeft = now
-			blinkDurationLeft  = random.uniform(0.035, 0.06)
-
-	if blinkStateRight: # Right eye currently winking/blinking?
-		# Check if blink time has elapsed...
-		if (now - blinkStartTimeRight) >= blinkDurationRight:
-			# Yes...increment blink state, unless...
-			if (blinkStateRight == 1 and # Enblinking and...
-			    ((BLINK_PIN >= 0 and    # blink pin held, or...
-			      GPIO.input(BLINK_PIN) == GPIO.LOW) or
-			    (WINK_R_PIN >= 0 and    # wink pin held
-			      GPIO.input(WINK_R_PIN) == GPIO.LOW))):
-				# Don't advance yet; eye is held closed
-				pass
-			else:
-				blinkStateRight += 1
-				if blinkStateRight > 2:
-					blinkStateRight = 0 # NOBLINK
-				else:
-					blinkDurationRight *= 2.0
-					blinkStartTimeRight = now
-	else:
-		if WINK_R_PIN >= 0 and GPIO.input(WINK_R_PIN) == GPIO.LOW:
-			blinkStateRight     = 1 # ENBLINK
-			blinkStartTimeRight = now
-			blinkDurationRight  = random.uniform(0.035, 0.06)
-
-	if BLINK_PIN >= 0 and GPIO.input(BLINK_PIN) == GPIO.LOW:
-		duration = random.uniform(0.035, 0.06)
-		if blinkStateLeft == 0:
-			blinkStateLeft     = 1
-			blinkStartTimeLeft = now
-			blinkDurationLeft  = duration
-		if blinkStateRight == 0:
-			blinkStateRight     = 1
-			blinkStartTimeRight = now
-			blinkDurationRight  = duration
+	# Eyes are held shut while the blink button or their wink button is
+	# held.  A wink starts an eye not already blinking; the blink button
+	# starts any eye not blinking, including those just finished.  Either
+	# starts on a tap pressed and released since the last frame, too.
+	blinkHeld = pressed.held(BLINK_PIN)
+	winkHeld  = np.array([pressed.held(pin) for pin in WINK_PINS])
+	winks     = (np.array([pressed.tapped(pin) for pin in WINK_PINS]) &
+	  (eyeBlinks.state == NOBLINK))
+	eyeBlinks.advance(now, winkHeld | blinkHeld)
+	if winks.any():
+		eyeBlinks.start(winks,
+		  [pressed.pressedAt(pin, now) for pin in WINK_PINS],
+		  [random.uniform(0.035, 0.06) if w else 0.0 for w in winks])
+	if pressed.tapped(BLINK_PIN):
+		eyeBlinks.start(eyeBlinks.state == NOBLINK,
+		  pressed.pressedAt(BLINK_PIN, now), random.uniform(0.035, 0.06))
 
 	if TRACKING:
 		n = 0.4 - curY / 60.0
 		if   n < 0.0: n = 0.0
 		elif n > 1.0: n = 1.0
-		trackingPos = (trackingPos * 3.0 + n) * 0.25
-
-	if blinkStateLeft:
-		n = (now - blinkStartTimeLeft) / blinkDurationLeft
-		if n > 1.0: n = 1.0
-		if blinkStateLeft == 2: n = 1.0 - n
-	else:
-		n = 0.0
-	newLeftUpperLidWeight = trackingPos + (n * (1.0 - trackingPos))
-	newLeftLowerLidWeight = (1.0 - trackingPos) + (n * trackingPos)
-
-	if blinkStateRight:
-		n = (now - blinkStartTimeRight) / blinkDurationRight
-		if n > 1.0: n = 1.0
-		if blinkStateRight == 2: n = 1.0 - n
-	else:
-		n = 0.0
-	newRightUpperLidWeight = trackingPos + (n * (1.0 - trackingPos))
-	newRightLowerLidWeight = (1.0 - trackingPos) + (n * trackingPos)
-
-	if (luRegen or (abs(newLeftUpperLidWeight - prevLeftUpperLidWeight) >=
-	  upperLidRegenThreshold)):
-		newLeftUpperLidPts = pointsInterp(upperLidOpenPts,
-		  upperLidClosedPts, newLeftUpperLidWeight)
-		if newLeftUpperLidWeight > prevLeftUpperLidWeight:
-			leftUpperEyelid.re_init(pts=pointsMesh(
-			  upperLidEdgePts, prevLeftUpperLidPts,
-			  newLeftUpperLidPts, 5, 0, False))
-		else:
-			leftUpperEyelid.re_init(pts=pointsMesh(
-			  upperLidEdgePts, newLeftUpperLidPts,
-			  prevLeftUpperLidPts, 5, 0, False))
-		prevLeftUpperLidPts    = newLeftUpperLidPts
-		prevLeftUpperLidWeight = newLeftUpperLidWeight
-		luRegen = True
-	else:
-		luRegen = False
-
-	if (llRegen or (abs(newLeftLowerLidWeight - prevLeftLowerLidWeight) >=
-	  lowerLidRegenThreshold)):
-		newLeftLowerLidPts = pointsInterp(lowerLidOpenPts,
-		  lowerLidClosedPts, newLeftLowerLidWeight)
-		if newLeftLowerLidWeight > prevLeftLowerLidWeight:
-			leftLowerEyelid.re_init(pts=pointsMesh(
-			  lowerLidEdgePts, prevLeftLowerLidPts,
-			  newLeftLowerLidPts, 5, 0, False))
-		else:
-			leftLowerEyelid.re_init(pts=pointsMesh(
-			  lowerLidEdgePts, newLeftLowerLidPts,
-			  prevLeftLowerLidPts, 5, 0, False))
-		prevLeftLowerLidWeight = newLeftLowerLidWeight
-		prevLeftLowerLidPts    = newLeftLowerLidPts
-		llRegen = True
-	else:
-		llRegen = False
-
-	if (ruRegen or (abs(newRightUpperLidWeight - prevRightUpperLidWeight) >=
-	  upperLidRegenThreshold)):
-		newRightUpperLidPts = pointsInterp(upperLidOpenPts,
-		  upperLidClosedPts, newRightUpperLidWeight)
-		if newRightUpperLidWeight > prevRightUpperLidWeight:
-			rightUpperEyelid.re_init(pts=pointsMesh(
-			  upperLidEdgePts, prevRightUpperLidPts,
-			  newRightUpperLidPts, 5, 0, False, True))
-		else:
-			rightUpperEyelid.re_init(pts=pointsMesh(
-			  upperLidEdgePts, newRightUpperLidPts,
-			  prevRightUpperLidPts, 5, 0, False, True))
-		prevRightUpperLidWeight = newRightUpperLidWeight
-		prevRightUpperLidPts    = newRightUpperLidPts
-		ruRegen = True
-	else:
-		ruRegen = False
-
-	if (rlRegen or (abs(newRightLowerLidWeight - prevRightLowerLidWeight) >=
-	  lowerLidRegenThreshold)):
-		newRightLowerLidPts = pointsInterp(lowerLidOpenPts,
-		  lowerLidClosedPts, newRightLowerLidWeight)
-		if newRightLowerLidWeight > prevRightLowerLidWeight:
-			rightLowerEyelid.re_init(pts=pointsMesh(
-			  lowerLidEdgePts, prevRightLowerLidPts,
-			  newRightLowerLidPts, 5, 0, False, True))
-		else:
-			rightLowerEyelid.re_init(pts=pointsMesh(
-			  lowerLidEdgePts, newRightLowerLidPts,
-			  prevRightLowerLidPts, 5, 0, False, True))
-		prevRightLowerLidWeight = newRightLowerLidWeight
-		prevRightLowerLidPts    = newRightLowerLidPts
-		rlRegen = True
-	else:
-		rlRegen = False
-
-	convergence = 2.0
-
-	# Right eye (on screen left)
-
-	rightIris.rotateToX(curY)
-	rightIris.rotateToY(curX - convergence)
-	rightIris.draw()
-	rightEye.rotateToX(curY)
-	rightEye.rotateToY(curX - convergence)
-	rightEye.draw()
+		eyeBlinks.track(n)
 
-	# Left eye (on screen right)
+	rig.upperLid[:], rig.lowerLid[:] = eyeBlinks.lids(now)
 
-	leftIris.rotateToX(curY)
-	leftIris.rotateToY(curX + convergence)
-	leftIris.draw()
-	leftEye.rotateToX(curY)
-	leftEye.rotateToY(curX + convergence)
-	leftEye.draw()
+	profiler.mark("blink")
 
-	leftUpperEyelid.draw()
-	leftLowerEyelid.draw()
-	rightUpperEyelid.draw()
-	rightLowerEyelid.draw()
+	convergence = 2.0
+	rig.gaze[LEFT ] = (curY, curX + convergence)
+	rig.gaze[RIGHT] = (curY, curX - convergence)
+	rig.update()
+	profiler.mark("regen")
+
+	# If nothing visibly moved (see EyeRig.idle()), the screen is already
+	# up to date; skip drawing, buffer swap and output.
+	if IDLE_SKIP and rig.idle():
+		idleFrames += 1
+	else:
+		DISPLAY.loop_running()
+		profiler.mark("display")
+		rig.draw(targets)
+		profiler.mark("draw")
+		output.capture()
+		profiler.mark("output")
 
 	k = mykeys.read()
+	profiler.mark("keys")
+	profiler.end()
+	frameStats.end()
 	if k==27:
 		mykeys.close()
 		DISPLAY.stop()
 		exit(0)
 
 
-def split( # Recursive simulated pupil response when no analog sensor
-  startValue, # Pupil scale starting value (0.0 to 1.0)
-  endValue,   # Pupil scale ending value (")
-  duration,   # Start-to-end time, floating-point seconds
-  range):     # +/- random pupil scale at midpoint
-	startTime = time.time()
-	if range >= 0.125: # Limit subdvision count, because recursion
-		duration *= 0.5 # Split time & range in half for subdivision,
-		range    *= 0.5 # then pick random center point within range:
-		midValue  = ((startValue + endValue - range) * 0.5 +
-		             random.uniform(0.0, range))
-		split(startValue, midValue, duration, range)
-		split(midValue  , endValue, duration, range)
-	else: # No more subdivisons, do iris motion...
-		dv = endValue - startValue
-		while True:
-			dt = time.time() - startTime
-			if dt >= duration: break
-			v = startValue + dv * dt / duration
+# MAIN LOOP -- runs continuously -------------------------------------------
+
+def mainLoop():
+	global currentPupilScale
+	startState()
+	# Fractal auto pupil scale (see pupil.py), when no sensor
+	autoPupil = pupilTrajectory(time.time, currentPupilScale, rng=random)
+	while True:
+		if PUPIL_IN >= 0: # Pupil scale from sensor
+			v = adc.value(PUPIL_IN, time.time())
+			if PUPIL_IN_FLIP: v = 1.0 - v
+			# If you need to calibrate PUPIL_MIN and MAX,
+			# add a 'print v' here for testing.
 			if   v < PUPIL_MIN: v = PUPIL_MIN
 			elif v > PUPIL_MAX: v = PUPIL_MAX
-			frame(v) # Draw frame w/interim pupil scale value
-
+			# Scale to 0.0 to 1.0:
+			v = (v - PUPIL_MIN) / (PUPIL_MAX - PUPIL_MIN)
+			if PUPIL_SMOOTH > 0:
+				v = ((currentPupilScale * (PUPIL_SMOOTH - 1) + v) /
+				     PUPIL_SMOOTH)
+		else: # Fractal auto pupil scale
+			v = next(autoPupil)
+			if   v < PUPIL_MIN: v = PUPIL_MIN
+			elif v > PUPIL_MAX: v = PUPIL_MAX
+		frame(v)
+		currentPupilScale = v
 
-# MAIN LOOP -- runs continuously -------------------------------------------
 
-while True:
-
-	if PUPIL_IN >= 0: # Pupil scale from sensor
-		v = adcValue[PUPIL_IN]
-		if PUPIL_IN_FLIP: v = 1.0 - v
-		# If you need to calibrate PUPIL_MIN and MAX,
-		# add a 'print v' here for testing.
-		if   v < PUPIL_MIN: v = PUPIL_MIN
-		elif v > PUPIL_MAX: v = PUPIL_MAX
-		# Scale to 0.0 to 1.0:
-		v = (v - PUPIL_MIN) / (PUPIL_MAX - PUPIL_MIN)
-		if PUPIL_SMOOTH > 0:
-			v = ((currentPupilScale * (PUPIL_SMOOTH - 1) + v) /
-			     PUPIL_SMOOTH)
-		frame(v)
-	else: # Fractal auto pupil scale
-		v = random.random()
-		split(currentPupilScale, v, 4.0, 1.0)
-	currentPupilScale = v
+if __name__ == "__main__":
+	try:
+		mainLoop()
+	except TraceEnd: # Replay finished
+		DISPLAY.stop()
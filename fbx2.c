@@ -20,7 +20,12 @@
 // -o or -t to select OLED or TFT display
 // -b ### to specify bitrate (default is based on screen type)
 // -f ### to specify max FPS (default is based on single- or multi-core Pi)
-// -s to print FPS while running (default is silent)
+// -n # to specify number of screens, 1 to 4 (default is 2, or number of
+//    -d options given)
+// -p ###x### to specify screen resolution (default is 128x128)
+// -d path to specify each screen's SPI device in turn (defaults below)
+// -s to print FPS while running, with the percentage of screen rows
+//    skipped as unchanged (default is silent)
 
 // This code works regardless of screen resolution and aspect ratio, but
 // ideally should be set for 640x480 pixels, reason is the scaling method
@@ -62,17 +67,18 @@
 
 #include <stdio.h>
 #include <math.h>
+#include <time.h>
 #include <fcntl.h>
 #include <sys/mman.h>
 #include <sys/ioctl.h>
-#include <linux/spi/spidev.h>
 #include <bcm_host.h>
+#include "spixfer.h"
 
 
 // CONFIGURATION AND GLOBAL STUFF ------------------------------------------
 
 #define DC_PIN    5             // These pins connect
-#define RESET_PIN 6             // to BOTH screens
+#define RESET_PIN 6             // to ALL screens
 #define DCMASK    (1 << DC_PIN) // GPIO pin bitmasks of reset + D/C pins
 #define RESETMASK (1 << RESET_PIN)
 
@@ -81,7 +87,12 @@
 // eye") connects to SPI0, which is on Broadcom GPIO pins #10 (MOSI), #11
 // (SCLK) and #8 (CE0).  Second screen ("left eye") connects to SPI1, on
 // GPIO #20 (MOSI), #21 (SCLK) and #16 (CE2).  CE2 is used for 2nd screen
-// as it simplified PCB routing
+// as it simplified PCB routing.  Third and fourth screens, if any, share
+// those buses, on CE1 of each: GPIO #7 (SPI0) and #17 (SPI1).  Each bus
+// gets its own transfer thread; screens on the same bus take turns.
+#define MAX_EYES 4 // Max number of screens
+static char *devPath[MAX_EYES] = {
+  "/dev/spidev0.0", "/dev/spidev1.2", "/dev/spidev0.1", "/dev/spidev1.1" };
 
 // The following are defaults, most can be overridden via command line.
 
@@ -108,23 +119,26 @@ static volatile unsigned              // GPIO stuff:
   *gpioSet,                           // Write bitmask of GPIO pins to set
   *gpioClr;                           // Write bitmask of GPIO pins to clear
 
-static struct {                       // Per-eye structure:
-	int       fd;                 // SPI file descriptor
-	uint16_t  buf[2][128 * 128];  // Double-buffered eye data 16 BPP
-	pthread_t thread;             // Thread ID of eye's spiThreadFunc()
-	struct spi_ioc_transfer xfer; // ioctl() transfer struct
-} eye[2];                             // For two eyes
-
+static struct {                       // Per-eye (screen) structure:
+	SPIDevice spi;                // SPI device
+	uint16_t *buf[2];             // Double-buffered eye data 16 BPP
+	int       offset;             // Position of eye's square in pixelBuf
+	int       first, last;        // Changed rows to send (none if first>last)
+} eye[MAX_EYES];
+
+static struct {                       // Per-SPI-bus structure:
+	pthread_t thread;             // Thread ID of bus's spiThreadFunc()
+	int       number;             // Bus number (from device name)
+	int       nEyes;              // Number of eyes (screens) on bus,
+	int       eye[MAX_EYES];      // and their indices
+} bus[MAX_EYES];
+
+static int  nEyes       = 0,          // Number of screens
+            nBuses      = 0,          // Number of SPI buses they're on
+            panelWidth  = 128,        // Screen resolution
+            panelHeight = 128;
 static pthread_barrier_t barr;        // For thread synchronization
 static uint8_t bufIdx = 0;            // Double-buffering index
-static struct spi_ioc_transfer xfer = {
-  .rx_buf        = 0, // ioctl() transfer structure for issuing
-  .delay_usecs   = 0, // commands (not pixel data) to both screens.
-  .bits_per_word = 8,
-  .pad           = 0,
-  .tx_nbits      = 0,
-  .rx_nbits      = 0,
-  .cs_change     = 0 };
 
 // From GPIO example code by Dom and Gert van Loo on elinux.org:
 #define PI1_BCM2708_PERI_BASE 0x20000000
@@ -197,25 +211,53 @@ static int err(int code, char *string) {
 	return code;
 }
 
-#define COMMAND 0 // Values for last argument
-#define DATA    1 // to dcX2() function below
-
-// Issue data or command to both SPI displays:
-static void dcX2(uint8_t x, uint8_t dc) {
-	if(dc) *gpioSet = DCMASK; // 0/low = command, 1/high = data
-	else   *gpioClr = DCMASK;
-	xfer.tx_buf = (uint32_t)&x; // Uses global xfer struct,
-	xfer.len    = 1;            // as most elements don't change
-	(void)ioctl(eye[0].fd, SPI_IOC_MESSAGE(1), &xfer);
-	(void)ioctl(eye[1].fd, SPI_IOC_MESSAGE(1), &xfer);
+// Issue command byte to all SPI displays, followed by n bytes of data
+// (the DC pin is shared, so all get the same command).  args holds each
+// screen's data in turn, 'stride' bytes apart; stride 0 = same for all.
+static void command(uint8_t cmd, uint8_t *args, int n, int stride) {
+	int i;
+	*gpioClr = DCMASK; // 0/low = command
+	for(i=0; i<nEyes; i++) (void)spiWrite(&eye[i].spi, &cmd, 1);
+	if(!n) return;
+	*gpioSet = DCMASK; // 1/high = data
+	for(i=0; i<nEyes; i++) {
+		(void)spiWrite(&eye[i].spi, &args[i * stride], n);
+	}
+}
+
+// Bus number of SPI device path, e.g. 1 for /dev/spidev1.2.  Anything
+// else (e.g. a file standing in for a device) gets a bus of its own.
+static int busNumber(char *path, int i) {
+	int b, cs;
+	return (sscanf(path, "/dev/spidev%d.%d", &b, &cs) == 2) ? b : -1 - i;
 }
 
-// Each eye's SPI transfers are handled by a separate thread, to provide
-// concurrent non-blocking transfers to both displays while the main thread
-// processes the next frame.  Same function is used for both eyes, each in
-// its own thread; eye index is passed in.
+// Sleep until 'next' (CLOCK_MONOTONIC), then advance it by one frame
+// period.  Transfers of only the changed rows (or none at all) finish
+// sooner than the bitrate-limited full frames, so the loop is paced here
+// too.  If already late, the schedule restarts from now rather than
+// running frames back-to-back to catch up.
+static void frameWait(struct timespec *next, long period) {
+	struct timespec now;
+	(void)clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, next, NULL);
+	(void)clock_gettime(CLOCK_MONOTONIC, &now);
+	if((now.tv_sec > next->tv_sec) || ((now.tv_sec == next->tv_sec) &&
+	  (now.tv_nsec > next->tv_nsec))) *next = now;
+	if((next->tv_nsec += period) >= 1000000000L) {
+		next->tv_nsec -= 1000000000L;
+		next->tv_sec++;
+	}
+}
+
+// Each SPI bus's transfers are handled by a separate thread, to provide
+// concurrent non-blocking transfers to the displays while the main thread
+// processes the next frame.  Same function is used for all buses, each in
+// its own thread; bus index is passed in.  Only each eye's changed rows
+// (first to last, set by main() along with the screen's row window) are
+// sent, if any, each eye's as one batched message where possible (see
+// spixfer.c).
 void *spiThreadFunc(void *data) {
-	int y, i = *(uint8_t *)data; // Pass in eye index
+	int e, i, b = (int)(intptr_t)data; // Pass in bus index
 	for(;;) {
 		// POSIX thread "barriers" are used to sync the main thread
 		// with the SPI transfer threads.  This needs to happen at
@@ -228,11 +270,12 @@ void *spiThreadFunc(void *data) {
 		// waiting for prior transfers to finish.
 		pthread_barrier_wait(&barr); // This is the 'after' wait
 		pthread_barrier_wait(&barr); // And the 'before' wait
-		for(y=0; y < (128*128); y += (16*128)) {
-			eye[i].xfer.tx_buf = (uint32_t)&eye[i].buf[bufIdx][y];
-			eye[i].xfer.len    = 4096;
-			(void)ioctl(eye[i].fd, SPI_IOC_MESSAGE(1),
-			  &eye[i].xfer);
+		for(e=0; e < bus[b].nEyes; e++) {
+			i = bus[b].eye[e];
+			if(eye[i].first > eye[i].last) continue;
+			(void)spiWrite(&eye[i].spi,
+			  &eye[i].buf[bufIdx][eye[i].first * panelWidth],
+			  (eye[i].last - eye[i].first + 1) * panelWidth * 2);
 		}
 	}
 	return NULL;
@@ -241,9 +284,6 @@ void *spiThreadFunc(void *data) {
 
 // INIT AND MAIN LOOP ------------------------------------------------------
 
-#define SCREEN_OLED      0 // Compatible screen types,
-#define SCREEN_TFT_GREEN 1 // just these two for now.
-
 // Screen initialization commands and data.  Derived from Adafruit Arduino
 // libraries, stripped bare here...see corresponding original libraries for
 // a more in-depth explanation of each screen command.
@@ -311,9 +351,10 @@ int main(int argc, char *argv[]) {
 	        isPi2      = 0,           // Will set to 1 if multi-core
 	        showFPS    = 0;
 	int     maxBitrate=0, maxFPS=0,   // If 0, use defaults
-	        i, j, fd, fpsBitrate, finalBitrate;
+	        nDevs=0,                  // Number of -d options
+	        i, j, n, fd, fpsBitrate, finalBitrate;
 
-	while((i = getopt(argc, argv, "otb:f:s")) != -1) {
+	while((i = getopt(argc, argv, "otb:f:sn:p:d:")) != -1) {
 		switch(i) {
 		   case 'o': // Select OLED screen type
 			screenType = SCREEN_OLED;
@@ -331,9 +372,31 @@ int main(int argc, char *argv[]) {
 		   case 's': // Show FPS
 			showFPS = 1;
 			break;
+		   case 'n': // Number of screens
+			nEyes = strtol(optarg, NULL, 0);
+			break;
+		   case 'p': // Screen resolution, WxH (or just W if square)
+			if(sscanf(optarg, "%dx%d", &panelWidth,
+			  &panelHeight) == 1) panelHeight = panelWidth;
+			break;
+		   case 'd': // SPI device, for next screen
+			if(nDevs < MAX_EYES) devPath[nDevs++] = optarg;
+			break;
 		}
 	}
 
+	if(!nEyes) nEyes = nDevs ? nDevs : 2;
+	if((nEyes < 1) || (nEyes > MAX_EYES)) {
+		return err(8, "Number of screens must be 1 to 4");
+	}
+	// Screen window commands take 8-bit (OLED) or 16-bit coordinates
+	if((panelWidth  < 1) || (panelWidth  > 0xFF00) ||
+	   (panelHeight < 1) || (panelHeight > 0xFF00) ||
+	   ((screenType == SCREEN_OLED) &&
+	    ((panelWidth > 128) || (panelHeight > 128)))) {
+		return err(9, "Invalid screen resolution");
+	}
+
 	isPi2 = (boardType() == 2);
 	if(!maxFPS) maxFPS = isPi2 ? MAX_FPS_PI_2 : MAX_FPS_PI_1;
 	if(!maxBitrate) {
@@ -348,7 +411,7 @@ int main(int argc, char *argv[]) {
 	// maximum, this FPS throttling comes free.  Determine bitrate
 	// needed to achieve maxFPS, then take the lesser of this or
 	// maxBitrate.
-	fpsBitrate   = ((128 * 128 * 16) * maxFPS); // 128x128 16-bit pixels
+	fpsBitrate   = panelWidth * panelHeight * 16 * maxFPS; // 16-bit pixels
 	finalBitrate = (fpsBitrate < maxBitrate) ? fpsBitrate : maxBitrate;
 
 	// GPIO AND OLED SCREEN INIT ---------------------------------------
@@ -372,49 +435,51 @@ int main(int argc, char *argv[]) {
 	gpioSet = &gpio[7];
 	gpioClr = &gpio[10];
 
-	if(((eye[0].fd = open("/dev/spidev0.0", O_WRONLY|O_NONBLOCK)) < 0) ||
-	   ((eye[1].fd = open("/dev/spidev1.2", O_WRONLY|O_NONBLOCK)) < 0)) {
-		return err(3, "spiOpen() failed");
+	// Open each screen's SPI device, with room for a full frame per
+	// message, and group screens by bus (one transfer thread each).
+	for(i=0; i<nEyes; i++) {
+		if(spiOpen(&eye[i].spi, devPath[i], finalBitrate,
+		  panelWidth * panelHeight * 2)) {
+			return err(3, "spiOpen() failed");
+		}
+		n = busNumber(devPath[i], i);
+		for(j=0; (j < nBuses) && (bus[j].number != n); j++);
+		if(j == nBuses) {
+			bus[nBuses].number = n;
+			bus[nBuses++].nEyes = 0;
+		}
+		bus[j].eye[bus[j].nEyes++] = i;
 	}
 
 	INP_GPIO(DC_PIN);    OUT_GPIO(DC_PIN); // Must INP before OUT
 	INP_GPIO(RESET_PIN); OUT_GPIO(RESET_PIN);
 
-
-	xfer.speed_hz = finalBitrate;
-	uint8_t  mode = SPI_MODE_0;
-	for(i=0; i<2; i++) {
-		ioctl(eye[i].fd, SPI_IOC_WR_MODE, &mode);
-		ioctl(eye[i].fd, SPI_IOC_WR_MAX_SPEED_HZ, finalBitrate);
-		memcpy(&eye[i].xfer, &xfer, sizeof(xfer));
-	}
-
 	*gpioSet = RESETMASK; usleep(5); // Reset high,
 	*gpioClr = RESETMASK; usleep(5); // low,
 	*gpioSet = RESETMASK; usleep(5); // high
 
 	// Initialize SPI screens
 	if(screenType == SCREEN_OLED) {
+		uint8_t gamma[64];
 		for(i=0;;) {
 			if(!(j=screenInit[screenType][i++])) break;
-			dcX2(j, COMMAND);
-			for(j=screenInit[screenType][i++]; j; j--)
-				dcX2(screenInit[screenType][i++], DATA);
+			n = screenInit[screenType][i++]; // # args
+			command(j, &screenInit[screenType][i], n, 0);
+			i += n;
 		}
-		dcX2(0xB8, COMMAND); // Gamma table
 		for(i=0; i<64; i++) {
-			dcX2((int)(pow((float)i/63.0, 0.75) * 179.0 + 0.5),
-			  DATA);
+			gamma[i] = (int)(pow((float)i/63.0, 0.75) * 179.0 + 0.5);
 		}
+		command(0xB8, gamma, 64, 0); // Gamma table
 	} else {
 		int ms;
 		for(i=0;;) {
 			if(!(j=screenInit[screenType][i++])) break;
-			dcX2(j, COMMAND);
-			j  = screenInit[screenType][i++]; // # args
-			ms = j & 0x80; // 0x80 = delay flag
-			j &= ~0x80;
-			while(j--) dcX2(screenInit[screenType][i++], DATA);
+			n  = screenInit[screenType][i++]; // # args
+			ms = n & 0x80; // 0x80 = delay flag
+			n &= ~0x80;
+			command(j, &screenInit[screenType][i], n, 0);
+			i += n;
 			if(ms) {
 				ms = screenInit[screenType][i++];
 				if(ms = 255) ms = 500;
@@ -428,7 +493,7 @@ int main(int argc, char *argv[]) {
 	// Insights gained from Tasanakorn's fbcp utility:
 	// https://github.com/tasanakorn/rpi-fbcp
 	// Rather than copying framebuffer-to-framebuffer, this code
-	// issues screen data directly and concurrently to two 'raw'
+	// issues screen data directly and concurrently to 'raw'
 	// SPI displays (no secondary framebuffer device / driver).
 
 	DISPMANX_DISPLAY_HANDLE_T  display; // Primary framebuffer display
@@ -449,37 +514,39 @@ int main(int argc, char *argv[]) {
 	}
 
 	// info.width and info.height are primary display dimensions.
-	// Create a 16-bit (5/6/5) offscreen resource with the same aspect
-	// ratio as framebuffer, only smaller: no less than 320 pixels wide
-	// (height proportional to framebuffer), or 160 pixels high (width
-	// proportional to framebuffer).  This intentionally creates some
-	// padding around the areas copied to the SPI screens, so that
-	// status/debugging info can be displayed in the margins but won't
-	// be copied to the screens.
+	// Picture one square per SPI screen, side-by-side, each 1.25X
+	// the screen size (so the screen's area is the 80% inset; 160
+	// pixels for 128x128 screens).  Create a 16-bit (5/6/5) offscreen
+	// resource with the same aspect ratio as framebuffer, only
+	// smaller: just wide enough for the squares (height proportional
+	// to framebuffer), or just high enough (width proportional to
+	// framebuffer).  This intentionally creates some padding around
+	// the areas copied to the SPI screens, so that status/debugging
+	// info can be displayed in the margins but won't be copied to
+	// the screens.
 
 	int width, height; // Resource dimensions
-
-	// Also determine positions of upper-left corners for the two
-	// SPI screens, and corresponding offsets into pixelBuf[].
-	// Rendering application will need to observe similar size and
-	// position constraints to produce desired results.
-	int offset0, offset1, x, y;
-
-	if(info.width <= (info.height * 2)) {
-		// Framebuffer is <= 2:1 aspect ratio (e.g. 4:3 or 16:9)
-		width   = 320;
-		height  = 320 * info.height / info.width;
-		y       = height / 2 - 64;
-		offset0 = y * width + width     / 4 - 64,
-		offset1 = y * width + width * 3 / 4 - 64;
+	int square = ((panelWidth > panelHeight) ? panelWidth : panelHeight)
+	             * 5 / 4;
+
+	// Also determine positions of upper-left corners for the SPI
+	// screens, and corresponding offsets into pixelBuf[].  Rendering
+	// application will need to observe similar size and position
+	// constraints to produce desired results.
+	int x, y;
+
+	if(info.width <= (info.height * nEyes)) {
+		// Framebuffer is <= N:1 aspect ratio (e.g. 4:3 or 16:9)
+		width   = square * nEyes;
+		height  = width * info.height / info.width;
 	} else {
-		// Framebuffer is > 2:1 aspect ratio (e.g. 21:9)
-		width   = 160 * info.width / info.height;
-		height  = 160;
-		y       = height / 2 - 64;
-		offset0 = y * width + (width - height) / 2 - 64;
-		offset1 = y * width + (width + height) / 2 - 64;
+		// Framebuffer is > N:1 aspect ratio (e.g. 21:9 for 2)
+		width   = square * info.width / info.height;
+		height  = square;
 	}
+	x = (width - square * nEyes) / 2 + square / 2 - panelWidth / 2;
+	y = height / 2 - panelHeight / 2;
+	for(i=0; i<nEyes; i++) eye[i].offset = y * width + x + square * i;
 
 	// screen_resource is an intermediary between framebuffer and
 	// main RAM -- VideoCore will copy the primary framebuffer
@@ -499,15 +566,34 @@ int main(int argc, char *argv[]) {
 		return err(7, "Can't malloc");
 	}
 
-	// Initialize SPI transfer threads and synchronization barrier
-	pthread_barrier_init(&barr, NULL, 3);
-	uint8_t aa = 0, bb = 1;
-	pthread_create(&eye[0].thread, NULL, spiThreadFunc, &aa);
-	pthread_create(&eye[1].thread, NULL, spiThreadFunc, &bb);
+	// And double buffers for each eye
+	n = panelWidth * panelHeight;
+	for(i=0; i<nEyes; i++) {
+		if(!(eye[i].buf[0] = (uint16_t *)calloc(n * 2, 2))) {
+			vc_dispmanx_display_close(display);
+			return err(7, "Can't malloc");
+		}
+		eye[i].buf[1] = &eye[i].buf[0][n];
+	}
+
+	// Initialize SPI transfer threads (one per bus) and
+	// synchronization barrier (for those plus the main thread)
+	pthread_barrier_init(&barr, NULL, nBuses + 1);
+	for(i=0; i<nBuses; i++) {
+		pthread_create(&bus[i].thread, NULL, spiThreadFunc,
+		  (void *)(intptr_t)i);
+	}
 
 	// MAIN LOOP -------------------------------------------------------
 
-	uint32_t frames=0, t, prevTime = time(NULL);
+	uint32_t frames=0, t, prevTime = time(NULL),
+	         count=0, rowsSent=0, rowsTotal=0;
+	uint16_t p, d, *src, *front, *back; // Pixel, changed bits (per row)
+	uint8_t  full, changed;  // Send all rows regardless; any eye changed
+	uint8_t  cols[4], win[MAX_EYES][4]; // Window command args
+	int      first[MAX_EYES], last[MAX_EYES]; // Changed rows of each eye
+	struct timespec next;
+	(void)clock_gettime(CLOCK_MONOTONIC, &next);
 
 	for(;;) {
 
@@ -517,55 +603,75 @@ int main(int argc, char *argv[]) {
 		vc_dispmanx_resource_read_data(screen_resource, &rect,
 		  pixelBuf, width * 2);
 
-		// Crop & transfer rects to eye buffers, flip hi/lo bytes
-		j = 1 - bufIdx; // Render to 'back' buffer
-		for(y=0; y<128; y++) {
-			// HHLL -> HHLLHHLL -> HHLLHH -> LLHH
-			for(x=0; x<128; x++) {
-				eye[0].buf[j][y * 128 + x] =
-				  (pixelBuf[offset0 + y * width + x] *
-				  0x00010001) >> 8;
-				eye[1].buf[j][y * 128 + x] =
-				  (pixelBuf[offset1 + y * width + x] *
-				  0x00010001) >> 8;
+		// Crop & transfer rects to eye buffers, flip hi/lo bytes.
+		// Each row is compared against the 'front' buffer (the last
+		// frame, which is what the screens show) along the way, to
+		// find the range of rows that changed in each eye.  Eyes
+		// hold still much of the time, and then nothing need be
+		// sent.  Once a second (and on the first frame) all rows
+		// are sent regardless, in case a screen missed some data.
+		j       = 1 - bufIdx; // Render to 'back' buffer
+		full    = !(count++ % maxFPS);
+		changed = 0;
+		for(i=0; i<nEyes; i++) {
+			src      = &pixelBuf[eye[i].offset];
+			front    = eye[i].buf[bufIdx];
+			back     = eye[i].buf[j];
+			first[i] = panelHeight;
+			last[i]  = -1;
+			for(y=0; y<panelHeight; y++) {
+				d = 0;
+				// HHLL -> HHLLHHLL -> HHLLHH -> LLHH
+				for(x=0; x<panelWidth; x++) {
+					p = (src[y * width + x] * 0x00010001) >> 8;
+					d |= p ^ *front++;
+					*back++ = p;
+				}
+				if(d || full) {
+					if(first[i] > y) first[i] = y;
+					last[i] = y;
+				}
+			}
+			if(first[i] <= last[i]) {
+				rowsSent += last[i] - first[i] + 1;
+				changed   = 1;
 			}
 		}
+		rowsTotal += panelHeight * nEyes;
+
+		if(!changed) {
+			// No eye changed; the SPI threads are left
+			// waiting and the back buffers (same as the front)
+			// are simply overwritten next time.
+			goto done;
+		}
 
 		// Sync up all threads; wait for prior transfers to finish
 		pthread_barrier_wait(&barr);
 
+		// Threads are idle now; pass along the rows to send
+		for(i=0; i<nEyes; i++) {
+			eye[i].first = first[i];
+			eye[i].last  = last[i];
+		}
+
 		// Before pushing data to SPI screens, their column and
 		// row ranges are reset every frame to force screen data
 		// pointer back to (0,0).  Though the pointer will
 		// automatically 'wrap' when the end of the screen is
 		// reached, this is extra insurance in case there's a
-		// glitch where a byte doesn't get through to one or both
+		// glitch where a byte doesn't get through to some of the
 		// displays (which would then be out of sync in all
-		// subsequent frames).
-		if(screenType == SCREEN_OLED) {
-			dcX2(0x15, COMMAND);
-			dcX2(0x00, DATA); dcX2(0x7F, DATA);
-			dcX2(0x75, COMMAND);
-			dcX2(0x00, DATA); dcX2(0x7F, DATA);
-			dcX2(0x5C, COMMAND); // Write to display RAM
-		} else {
-			int colstart = 2;
-			int rowstart = 3;
-
-			dcX2(0x2A, COMMAND); // Column set
-			dcX2(0x00, DATA);
-			dcX2(colstart, DATA);
-			dcX2(0x00, DATA);
-			dcX2(127 + colstart, DATA);
-
-			dcX2(0x2B, COMMAND); // Row set
-			dcX2(0x00, DATA);
-			dcX2(rowstart, DATA);
-			dcX2(0x00, DATA);
-			dcX2(127 + rowstart, DATA);
-
-			dcX2(0x2C, COMMAND); // RAM write
+		// subsequent frames).  The row range is narrowed to each
+		// eye's changed rows (an unchanged eye gets the full range,
+		// but no data).
+		for(i=0; i<nEyes; i++) {
+			n = spiWindow(screenType, panelWidth, panelHeight,
+			  first[i], last[i], cols, win[i]);
 		}
+		command(spiWindowCmd[screenType][0], cols, n, 0);      // Column set
+		command(spiWindowCmd[screenType][1], &win[0][0], n, 4); // Row set
+		command(spiWindowCmd[screenType][2], NULL, 0, 0);      // RAM write
 
 		*gpioSet = DCMASK;     // DC high
 		bufIdx   = 1 - bufIdx; // Swap buffers
@@ -574,19 +680,25 @@ int main(int argc, char *argv[]) {
 		// again, they'll start pushing data...
 		pthread_barrier_wait(&barr);
 
+		done:
 		if(showFPS) {
 			// Show approximate frames-per-second once per
 			// second.  This is the copy speed of the fbx2
 			// code and is disengaged from the eye-rendering
 			// application, which will be operating at its
-			// own unrelated refresh rate.
+			// own unrelated refresh rate.  Also the share of
+			// rows (all eyes) not sent, being unchanged.
 			frames++;
 			if((t = time(NULL)) != prevTime) {
-				(void)printf("%d fps\n", frames);
-				frames   = 0;
-				prevTime = t;
+				(void)printf("%d fps, %d%% skipped\n", frames,
+				  100 - (int)(rowsSent * 100 / rowsTotal));
+				frames    = 0;
+				rowsSent  = rowsTotal = 0;
+				prevTime  = t;
 			}
 		}
+
+		frameWait(&next, 1000000000L / maxFPS);
 	}
 
 	vc_dispmanx_resource_delete(screen_resource);
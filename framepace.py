@@ -0,0 +1,117 @@
+#!/usr/bin/python
+
+# Frame pacing for the eye renderers.  Formerly the render loop ran flat
+# out, drawing as many frames as the CPU could manage, even though fbx2
+# only copies to the SPI screens at MAX_FPS_PI_1 or MAX_FPS_PI_2 frames/s
+# and every frame beyond that was discarded, keeping the Pi at 100% CPU.
+# FramePacer sleeps until each frame's deadline on a monotonic clock (so
+# NTP or manual clock changes don't stall or rush the animation), leaving
+# the CPU to the ADC thread and fbx2 and cutting heat and power draw.
+# Frames starting over half a period past their deadline are counted as
+# late and can be reported periodically; a frame late by more than a
+# whole period drops the missed deadlines rather than rendering a burst
+# to catch up.
+
+import ctypes
+import ctypes.util
+import sys
+import time
+
+CLOCK_MONOTONIC = 1 # Linux clockid_t
+
+class Timespec(ctypes.Structure):
+	_fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+# Return a monotonic clock function (seconds, as float).  Python 3 has
+# time.monotonic(); Python 2 (as on Raspbian) gets clock_gettime() via
+# ctypes.  Falls back to time.time() if neither is available.
+def monotonicClock():
+	if hasattr(time, "monotonic"): return time.monotonic
+	try:
+		lib = ctypes.CDLL(ctypes.util.find_library("rt"))
+		gettime = lib.clock_gettime
+	except (OSError, AttributeError):
+		return time.time
+	ts = Timespec()
+	def monotonic():
+		gettime(CLOCK_MONOTONIC, ctypes.byref(ts))
+		return ts.tv_sec + ts.tv_nsec * 1e-9
+	return monotonic
+
+
+# Frame rate fbx2 copies to the screens at by default: 60 on multi-core
+# boards, else 30 (MAX_FPS_PI_2 and MAX_FPS_PI_1 in fbx2.c), determined
+# the same way as fbx2's boardType().  If fbx2 is run with -f, pass the
+# same rate to FramePacer instead.
+def copierFPS():
+	try:
+		with open("/proc/cmdline") as f:
+			for word in f.read().split():
+				if word.startswith("mem_size=") and int(word[9:], 16) in (
+				  0x3F000000, 0x40000000):
+					return 60
+	except (IOError, ValueError):
+		pass
+	return 30
+
+
+class FramePacer(object):
+
+	# fps: target frame rate; 0 or less runs unpaced (as before).
+	# clock/sleep: time functions, replaceable for simulated time (see
+	# headless.py).  report: interval in seconds between late frame
+	# reports on stderr (0 = silent; counts are still kept).
+	def __init__(self, fps, clock=None, sleep=time.sleep, report=0):
+		self.period   = 1.0 / fps if fps > 0 else 0.0
+		self.clock    = clock or monotonicClock()
+		self.sleep    = sleep
+		self.report   = report
+		self.deadline = None # Start time of next frame
+		self.frames   = 0    # Frames paced
+		self.late     = 0    # Frames started > 1/2 period late
+		self.worst    = 0.0  # Greatest lateness, in seconds
+		self.reportFrames = 0 # As above, since last report
+		self.reportLate   = 0
+		self.reportWorst  = 0.0
+		self.reportTime   = None
+
+	# Call once at the start of each frame: sleeps until the frame's
+	# deadline and returns how late (in seconds) it started, or 0.
+	def wait(self):
+		now = self.clock()
+		if self.period <= 0.0 or self.deadline is None:
+			self.deadline = now
+		else:
+			# sleep() may return early (e.g. on a signal), so loop
+			while now < self.deadline:
+				self.sleep(self.deadline - now)
+				now = self.clock()
+		lateness = now - self.deadline
+		if lateness > self.period * 0.5:
+			self.late        += 1
+			self.reportLate  += 1
+			self.worst        = max(self.worst, lateness)
+			self.reportWorst  = max(self.reportWorst, lateness)
+		else:
+			lateness = 0.0
+		if lateness > self.period:
+			self.deadline = now # Missed whole frames; don't catch up
+		self.deadline += self.period
+		self.frames       += 1
+		self.reportFrames += 1
+		if self.report > 0: self.printReport(now)
+		return lateness
+
+	# Print count of late frames since the last report to stderr, at
+	# most every 'report' seconds and only if any were late.
+	def printReport(self, now):
+		if self.reportTime is None: self.reportTime = now
+		if now - self.reportTime < self.report: return
+		if self.reportLate:
+			sys.stderr.write("%d of %d frames late (worst %.1f ms)\n" %
+			  (self.reportLate, self.reportFrames, self.reportWorst * 1000.0))
+		self.reportTime   = now
+		self.reportFrames = 0
+		self.reportLate   = 0
+		self.reportWorst  = 0.0
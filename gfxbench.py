@@ -0,0 +1,153 @@
+#!/usr/bin/python
+
+# Micro-benchmark for the gfxutil geometry functions.  Times the original
+# point-by-point Python loops (reproduced below for reference) against the
+# NumPy array versions in gfxutil, per call, using point counts matching
+# eyes.py (32-point iris, 33-point eyelids).  Runs anywhere gfxutil and
+# svg.path import; no display or GPIO needed.
+# Usage: python gfxbench.py [iterations]
+
+import math
+import sys
+import timeit
+from gfxutil import *
+
+
+# Original tuple-list implementations -------------------------------------
+
+def loopPathToPoints(path, numPoints, closed, reverse):
+	points = []
+	if closed is True: div = float(numPoints)
+	else:              div = float(numPoints - 1)
+	for p in range(numPoints):
+		if reverse is True: pt = path.point(1.0 - p / div, error=1e-5)
+		else:               pt = path.point(      p / div, error=1e-5)
+		points.append((pt.real, pt.imag))
+	if closed is True: points.append(points[0])
+	return points
+
+def loopScalePoints(p, vb, radius):
+	for i, pt in enumerate(p):
+		xx = ((p[i][0] - vb[0]) / vb[2] - 0.5) * radius *  2.0
+		yy = ((p[i][1] - vb[1]) / vb[3] - 0.5) * radius * -2.0
+		p[i] = (xx, yy)
+
+def loopPointsInterp(points1, points2, p2weight):
+	if   p2weight < 0.0: p2weight = 0.0
+	elif p2weight > 1.0: p2weight = 1.0
+	p1weight = 1.0 - p2weight
+	points   = []
+	for p in range(min(len(points1), len(points2))):
+		x = points1[p][0] * p1weight + points2[p][0] * p2weight
+		y = points1[p][1] * p1weight + points2[p][1] * p2weight
+		points.append((x, y))
+	return points
+
+def loopPointsBounds(points):
+	b = [ points[0][0], points[0][1], points[0][0], points[0][1] ]
+	for p in range(1, len(points)):
+		if points[p][0] < b[0]: b[0] = points[p][0]
+		if points[p][1] < b[1]: b[1] = points[p][1]
+		if points[p][0] > b[2]: b[2] = points[p][0]
+		if points[p][1] > b[3]: b[3] = points[p][1]
+	return b
+
+def loopPointsMesh(points0, points1, points2, steps, z, flip=False):
+	np1   = min(len(points1), len(points2))
+	verts = []
+	div   = float(steps - 1)
+	if flip is True:
+		if points0 is not None:
+			for p in reversed(points0):
+				verts.append((-p[0], p[1], 0))
+		for y in range(steps):
+			pList = loopPointsInterp(points1, points2, y / div)
+			for x in reversed(range(np1)):
+				verts.append((-pList[x][0], pList[x][1], z))
+	else:
+		if points0 is not None:
+			for p in points0:
+				verts.append((p[0], p[1], 0))
+		for y in range(steps):
+			pList = loopPointsInterp(points1, points2, y / div)
+			for x in range(np1):
+				verts.append((pList[x][0], pList[x][1], z))
+	return verts
+
+
+# Test data: circles and arcs roughly the shape of the eye features -------
+
+def circle(n, r, closed):
+	pts = []
+	for i in range(n):
+		a = 2.0 * math.pi * i / n
+		pts.append((math.cos(a) * r, math.sin(a) * r))
+	if closed is True: pts.append(pts[0])
+	return pts
+
+def arc(n, r, y):
+	pts = []
+	for i in range(n):
+		a = math.pi * i / (n - 1)
+		pts.append((-math.cos(a) * r, math.sin(a) * r * 0.5 + y))
+	return pts
+
+vb          = (0.0, 0.0, 512.0, 512.0)
+pupilMin    = circle(32, 20.0, True)
+pupilMax    = circle(32, 60.0, True)
+iris        = circle(32, 90.0, True)
+lidOpen     = arc(33, 120.0, 60.0)
+lidClosed   = arc(33, 120.0, -40.0)
+lidEdge     = arc(33, 130.0, 200.0)
+aPupilMin   = pointsArray(pupilMin)
+aPupilMax   = pointsArray(pupilMax)
+aIris       = pointsArray(iris)
+aLidOpen    = pointsArray(lidOpen)
+aLidClosed  = pointsArray(lidClosed)
+aLidEdge    = pointsArray(lidEdge)
+# Circle as four cubic Beziers, as Illustrator saves them in eye SVGs
+circlePath  = ("M 34,6 C 49.5,6 62,18.5 62,34 C 62,49.5 49.5,62 34,62 "
+               "C 18.5,62 6,49.5 6,34 C 6,18.5 18.5,6 34,6 Z")
+
+
+def bench(label, loopFunc, arrayFunc, iterations):
+	tLoop  = min(timeit.repeat(loopFunc , number=iterations, repeat=3))
+	tArray = min(timeit.repeat(arrayFunc, number=iterations, repeat=3))
+	tLoop  *= 1000000.0 / iterations
+	tArray *= 1000000.0 / iterations
+	print("%-18s %9.2f us %9.2f us %7.1fx" %
+	  (label, tLoop, tArray, tLoop / tArray))
+
+
+if __name__ == "__main__":
+	iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+	print("%-18s %12s %12s %8s" % ("function", "loop", "array", "speedup"))
+	bench("scalePoints",
+	  lambda: loopScalePoints(list(lidOpen), vb, 128),
+	  lambda: scaleArray(aLidOpen.copy(), vb, 128), iterations)
+	bench("pointsInterp",
+	  lambda: loopPointsInterp(pupilMin, pupilMax, 0.3),
+	  lambda: arrayInterp(aPupilMin, aPupilMax, 0.3), iterations)
+	bench("pointsBounds",
+	  lambda: loopPointsBounds(pupilMax),
+	  lambda: arrayBounds(aPupilMax), iterations)
+	bench("pointsMesh (iris)",
+	  lambda: loopPointsMesh(None, pupilMin, iris, 4, -80.0),
+	  lambda: arrayMesh(None, aPupilMin, aIris, 4, -80.0), iterations)
+	bench("pointsMesh (lid)",
+	  lambda: loopPointsMesh(lidEdge, lidOpen, lidClosed, 5, 0),
+	  lambda: arrayMesh(aLidEdge, aLidOpen, aLidClosed, 5, 0), iterations)
+	bench("pointsMesh (flip)",
+	  lambda: loopPointsMesh(lidEdge, lidOpen, lidClosed, 5, 0, True),
+	  lambda: arrayMesh(aLidEdge, aLidOpen, aLidClosed, 5, 0, True),
+	  iterations)
+	from svg.path import parse_path
+	table = pathTable(parse_path(circlePath))
+	bench("pathToPoints",
+	  lambda: loopPathToPoints(parse_path(circlePath), 32, True, True),
+	  lambda: pathToPoints(parse_path(circlePath), 32, True, True),
+	  iterations // 10)
+	bench("  (from table)",
+	  lambda: loopPathToPoints(parse_path(circlePath), 32, True, True),
+	  lambda: tablePoints(table, 32, True, True), iterations // 10)
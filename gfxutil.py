@@ -1,6 +1,16 @@
+import ctypes
 import pi3d
 import math
-from svg.path import Path, parse_path
+import numpy as np
+from collections import OrderedDict
+from pi3d.constants import (opengles, GL_ARRAY_BUFFER, GLintptr, GLsizeiptr,
+  GL_CW, GL_CCW, GLint, GLsizei, GLuint, GL_FRAMEBUFFER, GL_RENDERBUFFER,
+  GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT, GL_DEPTH_COMPONENT16,
+  GL_TEXTURE_2D, GL_RGBA, GL_UNSIGNED_BYTE, GL_COLOR_BUFFER_BIT,
+  GL_DEPTH_BUFFER_BIT, GL_TEXTURE_MIN_FILTER, GL_NEAREST, GLboolean,
+  GL_LESS, GL_LEQUAL)
+
+GL_COLOR_WRITEMASK = 0x0C23 # Not in pi3d.constants
 
 # Get artboard bounds (to use Illustrator terminology) from SVG DOM tree:
 def getViewBox(root):
@@ -15,8 +25,11 @@ def getViewBox(root):
 	return None
 
 
-# Search for and return a specific path (by name) in SVG DOM tree:
+# Search for and return a specific path (by name) in SVG DOM tree.
+# svg.path is imported here rather than at the top, so renderers loading
+# precompiled eye assets (see eyeasset.py) don't need to load it at all.
 def getPath(root, id):
+	from svg.path import parse_path
 	for node in root.childNodes:
 		if node.nodeType == node.ELEMENT_NODE:
 			p = getPath(node, id)
@@ -32,16 +45,8 @@ def getPath(root, id):
 # size of the point list returned is one element larger than the number of
 # points passed, and the first and last elements will coincide.
 def pathToPoints(path, numPoints, closed, reverse):
-	points = []
-	if numPoints < 2: numPoints  = 2
-	if closed is True: div = float(numPoints)
-	else:              div = float(numPoints - 1)
-	for p in range(numPoints):
-		if reverse is True: pt = path.point(1.0 - p / div, error=1e-5)
-		else:               pt = path.point(      p / div, error=1e-5)
-		points.append((pt.real, pt.imag))
-	if closed is True: points.append(points[0])
-	return points
+	return [tuple(pt) for pt in
+	  tablePoints(pathTable(path), numPoints, closed, reverse).tolist()]
 
 
 # Combo wrapper for pathToPoints(getPath(...))
@@ -49,13 +54,147 @@ def getPoints(root, id, numPoints, closed, reverse):
 	return pathToPoints(getPath(root, id), numPoints, closed, reverse)
 
 
+# Evaluating a path position with svg.path's point() means solving for
+# segment arc lengths to the requested precision, which is slow on a Pi.
+# Instead, pathTable() samples each segment densely, once, and returns an
+# N x 3 array of (position, X, Y) rows, position being 0.0 to 1.0 along
+# the path with the same parameterization as svg.path (segments weighted
+# by arc length, measured here from the dense polyline; uniform parameter
+# within each segment).  tablePoints() then resamples that at any point
+# count by linear interpolation, without svg.path, so a table can be
+# stored with compiled eye assets and re-tessellated at runtime.
+def pathTable(path, segmentSteps=64):
+	t     = np.linspace(0.0, 1.0, segmentSteps + 1)
+	segs  = [segmentPoints(seg, t) for seg in path]
+	lens  = [np.abs(np.diff(s)).sum() for s in segs]
+	total = sum(lens)
+	rows  = []
+	start = 0.0
+	for s, l in zip(segs, lens):
+		frac = (l / total) if total > 0 else (1.0 / len(segs))
+		rows.append(np.column_stack((start + t * frac, s.real, s.imag)))
+		start += frac
+	table = np.concatenate(rows)
+	table[-1, 0] = 1.0 # Avoid rounding short of end
+	return table
+
+
+# Points along an svg.path segment at parameter values t (array), returned
+# as a complex array.  Bezier curves and lines are evaluated directly as
+# array ops; other segment types (arcs) fall back to the segment's point().
+def segmentPoints(seg, t):
+	if hasattr(seg, "control1"): # Cubic Bezier
+		s = 1.0 - t
+		return (s * s * s * seg.start + 3.0 * s * s * t * seg.control1 +
+		        3.0 * s * t * t * seg.control2 + t * t * t * seg.end)
+	if hasattr(seg, "control"):  # Quadratic Bezier
+		s = 1.0 - t
+		return (s * s * seg.start + 2.0 * s * t * seg.control +
+		        t * t * seg.end)
+	if type(seg).__name__ in ("Line", "Linear", "Close"):
+		return seg.start + (seg.end - seg.start) * t
+	return np.array([seg.point(x) for x in t], dtype=complex)
+
+
+# Resample a path table (from pathTable()) to a point array; arguments as
+# for pathToPoints().
+def tablePoints(table, numPoints, closed, reverse):
+	if numPoints < 2: numPoints  = 2
+	if closed is True: div = float(numPoints)
+	else:              div = float(numPoints - 1)
+	pos = np.arange(numPoints) / div
+	if reverse is True: pos = 1.0 - pos
+	n   = numPoints + 1 if closed is True else numPoints
+	pts = np.empty((n, 2), dtype=np.float32)
+	pts[:numPoints, 0] = np.interp(pos, table[:, 0], table[:, 1])
+	pts[:numPoints, 1] = np.interp(pos, table[:, 0], table[:, 2])
+	if closed is True: pts[-1] = pts[0]
+	return pts
+
+
+# Largest distance between a path table's dense polyline and the same path
+# resampled by tablePoints() at numPoints, i.e. the chord error of that
+# tessellation, in table units (unit eye radius for compiled assets).
+def tableError(table, numPoints, closed):
+	pts = tablePoints(table, numPoints, closed, False)
+	div = len(pts) - 1
+	seg = np.minimum((table[:, 0] * div).astype(int), div - 1)
+	a   = pts[seg]
+	ab  = pts[seg + 1] - a
+	ap  = table[:, 1:3] - a
+	l2  = (ab * ab).sum(axis=1)
+	t   = np.clip((ap * ab).sum(axis=1) / np.where(l2 > 0, l2, 1.0),
+	        0.0, 1.0)
+	d   = ap - ab * t[:, None]
+	return math.sqrt((d * d).sum(axis=1).max())
+
+
+# Fewest points (minPoints to maxPoints) at which a path table, drawn
+# 'scale' pixels per table unit (eye radius), is within 'error' pixels of
+# the actual path.  Binary search; error falls (near enough) monotonically
+# with point count.
+def tableDetail(table, scale, error, closed, minPoints=8, maxPoints=256):
+	lo, hi = minPoints, maxPoints
+	while lo < hi:
+		n = (lo + hi) // 2
+		if tableError(table, n, closed) * scale <= error: hi = n
+		else:                                            lo = n + 1
+	return lo
+
+
+# Number of segments for an arc of 'angle' radians on a circle of 'radius'
+# pixels to be within 'error' pixels of the true circle (sagitta of each
+# chord), between minSteps and maxSteps.
+def arcDetail(radius, angle, error, minSteps=4, maxSteps=256):
+	if error >= radius: return minSteps
+	n = int(math.ceil(angle / (2.0 * math.acos(1.0 - error / radius))))
+	return min(max(n, minSteps), maxSteps)
+
+
+# Combo wrapper for pathTable(getPath(...))
+def getTable(root, id):
+	return pathTable(getPath(root, id))
+
+
+# Point lists may also be held as contiguous float32 NumPy arrays (one row
+# per point, X and Y columns).  The array functions below do the same work
+# as their tuple-list counterparts in whole-array operations rather than
+# point-by-point Python loops, which matters on single-core boards where
+# blinks and pupil changes regenerate geometry several times per frame.
+# The tuple-list functions are kept as thin wrappers around these; they
+# accept either form and return tuple lists as before.  Convert once with pointsArray() (e.g. after loading
+# from SVG) so later calls don't pay for the conversion every time.
+def pointsArray(points):
+	if points is None: return None
+	return np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 2)
+
+
+# Point (or vertex) array back to a list of tuples, as the tuple-list
+# functions return.
+def tupleList(a):
+	if a is None: return None
+	return [tuple(p) for p in a.tolist()]
+
+
 # Scale a given 2D point list by normalizing to a given view box (returned
 # by getViewBox()) then expanding to a given size centered on (0,0).
 def scalePoints(p, vb, radius):
-	for i, pt in enumerate(p): # Each point in path
-		xx = ((p[i][0] - vb[0]) / vb[2] - 0.5) * radius *  2.0
-		yy = ((p[i][1] - vb[1]) / vb[3] - 0.5) * radius * -2.0
-		p[i] = (xx, yy)
+	if isinstance(p, np.ndarray):
+		scaleArray(p, vb, radius)
+	else:
+		a = scaleArray(pointsArray(p), vb, radius)
+		for i, pt in enumerate(a.tolist()): p[i] = tuple(pt)
+
+
+# Array version of scalePoints(); array is scaled in-place and returned.
+def scaleArray(a, vb, radius):
+	a[:, 0] -= vb[0]
+	a[:, 0] *= radius *  2.0 / vb[2]
+	a[:, 0] -= radius
+	a[:, 1] -= vb[1]
+	a[:, 1] *= radius * -2.0 / vb[3]
+	a[:, 1] += radius
+	return a
 
 
 # Interpolate between two 2D point lists, returning a new point list.
@@ -63,31 +202,34 @@ def scalePoints(p, vb, radius):
 # Lists should have same number of points; if not, lesser point count
 # is used and the output may be weird.
 def pointsInterp(points1, points2, p2weight):
+	np1 = min(len(points1), len(points2))
+	if np1 < 1: return None
+	return tupleList(arrayInterp(
+	  np.asarray(points1[:np1], dtype=np.float64).reshape(-1, 2),
+	  np.asarray(points2[:np1], dtype=np.float64).reshape(-1, 2), p2weight))
+
+
+# Array version of pointsInterp(); arrays must be the same size.
+# Result is written to 'out' if passed, else a new array is returned.
+def arrayInterp(a1, a2, p2weight, out=None):
 	if   p2weight < 0.0: p2weight = 0.0
 	elif p2weight > 1.0: p2weight = 1.0
-	p1weight = 1.0 - p2weight
-	points   = []
-	np1      = len(points1)
-	np2      = len(points2)
-	if np2 < np1: np1 = np2
-	if np1 < 1  : return None
-	for p in range(np1):
-		x = points1[p][0] * p1weight + points2[p][0] * p2weight
-		y = points1[p][1] * p1weight + points2[p][1] * p2weight
-		points.append((x, y))
-	return points
+	if out is None: out = np.empty_like(a1)
+	np.multiply(a1, 1.0 - p2weight, out=out)
+	out += a2 * p2weight
+	return out
 
 
 # Return bounding rect of 2D point list
 def pointsBounds(points):
-	b = [ points[0][0], points[0][1], points[0][0], points[0][1] ]
-	n = len(points)
-	for p in range(1, n):
-		if points[p][0] < b[0]: b[0] = points[p][0]
-		if points[p][1] < b[1]: b[1] = points[p][1]
-		if points[p][0] > b[2]: b[2] = points[p][0]
-		if points[p][1] > b[3]: b[3] = points[p][1]
-	return b # 4-element list: min X, min Y, max X, max Y
+	return arrayBounds(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+
+
+# Array version of pointsBounds()
+def arrayBounds(a):
+	lo = a.min(axis=0)
+	hi = a.max(axis=0)
+	return [ float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1]) ]
 
 
 # This function rotates a model 90 degrees on the X axis and applies an
@@ -115,6 +257,44 @@ def reAxis(shape, texOffset):
 		buf[i][6] += texOffset
 
 
+# Array equivalent of pi3d.Lathe(path=points, sides=sides) followed by
+# reAxis(shape, 0): the same vertices, normals, texture coordinates and
+# triangles, computed as whole-array operations rather than pi3d's
+# per-vertex Python loop, so a sclera can be lathed at any level of
+# detail at startup.  Returns (N x 8 float32 array_buffer, M x 3 int16
+# element indices).
+def latheArrays(points, sides):
+	p     = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+	s     = len(p)
+	d     = np.zeros((s, 2))
+	d[1:] = p[1:] - p[:-1]           # Direction from previous point
+	seg   = np.sqrt((d * d).sum(axis=1))
+	d    /= np.where(seg > 0, seg, 1.0)[:, None]
+	tcy   = np.cumsum(seg) / seg.sum()
+	r     = np.arange(sides + 1) * (2.0 * math.pi / sides)
+	sinr  = np.sin(r)[None, :]
+	cosr  = np.cos(r)[None, :]
+	px    = p[:, 0:1]
+	buf   = np.empty((s, sides + 1, 8), dtype=np.float32)
+	# Lathe vertex (x sin, y, x cos) and normal (-sin dy, dx, -cos dy),
+	# re-axised: Y, Z = Z, -Y
+	buf[:, :, 0] = px * sinr
+	buf[:, :, 1] = px * cosr
+	buf[:, :, 2] = -p[:, 1:2]
+	buf[:, :, 3] = -sinr * d[:, 1:2]
+	buf[:, :, 4] = -cosr * d[:, 1:2]
+	buf[:, :, 5] = -d[:, 0:1]
+	buf[:, :, 6] = 1.0 - np.arange(sides + 1) / float(sides)
+	buf[:, :, 7] = tcy[:, None]
+	pp  = (np.arange(s - 1)[:, None] * (sides + 1) +
+	       np.arange(sides)[None, :]).ravel()
+	pn  = pp + sides + 1
+	idx = np.empty((len(pp), 2, 3), dtype=np.int16)
+	idx[:, 0] = np.column_stack((pp + 1, pp, pn))
+	idx[:, 1] = np.column_stack((pn, pn + 1, pp + 1))
+	return buf.reshape(-1, 8), idx.reshape(-1, 3)
+
+
 
 # Instead of making these so general-purpose, I might intentionally
 # rig them to specifically handle the iris (closed shape) and eyelid
@@ -133,7 +313,9 @@ def reAxis(shape, texOffset):
 # even though we're not using the coordinates yet, it'd provide some
 # consistency and avoid trouble later.
 
-# If it's an eyelid, add an extra row with V=0.0
+# If it's an eyelid, add an extra row with V=0.0; the triangles between
+# it and the first row (the eyelid's opaque band, edge to lip) come first
+# in the index list, and their number is the Mesh's 'edgeTris'.
 
 def meshInit(uSteps, vSteps, closed, uOffset, vOffset, lid):
 	verts = []
@@ -166,49 +348,390 @@ def meshInit(uSteps, vSteps, closed, uOffset, vOffset, lid):
  			idx.append((s+uSteps, s         , s+1     ))
  			idx.append((s+1     , s+uSteps+1, s+uSteps))
 
-	shape = pi3d.Shape(None, None, "foo", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
-	  1.0, 1.0, 1.0, 0.0, 0.0, 0.0)
+	shape = Mesh()
 	shape.buf = []
 	shape.buf.append(pi3d.Buffer(shape, verts, tex, idx, norms, False))
+	if lid is True: shape.edgeTris = (uSteps - 1) * 2
 
 	return shape
 
 
+# Shape type returned by meshInit(), for meshes whose vertex positions are
+# regenerated at runtime.  Shape.re_init() copies every column of the
+# vertex array and re-uploads the whole buffer, though only positions ever
+# change.  update() instead writes just the position columns of the
+# Buffer's existing float32 array_buffer, in place, for the span of
+# vertices that actually moved (e.g. not an eyelid's fixed edge row or the
+# iris's outer ring), and uploads only that span with glBufferSubData().
+# clone() makes a second Mesh sharing the same Buffer, so geometry shared
+# by two eyes (the irises) is updated and uploaded once; each may still
+# have its own texture map offset, applied when drawn.  A Mesh with
+# 'mirror' set is drawn mirrored on the X axis by its transform (give it
+# scale(-1, 1, 1)): triangle winding and texture U are reversed to match,
+# so it looks the same as a mesh built with flip=True (see arrayMesh()).
+class Mesh(pi3d.Shape):
+
+	def __init__(self, texOffset=(0.0, 0.0)):
+		super(Mesh, self).__init__(None, None, "mesh", 0.0, 0.0, 0.0,
+		  0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 0.0, 0.0, 0.0)
+		self.texOffset = texOffset
+		self.mirror    = False
+		self.edgeTris  = 0 # See meshInit()
+
+	# Replace vertex positions starting at index 'first' with N x 3 array
+	# verts.  Returns False if nothing changed (no upload needed).
+	def update(self, verts, first=0):
+		buf   = self.buf[0]
+		pos   = buf.array_buffer[first:first + len(verts), 0:3]
+		moved = np.flatnonzero((pos != verts).any(axis=1))
+		if len(moved) == 0: return False
+		lo, hi = moved[0], moved[-1] + 1
+		pos[lo:hi] = verts[lo:hi]
+		self.upload(first + lo, first + hi)
+		return True
+
+	# Load morph targets from morphArrays() into the position and normal
+	# columns, for drawing with the 'morph' shader (shaders/morph.vs).
+	# Geometry is then static; only setMorph() weights change per frame.
+	def morphInit(self, verts, morph):
+		buf = self.buf[0]
+		buf.array_buffer[:, 0:3] = verts
+		buf.array_buffer[:, 3:6] = morph
+		self.upload(0, len(verts))
+
+	# Set morph shader weight, or span of weights lo to hi for meshes whose
+	# rows span the motion since the last frame (see morphArrays()).
+	def setMorph(self, lo, hi=None):
+		if hi is None: hi = lo
+		self.set_custom_data(48, [min(max(lo, 0.0), 1.0),
+		  min(max(hi, 0.0), 1.0), 0.0])
+
+	# Upload vertices lo to hi-1 of the array_buffer to the GL buffer.
+	# Nothing to do if the Buffer hasn't been loaded yet (the whole
+	# array is uploaded when first drawn).
+	def upload(self, lo, hi):
+		buf = self.buf[0]
+		if buf.disp is None or not buf.opengl_loaded: return
+		stride = buf.array_buffer.strides[0]
+		buf._select()
+		opengles.glBufferSubData(GL_ARRAY_BUFFER,
+		  GLintptr(lo * stride), GLsizeiptr((hi - lo) * stride),
+		  buf.array_buffer[lo:].ctypes.data)
+
+	def clone(self, texOffset=(0.0, 0.0)):
+		shape          = Mesh(texOffset)
+		shape.buf      = self.buf
+		shape.edgeTris = self.edgeTris
+		shape.set_shader(self.shader)
+		return shape
+
+	def draw(self, *args, **kwargs):
+		buf = self.buf[0]
+		if self.mirror:
+			buf.unib[6] = -1.0 # U multiplier; U' = 1 - U + offset
+			buf.set_offset((self.texOffset[0] + 1.0, self.texOffset[1]))
+			opengles.glFrontFace(GL_CCW)
+			super(Mesh, self).draw(*args, **kwargs)
+			opengles.glFrontFace(GL_CW) # pi3d default
+		else:
+			buf.unib[6] = 1.0
+			buf.set_offset(self.texOffset)
+			super(Mesh, self).draw(*args, **kwargs)
+
+	# Draw only the first 'ntris' triangles (e.g. edgeTris, an eyelid's
+	# opaque band) and only into the depth buffer, so whatever is drawn
+	# behind them next is rejected before its fragment shader runs.
+	def drawDepth(self, ntris):
+		buf  = self.buf[0]
+		mask = (GLboolean * 4)()
+		opengles.glGetBooleanv(GL_COLOR_WRITEMASK, mask)
+		opengles.glColorMask(GLboolean(0), GLboolean(0), GLboolean(0),
+		  GLboolean(0))
+		count, buf.ntris = buf.ntris, ntris
+		self.draw()
+		buf.ntris = count
+		opengles.glColorMask(*mask)
+
+	# Draw over the triangles drawDepth() left in the depth buffer (whose
+	# depths match exactly, failing pi3d's default 'less than' test).
+	def drawOver(self):
+		opengles.glDepthFunc(GL_LEQUAL)
+		self.draw()
+		opengles.glDepthFunc(GL_LESS)
+
+
+# Mesh holding a copy of another Mesh's geometry for each of several eyes,
+# all drawn in one call with the 'batch' shader (shaders/batch.vs) rather
+# than a Shape.draw() per eye, each with its own matrix math and uniform,
+# attribute and texture setup in pi3d's Python.  Each copy's texture U is
+# offset by 4 x its eye index, which is how the shader tells eyes apart;
+# per-eye transforms (position, gaze rotation, mirroring, texture offset,
+# morph weights) go to the shader in a uniform array, 'eyes'.  Mirrored
+# copies have their triangles wound the other way, as the shader flips
+# their X.  Geometry differing per eye (iris, eyelids) is loaded into each
+# copy with load(), or copied from another eye's copy, and all of a
+# frame's changes uploaded with one flush() (GLES2 has no instancing or
+# buffer-to-buffer copies, so an eye can't draw another's copy).  With 'morph' set, the
+# source holds morph targets (see morphInit()) and eyes[:, 2] their
+# weights.  Every copy's first edgeTris triangles (see meshInit()) are
+# put ahead of all the others, so drawDepth() can draw all eyes' eyelid
+# bands at once.
+class BatchMesh(Mesh):
+
+	MAX_EYES = 8 # BATCH_EYES in batch.vs
+
+	def __init__(self, source, mirror, shader, morph=False):
+		super(BatchMesh, self).__init__()
+		src   = source.buf[0]
+		count = len(mirror)
+		if count > self.MAX_EYES:
+			raise ValueError("BatchMesh holds at most %d eyes" % self.MAX_EYES)
+		n     = len(src.array_buffer)
+		verts = np.tile(src.array_buffer, (count, 1))
+		verts[:, 6] += np.repeat(np.arange(count) * 4.0, n)
+		faces = []
+		for i in range(count):
+			f = src.element_array_buffer + i * n
+			faces.append(f[:, ::-1] if mirror[i] else f)
+		lead  = source.edgeTris
+		faces = [f[:lead] for f in faces] + [f[lead:] for f in faces]
+		self.buf = [pi3d.Buffer(self, verts[:, 0:3], verts[:, 6:8],
+		  np.concatenate(faces), verts[:, 3:6], False)]
+		self.edgeTris = lead * count
+		self.set_textures(src.textures)
+		self.set_shader(shader)
+		if morph: self.set_custom_data(48, [0.0, 0.0, 1.0])
+		self.vertsPerEye = n
+		self.eyes = np.zeros((count, 3, 4), dtype=np.float32)
+		self.eyes[:, 0, 1] = self.eyes[:, 0, 3] = 1.0 # cos 0
+		self.scale = np.where(mirror, -1.0, 1.0) # X scale
+		self.eyes[:, 1, 2] = self.scale
+		self.uniform = None # Location of 'eye' in shader
+		self.pending = None # Rows loaded since last flush() (lo, hi)
+
+	# Vertex positions of every eye's copy (eyes x vertsPerEye x 3 view)
+	def eyeVerts(self):
+		return self.buf[0].array_buffer[:, 0:3].reshape(len(self.scale),
+		  self.vertsPerEye, 3)
+
+	# Load eye 'eye's copy with vertex positions 'verts', as update() but
+	# leaving the upload to flush().
+	def load(self, eye, verts):
+		first = eye * self.vertsPerEye
+		pos   = self.buf[0].array_buffer[first:first + len(verts), 0:3]
+		moved = np.flatnonzero((pos != verts).any(axis=1))
+		if len(moved) == 0: return
+		lo, hi = moved[0], moved[-1] + 1
+		pos[lo:hi] = verts[lo:hi]
+		lo, hi = first + lo, first + hi
+		if self.pending is not None:
+			lo, hi = min(lo, self.pending[0]), max(hi, self.pending[1])
+		self.pending = (lo, hi)
+
+	# Upload all rows changed by load() since the last flush(), in one call
+	def flush(self):
+		if self.pending is not None:
+			self.upload(*self.pending)
+			self.pending = None
+
+	# Set eyes' positions (N x 2 pixels) and texture U offsets
+	def setPositions(self, positions, texOffsets=None):
+		self.eyes[:, 1, 0:2] = positions
+		if texOffsets is not None: self.eyes[:, 1, 3] = texOffsets
+
+	# Set eyes' X and Y rotation (N x 2 degrees)
+	def setRotation(self, rotation):
+		r = np.radians(rotation)
+		self.eyes[:, 0, 0] = np.sin(r[:, 0])
+		self.eyes[:, 0, 1] = np.cos(r[:, 0])
+		self.eyes[:, 0, 2] = np.sin(r[:, 1])
+		self.eyes[:, 0, 3] = np.cos(r[:, 1])
+
+	# Hide eyes flagged True in array 'hidden' (and show the others):
+	# their copies' X scale is 0, so their triangles draw nothing.
+	def setHidden(self, hidden):
+		self.eyes[:, 1, 2] = np.where(hidden, 0.0, self.scale)
+
+	# Set eyes' morph weight spans (arrays of N lows and highs)
+	def setMorph(self, lo, hi=None):
+		if hi is None: hi = lo
+		self.eyes[:, 2, 0] = np.clip(lo, 0.0, 1.0)
+		self.eyes[:, 2, 1] = np.clip(hi, 0.0, 1.0)
+
+	# Pass 'eyes' to the shader; its uniforms keep their values until
+	# set again, through pi3d's own setup in draw().
+	def loadUniforms(self):
+		if self.uniform is None:
+			self.uniform = opengles.glGetUniformLocation(self.shader.program,
+			  b"eye")
+		self.shader.use()
+		opengles.glUniform4fv(self.uniform, GLsizei(self.eyes.size // 4),
+		  self.eyes.ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
+
+	def draw(self, *args, **kwargs):
+		self.loadUniforms()
+		super(BatchMesh, self).draw(*args, **kwargs)
+
+
 # Generate mesh between two point lists. U axis steps are determined
 # by number of points, V axis determined by 'steps'
 def pointsMesh(points0, points1, points2, steps, z, closed, flip=False):
-	if steps < 2: steps = 2
-	np1 = len(points1)
-	np2 = len(points2)
-	if np2 < np1: np1 = np2
-	if np1 < 1  : return None
+	return tupleList(arrayMesh(pointsArray(points0), pointsArray(points1),
+	  pointsArray(points2), steps, z, flip))
 
-	verts = []
 
+# Array version of pointsMesh(); returns an N x 3 float32 vertex array
+# (optional points0 edge row first at Z=0, then 'steps' rows interpolated
+# from points1 to points2 at the given Z) suitable for Shape.re_init().
+# If flip is True, the mesh is mirrored on the X axis with point order
+# reversed so triangle winding is preserved.
+def arrayMesh(points0, points1, points2, steps, z, flip=False):
+	if steps < 2: steps = 2
+	np1 = min(len(points1), len(points2))
+	if np1 < 1: return None
+	points1 = points1[:np1]
+	points2 = points2[:np1]
 	if flip is True:
-		if points0 is not None:
-			for p in reversed(points0):
-				verts.append((-p[0], p[1], 0))
-
-		div = float(steps - 1)
-		for y in range(steps):
-			pList = pointsInterp(points1, points2, y / div)
-			for x in reversed(range(np1)):
-				verts.append((-pList[x][0], pList[x][1], z))
-	else:
-		if points0 is not None:
-			for p in points0:
-				verts.append((p[0], p[1], 0))
-
-		div = float(steps - 1)
-		for y in range(steps):
-			pList = pointsInterp(points1, points2, y / div)
-			for x in range(np1):
-				verts.append((pList[x][0], pList[x][1], z))
+		if points0 is not None: points0 = points0[::-1]
+		points1 = points1[::-1]
+		points2 = points2[::-1]
+
+	ne    = 0 if points0 is None else len(points0)
+	verts = np.empty((ne + steps * np1, 3), dtype=np.float32)
+	if ne > 0:
+		verts[:ne, 0:2] = points0
+		verts[:ne, 2]   = 0
+	# Row y is points1 + (points2 - points1) * y / (steps - 1), same
+	# weighting as pointsInterp(), computed for all rows at once.
+	rows = verts[ne:].reshape(steps, np1, 3)
+	w    = np.linspace(0.0, 1.0, steps).astype(np.float32)
+	rows[:, :, 0:2]  = points2 - points1
+	rows[:, :, 0:2] *= w[:, None, None]
+	rows[:, :, 0:2] += points1
+	rows[:, :, 2]    = z
+	if flip is True: verts[:, 0] *= -1.0
 
 	return verts
 
 
+# Morph targets for a mesh drawn with the 'morph' shader, which moves
+# vertices on the GPU instead of regenerating them per weight on the CPU.
+# Returns two N x 3 float32 arrays, for the vertex and normal attributes:
+# the first is arrayMesh(points0, points1, points2, ...) and the second
+# holds X/Y of the same mesh built from points3 and points4 instead; the
+# shader interpolates X/Y between the two by weight.  If 'span' is True,
+# normal Z holds each row's fraction of the way from points1 to points2,
+# which the shader uses to spread the rows across a span of weights
+# (eyelids); otherwise it's 0 and all rows use the low weight (iris).
+def morphArrays(points0, points1, points2, points3, points4, steps, z, span,
+  flip=False):
+	verts = arrayMesh(points0, points1, points2, steps, z, flip)
+	morph = arrayMesh(points0, points3, points4, steps, z, flip)
+	if verts is None or morph is None: return None, None
+	morph[:, 2] = 0.0
+	if span is True:
+		ne   = 0 if points0 is None else len(points0)
+		rows = morph[ne:].reshape(max(steps, 2), -1, 3)
+		rows[:, :, 2] = np.linspace(0.0, 1.0, len(rows))[:, None]
+	return verts, morph
+
+# Iris and eyelid meshes only ever regenerate in steps of the regen
+# thresholds computed at startup (about 1/4 pixel of motion), so the
+# weights driving them can be quantized to those steps and the resulting
+# vertex arrays reused: a blink then revisits the same handful of lid
+# positions, and a pupil oscillating within its range revisits the same
+# sizes.  MeshCache holds ready-to-upload vertex arrays keyed by quantized
+# weight(s) plus the mirror flag, filled lazily and bounded in size (least
+# recently used arrays are dropped first).  One cache can serve any number
+# of eyes; cached arrays are read-only, Mesh.update() copies from them.
+# 'build' is a function taking a list of (de-quantized) weights and the
+# flip flag, returning a vertex array; see irisCache() and lidCache().
+class MeshCache(object):
+
+	def __init__(self, threshold, build, maxSize=256):
+		self.threshold = threshold
+		self.build     = build
+		self.maxSize   = maxSize
+		self.meshes    = OrderedDict()
+		self.hits      = 0
+		self.misses    = 0
+
+	# Quantize weight (0.0 to 1.0) to an integer step index
+	def step(self, weight):
+		if   weight < 0.0: weight = 0.0
+		elif weight > 1.0: weight = 1.0
+		if self.threshold <= 0: return weight # Not quantized
+		return int(weight / self.threshold + 0.5)
+
+	# Inverse of step(); weight (0.0 to 1.0) for a given step index
+	def weight(self, step):
+		if self.threshold <= 0: return step
+		return min(step * self.threshold, 1.0)
+
+	# Return vertex array for a tuple of step indices (as returned by
+	# step()), generating and caching it if not already present.
+	def get(self, steps, flip=False):
+		key  = (steps, flip)
+		mesh = self.meshes.pop(key, None)
+		if mesh is None:
+			self.misses += 1
+			mesh = self.build([self.weight(s) for s in steps], flip)
+			mesh.flags.writeable = False
+			if len(self.meshes) >= self.maxSize:
+				self.meshes.popitem(last=False)
+		else:
+			self.hits += 1
+		self.meshes[key] = mesh # (Re)insert as most recently used
+		return mesh
+
+
+# MeshCache for an iris: mesh between pupil (interpolated between min and
+# max sizes by a single weight) and iris edge, at depth z.
+def irisCache(pupilMin, pupilMax, iris, steps, z, threshold, maxSize=256):
+	def build(w, flip):
+		return arrayMesh(None, arrayInterp(pupilMin, pupilMax, w[0]),
+		  iris, steps, z, flip)
+	return MeshCache(threshold, build, maxSize)
+
+
+# MeshCache for an eyelid: edge row plus mesh spanning two lid positions
+# (each interpolated between open and closed), keyed by a (lower, upper)
+# pair of steps; rows in-between cover the lid's motion since last regen.
+def lidCache(edge, open, closed, steps, threshold, maxSize=256):
+	def build(w, flip):
+		return arrayMesh(edge, arrayInterp(open, closed, w[0]),
+		  arrayInterp(open, closed, w[1]), steps, 0, flip)
+	return MeshCache(threshold, build, maxSize)
+
+
+# Morph targets for the same iris geometry as irisCache(); shader weight
+# is pupil size.
+def irisMorph(pupilMin, pupilMax, iris, steps, z):
+	return morphArrays(None, pupilMin, iris, pupilMax, iris, steps, z, False)
+
+
+# Morph targets for the same eyelid geometry as lidCache(); shader weights
+# are the (lower, upper) span of lid positions since the last frame.
+def lidMorph(edge, open, closed, steps, flip=False):
+	return morphArrays(edge, open, open, closed, closed, steps, 0, True, flip)
+
+
+# Vertical extent of the region between two paths (e.g. an eyelid's edge
+# and lip), closed into a ring by joining their ends, in the columns at
+# X positions 'xs': (low, high) arrays of Y, low > high where a column
+# misses it.  A column is assumed to cross the region once, as eyelids'.
+def bandSpan(path1, path2, xs):
+	ring   = np.concatenate((path1, path2[::-1], path1[:1]))
+	x0, y0 = ring[:-1, 0], ring[:-1, 1]
+	x1, y1 = ring[1:, 0], ring[1:, 1]
+	x      = xs[:, None]
+	hit    = (np.minimum(x0, x1) <= x) & (x < np.maximum(x0, x1))
+	dx     = np.where(x1 != x0, x1 - x0, 1.0)
+	y      = y0 + (y1 - y0) * (x - x0) / dx
+	return (np.where(hit, y, np.inf).min(axis=1),
+	        np.where(hit, y, -np.inf).max(axis=1))
+
+
 # This function determines the Z depth and angle-from-Z axis of an SVG
 # feature (ostensibly a circle, polygonalized by getPoints()); for example,
 # the depth of the iris, or the start and end angles for the curve that's
@@ -222,3 +745,57 @@ def zangle(points, r1):
 
 	return (z, angle)
 
+
+# Offscreen render target for one eye: a size x size framebuffer object
+# (color texture plus depth buffer), to render straight at (a multiple
+# of) the SPI screen resolution rather than into a large multisampled
+# display of which only the inset squares are used (see panelout.py).
+# Shapes are drawn with the usual camera; begin() sets the viewport so
+# the display's square at x, y (pixels from lower left) and 'span' pixels
+# across fills the target, e.g. one eye's bounding square.
+class RenderTarget(object):
+
+	def __init__(self, size, display, x, y, span):
+		self.size    = size
+		self.display = display
+		k            = float(size) / span
+		self.viewport = (GLint(int(round(-x * k))), GLint(int(round(-y * k))),
+		  GLsizei(int(round(display.width * k))),
+		  GLsizei(int(round(display.height * k))))
+		self.framebuffer = GLuint()
+		self.depth       = GLuint()
+		self.color       = GLuint()
+		opengles.glGenTextures(1, ctypes.byref(self.color))
+		opengles.glBindTexture(GL_TEXTURE_2D, self.color)
+		opengles.glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER,
+		  GL_NEAREST) # No mipmaps
+		opengles.glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, size, size, 0,
+		  GL_RGBA, GL_UNSIGNED_BYTE, None)
+		opengles.glBindTexture(GL_TEXTURE_2D, 0)
+		opengles.glGenRenderbuffers(1, ctypes.byref(self.depth))
+		opengles.glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+		opengles.glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT16,
+		  size, size)
+		opengles.glGenFramebuffers(1, ctypes.byref(self.framebuffer))
+		opengles.glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+		opengles.glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+		  GL_TEXTURE_2D, self.color, 0)
+		opengles.glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT,
+		  GL_RENDERBUFFER, self.depth)
+		opengles.glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+	# Direct drawing to target, cleared to display's background color
+	def begin(self):
+		self.bind()
+		opengles.glViewport(*self.viewport)
+		opengles.glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+	# Make target current for reading (e.g. glReadPixels)
+	def bind(self):
+		opengles.glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+
+	# Resume drawing to display
+	def end(self):
+		opengles.glBindFramebuffer(GL_FRAMEBUFFER, 0)
+		opengles.glViewport(GLint(0), GLint(0),
+		  GLsizei(self.display.width), GLsizei(self.display.height))
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+
+# Headless runner and per-frame benchmark for eyes.py and cyclops.py.
+# Swaps in stub RPi.GPIO and Adafruit_ADS1x15 modules (no buttons pressed,
+# fixed analog readings) and, by default, a no-op display: shaders,
+# keyboard and GL draw calls are stubbed out but everything up to them
+# (geometry regen, mesh uploads to the vertex arrays, matrix math) runs
+# for real.  The renderer's clock is simulated, its frame pacer (see
+# framepace.py) advancing it a fixed frame period per frame rather than
+# sleeping, and the RNG is seeded, so a given seed and frame count
+# always renders the same animation; only the measured time varies.
+# Reports frames/s, frame time percentiles, iris/eyelid regen counts and
+# idle frames (skipped, nothing having moved).
+#
+# Usage: python headless.py [eyes|cyclops] [--frames N] [--seed N]
+#          [--fps N] [--display none|x11] [--json]
+#          [--workload idle|blinkstorm|sweep] [--record FILE | --replay FILE]
+#          [--profile]
+# --display x11 opens a real pi3d display instead (e.g. under xvfb-run,
+# with LIBGL_ALWAYS_SOFTWARE=1 for Mesa's llvmpipe), to include GL time.
+# --workload scripts the inputs: blink buttons pressed over and over, or
+# the joystick swept back and forth.  --record saves the run's inputs to
+# a trace file (see inputtrace.py); --replay runs the renderer on a
+# recorded trace (renderer, seed and workload come from the trace, if
+# recorded there), to compare the same workload across code versions.
+
+import argparse
+import ctypes
+import imp
+import json
+import os
+import random
+import sys
+import time
+import types
+import numpy as np
+from framepace import FramePacer
+from buttons import ButtonSnapshot, ButtonState
+from inputtrace import *
+from profiler import Profiler
+
+
+# Stub hardware modules ----------------------------------------------------
+
+class StubGPIO(types.ModuleType):
+	BCM     = 11
+	IN      = 1
+	OUT     = 0
+	PUD_UP  = 22
+	LOW     = 0
+	HIGH    = 1
+
+	BOTH    = 33
+
+	def setmode(self, mode): pass
+	def setup(self, pin, mode, pull_up_down=None): pass
+	def input(self, pin): return self.HIGH # Buttons are active low
+	def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+		pass
+
+class StubADS1015(object):
+	def __init__(self, *args, **kwargs): pass
+	def read_adc(self, channel, gain=1, data_rate=None):
+		time.sleep(0.004) # About one conversion at data_rate=250
+		return 825         # Mid-range for 0-3.3V inputs
+
+def installStubs():
+	rpi      = types.ModuleType("RPi")
+	rpi.GPIO = StubGPIO("RPi.GPIO")
+	ads      = types.ModuleType("Adafruit_ADS1x15")
+	ads.ADS1015 = ads.ADS1115 = StubADS1015
+	sys.modules["RPi"]              = rpi
+	sys.modules["RPi.GPIO"]         = rpi.GPIO
+	sys.modules["Adafruit_ADS1x15"] = ads
+	# Renderers use pi3d.GL_LINEAR, which pi3d releases after 2.2x no
+	# longer re-export from pi3d.constants.
+	import pi3d
+	if not hasattr(pi3d, "GL_LINEAR"):
+		pi3d.GL_LINEAR = pi3d.constants.GL_LINEAR
+
+
+# Simulated clock: time() only advances when sleep() is called, which the
+# renderer's FramePacer does once per frame to reach the frame deadline.
+class SimClock(object):
+	def __init__(self):
+		self.now = 1000.0
+	def time(self): return self.now
+	def sleep(self, seconds): self.now += seconds
+
+
+# No-op display ------------------------------------------------------------
+
+class NullOpenGL(object):
+	gl_id            = b"GLES2"
+	max_texture_size = ctypes.c_int(2048)
+
+class NullDisplay(object):
+	def __init__(self, w=1280, h=720):
+		self.width, self.height = w, h
+		self.near, self.far, self.fov = 1.0, 1000.0, 45.0
+		self.opengl        = NullOpenGL()
+		self.textures_dict = {}
+		self.vbufs_dict    = {}
+		self.ebufs_dict    = {}
+		self.tidy_needed   = False
+	def set_background(self, r, g, b, alpha): pass
+	def loop_running(self): return True
+	def stop(self): pass
+
+class NullShader(object):
+	def __init__(self, *args, **kwargs): pass
+
+class NullKeyboard(object):
+	def read(self): return -1
+	def close(self): pass
+
+# Replace display-dependent parts of pi3d; must precede renderer import.
+# Buffers never load to GL, so Mesh.upload() only touches the arrays.
+def installNullDisplay(w, h):
+	import pi3d
+	import gfxutil
+	disp = NullDisplay(w, h)
+	pi3d.Display.Display.INSTANCE = disp
+	pi3d.Display.create = lambda *args, **kwargs: disp
+	pi3d.Shader         = NullShader
+	pi3d.Keyboard       = NullKeyboard
+	pi3d.Buffer.draw    = lambda self, *args, **kwargs: None
+	gfxutil.BatchMesh.loadUniforms = lambda self: None
+	return disp
+
+
+# Scripted input workloads -------------------------------------------------
+
+# Buttons pressed for 'hold' seconds every 'period' seconds, each pin in
+# turn (so eyes.py winks each eye, then blinks both).
+class BlinkStorm(object):
+	def __init__(self, clock, pins, period=0.3, hold=0.1):
+		self.clock  = clock
+		self.pins   = [p for p in pins if p >= 0]
+		self.period = period
+		self.hold   = hold
+		self.prev   = None
+		self.states = None
+	def snapshot(self):
+		now    = self.clock.time()
+		cycle  = self.period * len(self.pins)
+		states = {}
+		for i, pin in enumerate(self.pins):
+			t       = now - i * self.period
+			n       = int(t // cycle)
+			press   = n * cycle + i * self.period
+			pressed = now - press < self.hold
+			states[pin] = ButtonState(pressed, press,
+			  None if pressed else press + self.hold, n + 1)
+		snap = ButtonSnapshot(now, self.prev, states, self.states)
+		self.prev   = now
+		self.states = states
+		return snap
+
+# Joystick swept corner to corner: triangle waves on ADC channels 0 and 1
+# (X and Y) at different rates, so the path covers the whole range.
+class JoystickSweep(object):
+	rates = (0.45, 0.3) # Sweeps/second
+	def value(self, channel, t):
+		x = (t * self.rates[channel]) % 1.0
+		return 1.0 - abs(x * 2.0 - 1.0)
+
+def installWorkload(mod, workload, clock):
+	if workload == "blinkstorm":
+		mod.AUTOBLINK = False
+		mod.buttons   = BlinkStorm(clock, [getattr(mod, name, -1) for name in
+		  ("WINK_L_PIN", "WINK_R_PIN", "BLINK_PIN")])
+	elif workload == "sweep":
+		mod.JOYSTICK_X_IN, mod.JOYSTICK_Y_IN = 0, 1
+		mod.adc = JoystickSweep()
+
+
+# Benchmark ----------------------------------------------------------------
+
+class Done(Exception): pass
+
+# Import renderer script as a module; this runs all its setup, but not
+# its main loop (see mainLoop() there), as it's not __main__.
+def loadRenderer(name):
+	path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	  name + ".py")
+	return imp.load_source(name, path)
+
+# Run renderer's main loop until 'frames' frames have been drawn; returns
+# list of per-frame times in seconds (real clock, not simulated).
+def runFrames(mod, frames):
+	times = []
+	frame = mod.frame
+	def timedFrame(p):
+		if len(times) >= frames: raise Done()
+		t0 = timer()
+		frame(p)
+		times.append(timer() - t0)
+	mod.frame = timedFrame
+	try:
+		mod.mainLoop()
+	except (Done, TraceEnd):
+		pass
+	finally:
+		mod.frame = frame
+	return times
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+	  description="Run eyes.py or cyclops.py headless and time frames.")
+	parser.add_argument("renderer", nargs="?", default="eyes",
+	  choices=("eyes", "cyclops"))
+	parser.add_argument("--frames" , type=int, default=2000)
+	parser.add_argument("--seed"   , type=int, default=1)
+	parser.add_argument("--fps"    , type=float, default=60.0,
+	  help="simulated frame rate (animation time step)")
+	parser.add_argument("--display", default="none",
+	  choices=("none", "x11"))
+	parser.add_argument("--width"  , type=int, default=1280)
+	parser.add_argument("--height" , type=int, default=720)
+	parser.add_argument("--json"   , action="store_true",
+	  help="print results as one JSON object")
+	parser.add_argument("--workload", default="idle",
+	  choices=("idle", "blinkstorm", "sweep"))
+	parser.add_argument("--profile", action="store_true",
+	  help="print per-stage frame times (see profiler.py)")
+	trace = parser.add_mutually_exclusive_group()
+	trace.add_argument("--record"  , metavar="FILE",
+	  help="record inputs to trace file")
+	trace.add_argument("--replay"  , metavar="FILE",
+	  help="replay inputs from trace file")
+	args = parser.parse_args()
+	if args.replay:
+		# Traces recorded by the renderers themselves (TRACE_RECORD)
+		# have no seed or workload, and older ones no renderer; those
+		# come from the command line instead.
+		header = traceHeader(args.replay)
+		for key in ("renderer", "seed", "workload"):
+			if header.get(key) is not None: setattr(args, key, header[key])
+
+	installStubs()
+	clock = SimClock()
+	if args.display == "none":
+		installNullDisplay(args.width, args.height)
+	random.seed(args.seed)
+	np.random.seed(args.seed)
+
+	t0  = timer()
+	mod = loadRenderer(args.renderer)
+	setupTime = timer() - t0
+	mod.time  = clock
+	mod.pacer = FramePacer(args.fps, clock.time, clock.sleep)
+	installWorkload(mod, args.workload, clock)
+	if args.profile:
+		profiler = Profiler()
+		for name, func in mod.profiler.gauges: profiler.gauge(name, func)
+		mod.profiler = profiler
+	config = mod.traceConfig
+	for key in config: config[key] = getattr(mod, key)
+	if args.replay:
+		for key in config: setattr(mod, key, header[key])
+		mod.time, mod.random, mod.adc, mod.buttons = replayInputs(
+		  args.replay, dict((key, header[key]) for key in config), False)
+	elif args.record:
+		config.update(renderer=args.renderer, seed=args.seed,
+		  workload=args.workload)
+		mod.time, mod.random, mod.adc, mod.buttons = recordInputs(
+		  args.record, config, mod.time, mod.random, mod.adc, mod.buttons)
+
+	times = np.array(runFrames(mod, args.frames))
+
+	rig    = mod.rig
+	caches = [rig.irisMeshes] + rig.lidCaches
+	ms     = np.percentile(times, (50, 95, 99)) * 1000.0
+	result = {
+	  "renderer"    : args.renderer,
+	  "display"     : args.display,
+	  "frames"      : len(times),
+	  "seed"        : args.seed,
+	  "workload"    : args.workload,
+	  "setup_ms"    : setupTime * 1000.0,
+	  "fps"         : len(times) / times.sum(),
+	  "p50_ms"      : ms[0],
+	  "p95_ms"      : ms[1],
+	  "p99_ms"      : ms[2],
+	  "max_ms"      : times.max() * 1000.0,
+	  "iris_regens" : rig.irisRegens(),
+	  "lid_regens"  : rig.lidRegens(),
+	  "cache_hits"  : sum(c.hits for c in caches),
+	  "cache_misses": sum(c.misses for c in caches),
+	  "idle_frames" : getattr(mod, "idleFrames", 0) }
+
+	if args.json:
+		print(json.dumps(result, sort_keys=True))
+	else:
+		print("%s, %d frames, seed %d, %s workload, display %s "
+		  "(setup %.1f ms)" % (args.renderer, result["frames"], args.seed,
+		  args.workload, args.display, result["setup_ms"]))
+		print("  %.1f frames/s; frame time p50 %.3f ms, p95 %.3f ms, "
+		  "p99 %.3f ms, max %.3f ms" % (result["fps"], result["p50_ms"],
+		  result["p95_ms"], result["p99_ms"], result["max_ms"]))
+		print("  regens: iris %d, eyelid %d; mesh cache %d hits, "
+		  "%d misses; %d idle frames (not drawn)" % (result["iris_regens"],
+		  result["lid_regens"], result["cache_hits"], result["cache_misses"],
+		  result["idle_frames"]))
+	if args.profile: mod.profiler.dump()
+	if args.record: mod.time.trace.close()
+	sys.stdout.flush()
+	os._exit(0) # Skip pi3d object teardown; there's no GL context to free
@@ -0,0 +1,242 @@
+#!/usr/bin/python
+
+# Input recording and replay.  What the renderers draw depends on the
+# clock, random numbers, ADC readings and button presses, so no two runs
+# are alike and their frame times and regen counts can't be compared.
+# recordInputs() wraps each of those sources to log every value the
+# renderer consumes to a compact binary trace file; replayInputs() returns
+# stand-ins that feed the same values back, so a replay draws exactly the
+# same frames, either at the recorded pace or as fast as possible.  Traces
+# of particular workloads (e.g. headless.py --workload blinkstorm) make
+# repeatable benchmarks.
+#
+# File format: 4-byte magic, 1-byte version, 4-byte length and JSON header
+# (renderer input config, so a replay can check it matches), then records
+# in the order consumed, each a 1-byte kind and little-endian payload:
+#   T  double           time.time()
+#   R  double           random.random() (uniform() derives from it)
+#   A  uint8, double    ADC channel, value (ADCSampler.value())
+#   S  double, double,  button snapshot time, previous snapshot time,
+#      uint8 n, then n  number of buttons, then per button: pin, pressed,
+#      x (int8, uint8,  press and release times, press count
+#      double, double,
+#      uint32)
+#   U  double, double   button snapshot, states unchanged from the last S
+# Times that are None are stored as NaN.  Records are replayed per kind
+# in order, so e.g. a version that reads the clock once more per frame
+# still replays the same random numbers and button presses.
+
+import atexit
+import collections
+import json
+import math
+import struct
+import time
+from buttons import ButtonSnapshot, ButtonState
+
+MAGIC   = b"EYTR"
+VERSION = 1
+NAN     = float("nan")
+
+
+class TraceError(Exception): pass
+
+# Raised by replay stand-ins when the trace has no more values to give
+class TraceEnd(Exception): pass
+
+
+def packTime(t): return NAN if t is None else t
+def unpackTime(t): return None if math.isnan(t) else t
+
+
+class TraceWriter(object):
+
+	def __init__(self, path, header):
+		self.file = open(path, "wb")
+		h = json.dumps(header, sort_keys=True).encode("utf-8")
+		self.file.write(MAGIC + struct.pack("<BI", VERSION, len(h)) + h)
+		atexit.register(self.close)
+
+	def write(self, kind, fmt, *values):
+		self.file.write(kind + struct.pack("<" + fmt, *values))
+
+	def close(self):
+		if not self.file.closed: self.file.close()
+
+
+# Read whole trace into a deque of values per kind
+class TraceReader(object):
+
+	def __init__(self, path):
+		with open(path, "rb") as f:
+			data = f.read()
+		if data[0:4] != MAGIC: raise TraceError(path + ": not a trace file")
+		version, n = struct.unpack_from("<BI", data, 4)
+		if version != VERSION:
+			raise TraceError("%s: trace version %d, expected %d" %
+			  (path, version, VERSION))
+		self.header  = json.loads(data[9:9 + n].decode("utf-8"))
+		self.streams = dict((k, collections.deque()) for k in "TRAS")
+		last = {} # Button states of last S record
+		i = 9 + n
+		while i < len(data):
+			kind = data[i:i + 1].decode("ascii")
+			i += 1
+			if kind == "T" or kind == "R":
+				value = struct.unpack_from("<d", data, i)[0]
+				i += 8
+			elif kind == "A":
+				value = struct.unpack_from("<Bd", data, i)
+				i += 9
+			elif kind == "S":
+				now, prev, count = struct.unpack_from("<ddB", data, i)
+				i += 17
+				states = {}
+				for j in range(count):
+					pin, pressed, pt, rt, presses = struct.unpack_from(
+					  "<bBddI", data, i)
+					i += 22
+					states[pin] = ButtonState(bool(pressed), unpackTime(pt),
+					  unpackTime(rt), presses)
+				value = (now, unpackTime(prev), states)
+				last  = states
+			elif kind == "U":
+				now, prev = struct.unpack_from("<dd", data, i)
+				i += 16
+				value = (now, unpackTime(prev), last)
+				kind  = "S"
+			else:
+				raise TraceError("%s: bad record at offset %d" % (path, i - 1))
+			self.streams[kind].append(value)
+
+	def next(self, kind):
+		try:
+			return self.streams[kind].popleft()
+		except IndexError:
+			raise TraceEnd()
+
+
+# Recording wrappers -------------------------------------------------------
+
+class RecordingClock(object):
+	def __init__(self, clock, trace):
+		self.clock, self.trace = clock, trace
+	def time(self):
+		t = self.clock.time()
+		self.trace.write(b"T", "d", t)
+		return t
+	def sleep(self, seconds): self.clock.sleep(seconds)
+
+# uniform() as in the random module, drawing from the subclass's random()
+class TraceRandom(object):
+	def uniform(self, a, b):
+		return a + (b - a) * self.random()
+
+class RecordingRandom(TraceRandom):
+	def __init__(self, source, trace):
+		self.source, self.trace = source, trace
+	def random(self):
+		v = self.source.random()
+		self.trace.write(b"R", "d", v)
+		return v
+
+class RecordingADC(object):
+	def __init__(self, adc, trace):
+		self.adc, self.trace = adc, trace
+	def value(self, channel, t):
+		v = self.adc.value(channel, t)
+		self.trace.write(b"A", "Bd", channel, v)
+		return v
+	def age(self, channel): # Not recorded; only read by metrics
+		return self.adc.age(channel)
+
+class RecordingButtons(object):
+	def __init__(self, buttons, trace):
+		self.buttons, self.trace = buttons, trace
+		self.last = None
+	def snapshot(self):
+		s = self.buttons.snapshot()
+		if s.states == self.last:
+			self.trace.write(b"U", "dd", s.time, packTime(s.prevTime))
+			return s
+		self.last = s.states
+		self.trace.write(b"S", "ddB", s.time, packTime(s.prevTime),
+		  len(s.states))
+		for pin, b in sorted(s.states.items()):
+			self.trace.write(b"", "bBddI", pin, b.pressed,
+			  packTime(b.pressTime), packTime(b.releaseTime), b.presses)
+		return s
+
+
+# Replay stand-ins ---------------------------------------------------------
+
+# With realtime set, time() waits until the recorded time comes round
+# again (relative to the first), so the replay runs at the recorded pace.
+class ReplayClock(object):
+	def __init__(self, trace, realtime):
+		self.trace    = trace
+		self.realtime = realtime
+		self.offset   = None # Real time minus recorded time
+	def time(self):
+		t = self.trace.next("T")
+		if self.realtime:
+			if self.offset is None: self.offset = time.time() - t
+			wait = t + self.offset - time.time()
+			if wait > 0: time.sleep(wait)
+		return t
+	def sleep(self, seconds):
+		if self.realtime: time.sleep(seconds)
+
+class ReplayRandom(TraceRandom):
+	def __init__(self, trace):
+		self.trace = trace
+	def random(self):
+		return self.trace.next("R")
+
+class ReplayADC(object):
+	def __init__(self, trace):
+		self.trace = trace
+	def value(self, channel, t):
+		c, v = self.trace.next("A")
+		if c != channel:
+			raise TraceError("ADC channel %d read, trace has %d" % (channel, c))
+		return v
+	def age(self, channel): return None # No live samples
+
+class ReplayButtons(object):
+	def __init__(self, trace):
+		self.trace = trace
+		self.prev  = None
+	def snapshot(self):
+		now, prevTime, states = self.trace.next("S")
+		snap = ButtonSnapshot(now, prevTime, states, self.prev)
+		self.prev = states
+		return snap
+
+
+# Wrap renderer input sources (its time module, random module, ADCSampler
+# or None, and Buttons) to record everything they return to file 'path';
+# returns wrapped sources in the same order.  'header' is the renderer's
+# input config, checked on replay.
+def recordInputs(path, header, clock, rng, adc, buttons):
+	trace = TraceWriter(path, header)
+	return (RecordingClock(clock, trace), RecordingRandom(rng, trace),
+	  RecordingADC(adc, trace) if adc else None,
+	  RecordingButtons(buttons, trace))
+
+# Return header (dict) of trace file 'path'
+def traceHeader(path):
+	return TraceReader(path).header
+
+# Return stand-ins for the same sources, replaying trace file 'path'.
+# Raises TraceError if its header doesn't match 'header' (e.g. a joystick
+# was configured when recording but isn't now).  Stand-ins raise TraceEnd
+# at the end of the trace.
+def replayInputs(path, header, realtime=True):
+	trace = TraceReader(path)
+	for key, value in header.items():
+		if trace.header.get(key) != value:
+			raise TraceError("%s: recorded with %s = %r, now %r" %
+			  (path, key, trace.header.get(key), value))
+	return (ReplayClock(trace, realtime), ReplayRandom(trace),
+	  ReplayADC(trace), ReplayButtons(trace))
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+# Live metrics for unattended installations.  The only telemetry used to
+# be fbx2 -s printing its own copy rate, which says nothing about the
+# renderer.  FrameStats records each frame's start and work time (two
+# clock reads and two array stores per frame); a MetricsServer thread
+# answers requests on a localhost TCP port (HTTP) or a Unix socket with a
+# plain text snapshot: render frame rate, frame time percentiles and any
+# counters registered with gauge() (regens, late frames, ADC sample age,
+# blinks...), one 'name value' line each in Prometheus text format, so
+# e.g. 'curl -s localhost:8000' or 'nc -U /tmp/eyes.sock' can scrape it.
+# The render thread never waits on the server; the server reads the
+# stats as they stand.
+
+import os
+import sys
+import threading
+import numpy as np
+from framepace import monotonicClock
+try:
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+	from SocketServer import UnixStreamServer, StreamRequestHandler
+except ImportError:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+	from socketserver import UnixStreamServer, StreamRequestHandler
+
+
+# Frame start times and work times (start to end, excluding the pacer's
+# sleep) of the last 'window' frames, written by the render thread.
+class FrameStats(object):
+
+	def __init__(self, window=600, clock=None):
+		self.clock  = clock or monotonicClock()
+		self.window = window
+		self.starts = np.zeros(window)
+		self.work   = np.zeros(window)
+		self.frames = 0
+		self.start  = 0.0
+		self.began  = self.clock()
+
+	def begin(self):
+		self.start = self.clock()
+
+	def end(self):
+		i = self.frames % self.window
+		self.starts[i] = self.start
+		self.work  [i] = self.clock() - self.start
+		self.frames   += 1
+
+	# Frames/second over the window, from frame start times
+	def fps(self):
+		n = min(self.frames, self.window)
+		if n < 2: return 0.0
+		starts = self.starts[:n]
+		span   = starts.max() - starts.min()
+		return (n - 1) / span if span > 0 else 0.0
+
+	# Work time percentiles (ms) over the window
+	def percentiles(self, q=(50, 95, 99)):
+		n = min(self.frames, self.window)
+		if not n: return [0.0] * len(q)
+		return np.percentile(self.work[:n], q) * 1000.0
+
+
+class NullFrameStats(object):
+	def begin(self): pass
+	def end(self): pass
+
+
+class MetricsServer(object):
+
+	# address: TCP port (served on 127.0.0.1 over HTTP) or Unix socket
+	# path (text sent on connect).  stats: FrameStats.
+	def __init__(self, address, stats, prefix="eyes_"):
+		self.stats   = stats
+		self.prefix  = prefix
+		self.gauges  = [] # (name, function) pairs
+		self.failed  = set() # Names of gauges that raised, reported once
+		metrics      = self
+		if isinstance(address, int):
+			class Handler(BaseHTTPRequestHandler):
+				def do_GET(self):
+					body = metrics.text().encode("utf-8")
+					self.send_response(200)
+					self.send_header("Content-Type", "text/plain")
+					self.send_header("Content-Length", str(len(body)))
+					self.end_headers()
+					self.wfile.write(body)
+				def log_message(self, *args): pass
+			self.server = HTTPServer(("127.0.0.1", address), Handler)
+		else:
+			class Handler(StreamRequestHandler):
+				def handle(self):
+					self.wfile.write(metrics.text().encode("utf-8"))
+			if os.path.exists(address): os.unlink(address) # Stale socket
+			self.server = UnixStreamServer(address, Handler)
+
+	# Register a value to report, read from 'func' (which returns a
+	# number, or None to omit it) on each request.
+	def gauge(self, name, func):
+		self.gauges.append((name, func))
+
+	def text(self):
+		s     = self.stats
+		lines = ["%suptime_seconds %.1f" % (self.prefix,
+		           s.clock() - s.began),
+		         "%sframes_total %d" % (self.prefix, s.frames),
+		         "%sfps %.2f" % (self.prefix, s.fps())]
+		for q, ms in zip((0.5, 0.95, 0.99), s.percentiles()):
+			lines.append('%sframe_ms{quantile="%g"} %.3f' %
+			  (self.prefix, q, ms))
+		for name, func in self.gauges:
+			try:
+				v = func()
+			except Exception as e:
+				# Don't let one bad gauge break the endpoint, but say so
+				if name not in self.failed:
+					self.failed.add(name)
+					sys.stderr.write("metrics: gauge %s failed: %r\n" %
+					  (name, e))
+				v = None
+			if v is not None:
+				lines.append("%s%s %g" % (self.prefix, name, v))
+		return "\n".join(lines) + "\n"
+
+	# Serve requests in a daemon thread
+	def start(self):
+		thread = threading.Thread(target=self.server.serve_forever)
+		thread.daemon = True
+		thread.start()
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+
+# Check for the 'morph' shader (shaders/morph.vs): runs iris and eyelid
+# morph targets through the shader at a range of weights, captures the
+# resulting vertex positions with transform feedback and compares them
+# against the CPU-generated meshes from irisCache() and lidCache().
+# Needs only EGL and OpenGL ES 3; no X server, display or pi3d Display,
+# so it runs on a headless Linux box with Mesa's software renderer:
+#   EGL_PLATFORM=surfaceless LIBGL_ALWAYS_SOFTWARE=1 python morphcheck.py
+# Exits with status 1 if any vertex is off by more than 'tolerance' (in
+# eye radius units).
+
+import ctypes
+import ctypes.util
+import os
+import sys
+import numpy as np
+import pi3d
+from gfxutil import *
+from eyeasset import *
+
+tolerance = 1e-4
+
+# GL / EGL enums used below
+EGL_PLATFORM_SURFACELESS_MESA      = 0x31DD
+EGL_OPENGL_ES_API                  = 0x30A0
+EGL_RENDERABLE_TYPE                = 0x3040
+EGL_OPENGL_ES3_BIT                 = 0x0040
+EGL_CONTEXT_CLIENT_VERSION         = 0x3098
+EGL_NONE                           = 0x3038
+GL_ARRAY_BUFFER                    = 0x8892
+GL_TRANSFORM_FEEDBACK_BUFFER       = 0x8C8E
+GL_STATIC_DRAW                     = 0x88E4
+GL_STATIC_READ                     = 0x88E5
+GL_FLOAT                           = 0x1406
+GL_POINTS                          = 0x0000
+GL_RASTERIZER_DISCARD              = 0x8C89
+GL_INTERLEAVED_ATTRIBS             = 0x8C8C
+GL_MAP_READ_BIT                    = 0x0001
+GL_FRAMEBUFFER                     = 0x8D40
+GL_RENDERBUFFER                    = 0x8D41
+GL_RGBA8                           = 0x8058
+GL_COLOR_ATTACHMENT0               = 0x8CE0
+GL_VERTEX_SHADER                   = 0x8B31
+GL_FRAGMENT_SHADER                 = 0x8B30
+GL_COMPILE_STATUS                  = 0x8B81
+GL_LINK_STATUS                     = 0x8B82
+
+egl = ctypes.CDLL(ctypes.util.find_library("EGL"))
+gl  = ctypes.CDLL(ctypes.util.find_library("GLESv2"))
+egl.eglGetProcAddress.restype  = ctypes.c_void_p
+egl.eglCreateContext.restype   = ctypes.c_void_p
+gl.glMapBufferRange.restype    = ctypes.c_void_p
+gl.glGetString.restype         = ctypes.c_char_p
+
+
+# Create a GLES 3 context with no surface, plus a small framebuffer
+# object so draw calls are valid.  Transform feedback is GLES 3 only.
+def initGL():
+	getDisplay = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_int,
+	  ctypes.c_void_p, ctypes.c_void_p)(
+	  egl.eglGetProcAddress(b"eglGetPlatformDisplayEXT"))
+	dpy = ctypes.c_void_p(getDisplay(EGL_PLATFORM_SURFACELESS_MESA,
+	  None, None))
+	if not egl.eglInitialize(dpy, None, None):
+		sys.exit("Can't initialize EGL")
+	egl.eglBindAPI(EGL_OPENGL_ES_API)
+	config  = ctypes.c_void_p()
+	nConfig = ctypes.c_int()
+	egl.eglChooseConfig(dpy, (ctypes.c_int * 3)(EGL_RENDERABLE_TYPE,
+	  EGL_OPENGL_ES3_BIT, EGL_NONE), ctypes.byref(config), 1,
+	  ctypes.byref(nConfig))
+	ctx = egl.eglCreateContext(dpy, config, None,
+	  (ctypes.c_int * 3)(EGL_CONTEXT_CLIENT_VERSION, 3, EGL_NONE))
+	if not ctx or not egl.eglMakeCurrent(dpy, None, None,
+	  ctypes.c_void_p(ctx)):
+		sys.exit("Can't create GLES 3 context")
+	fb = ctypes.c_uint()
+	gl.glGenFramebuffers(1, ctypes.byref(fb))
+	gl.glBindFramebuffer(GL_FRAMEBUFFER, fb)
+	rb = ctypes.c_uint()
+	gl.glGenRenderbuffers(1, ctypes.byref(rb))
+	gl.glBindRenderbuffer(GL_RENDERBUFFER, rb)
+	gl.glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, 16, 16)
+	gl.glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+	  GL_RENDERBUFFER, rb)
+	return gl.glGetString(0x1F01) # GL_RENDERER
+
+
+# Load shader source the way pi3d does for GLES 3: expand #includes
+# (pi3d's own shader directory first) and apply its keyword substitutions.
+def loadShader(filename, vertex):
+	shaderDir = os.path.join(os.path.dirname(pi3d.__file__), "shaders")
+	lines = []
+	for l in open(filename).read().split("\n"):
+		if "#include" in l:
+			inc = os.path.join(shaderDir, l.split()[1])
+			if not os.path.exists(inc): inc = l.split()[1]
+			lines.append(loadShader(inc, vertex))
+			continue
+		l = l.replace("version 120", "version 300 es")
+		l = l.replace("//precision", "precision")
+		l = l.replace("attribute", "in")
+		l = l.replace("texture2D", "texture")
+		l = l.replace("//fragcolor", "out vec4 fragColor;")
+		l = l.replace("gl_FragColor", "fragColor")
+		l = l.replace("varying", "out" if vertex else "in")
+		lines.append(l)
+	return "\n".join(lines)
+
+
+def compileShader(source, type):
+	shader = gl.glCreateShader(type)
+	src    = ctypes.c_char_p(source.encode("utf-8"))
+	gl.glShaderSource(shader, 1, ctypes.byref(src), None)
+	gl.glCompileShader(shader)
+	ok = ctypes.c_int()
+	gl.glGetShaderiv(shader, GL_COMPILE_STATUS, ctypes.byref(ok))
+	if not ok.value:
+		log = ctypes.create_string_buffer(4096)
+		gl.glGetShaderInfoLog(shader, 4096, None, log)
+		sys.exit("Shader compile failed:\n" + log.value.decode())
+	return shader
+
+
+# Build the morph program, capturing gl_Position by transform feedback.
+# Model and camera matrices are identity, so gl_Position is the morphed
+# vertex position itself.
+def morphProgram():
+	program = gl.glCreateProgram()
+	gl.glAttachShader(program, compileShader(
+	  loadShader("shaders/morph.vs", True), GL_VERTEX_SHADER))
+	gl.glAttachShader(program, compileShader(
+	  loadShader("shaders/morph.fs", False), GL_FRAGMENT_SHADER))
+	gl.glTransformFeedbackVaryings(program, 1,
+	  (ctypes.c_char_p * 1)(b"gl_Position"), GL_INTERLEAVED_ATTRIBS)
+	gl.glLinkProgram(program)
+	ok = ctypes.c_int()
+	gl.glGetProgramiv(program, GL_LINK_STATUS, ctypes.byref(ok))
+	if not ok.value: sys.exit("Shader link failed")
+	gl.glUseProgram(program)
+	matrices = np.tile(np.eye(4, dtype=np.float32), (3, 1, 1))
+	gl.glUniformMatrix4fv(gl.glGetUniformLocation(program,
+	  b"modelviewmatrix"), 3, 0, ctypes.c_void_p(matrices.ctypes.data))
+	return program
+
+
+# Run morph targets through the shader at weights lo, hi; returns N x 3
+# array of output positions.  Vertex layout is pi3d's (position, normal,
+# texture coords; 8 floats), as loaded by Mesh.morphInit().
+def morph(program, verts, targets, lo, hi):
+	data          = np.zeros((len(verts), 8), dtype=np.float32)
+	data[:, 0:3]  = verts
+	data[:, 3:6]  = targets
+	unif          = np.zeros((20, 3), dtype=np.float32)
+	unif[8]       = (0.0, -500.0, -500.0) # Light, as eyes.py
+	unif[16]      = (lo, hi, 0.0)         # As Mesh.setMorph()
+	gl.glUniform3fv(gl.glGetUniformLocation(program, b"unif"), 20,
+	  ctypes.c_void_p(unif.ctypes.data))
+
+	vbuf = ctypes.c_uint()
+	gl.glGenBuffers(1, ctypes.byref(vbuf))
+	gl.glBindBuffer(GL_ARRAY_BUFFER, vbuf)
+	gl.glBufferData(GL_ARRAY_BUFFER, ctypes.c_ssize_t(data.nbytes),
+	  ctypes.c_void_p(data.ctypes.data), GL_STATIC_DRAW)
+	for name, offset, size in ((b"vertex", 0, 3), (b"normal", 12, 3),
+	  (b"texcoord", 24, 2)):
+		attr = gl.glGetAttribLocation(program, name)
+		gl.glEnableVertexAttribArray(attr)
+		gl.glVertexAttribPointer(attr, size, GL_FLOAT, 0, 32,
+		  ctypes.c_void_p(offset))
+
+	out  = np.zeros((len(verts), 4), dtype=np.float32)
+	tbuf = ctypes.c_uint()
+	gl.glGenBuffers(1, ctypes.byref(tbuf))
+	gl.glBindBufferBase(GL_TRANSFORM_FEEDBACK_BUFFER, 0, tbuf)
+	gl.glBufferData(GL_TRANSFORM_FEEDBACK_BUFFER,
+	  ctypes.c_ssize_t(out.nbytes), None, GL_STATIC_READ)
+	gl.glEnable(GL_RASTERIZER_DISCARD)
+	gl.glBeginTransformFeedback(GL_POINTS)
+	gl.glDrawArrays(GL_POINTS, 0, len(verts))
+	gl.glEndTransformFeedback()
+	ptr = gl.glMapBufferRange(GL_TRANSFORM_FEEDBACK_BUFFER,
+	  ctypes.c_ssize_t(0), ctypes.c_ssize_t(out.nbytes), GL_MAP_READ_BIT)
+	ctypes.memmove(ctypes.c_void_p(out.ctypes.data), ctypes.c_void_p(ptr),
+	  out.nbytes)
+	gl.glUnmapBuffer(GL_TRANSFORM_FEEDBACK_BUFFER)
+	gl.glDeleteBuffers(1, ctypes.byref(vbuf))
+	gl.glDeleteBuffers(1, ctypes.byref(tbuf))
+	return out[:, 0:3]
+
+
+if __name__ == "__main__":
+	svg = sys.argv[1] if len(sys.argv) > 1 else "graphics/eye.svg"
+	print("Renderer: %s" % initGL().decode())
+	program = morphProgram()
+	a       = compileArrays(svg)
+	weights = (0.0, 0.25, 0.5, 0.75, 1.0)
+	spans   = [(w, w) for w in weights] + [(0.1, 0.4), (0.3, 0.9)]
+	worst   = 0.0
+
+	irisZ   = zangle(a["iris"], 1.0)[0] * 0.99
+	verts, targets = irisMorph(a["pupilMin"], a["pupilMax"], a["iris"], 4,
+	  -irisZ)
+	meshes  = irisCache(a["pupilMin"], a["pupilMax"], a["iris"], 4,
+	  -irisZ, 0)
+	for w in weights:
+		d = np.abs(morph(program, verts, targets, w, w) -
+		  meshes.get((w,))).max()
+		print("iris         %4.2f       max error %g" % (w, d))
+		worst = max(worst, d)
+
+	for lid in ("upperLid", "lowerLid"):
+		edge, lidOpen, lidClosed = (a[lid + "Edge"], a[lid + "Open"],
+		  a[lid + "Closed"])
+		meshes = lidCache(edge, lidOpen, lidClosed, 5, 0)
+		for flip in (False, True):
+			verts, targets = lidMorph(edge, lidOpen, lidClosed, 5, flip)
+			for lo, hi in spans:
+				d = np.abs(morph(program, verts, targets, lo, hi) -
+				  meshes.get((lo, hi), flip)).max()
+				print("%-8s %-5s %4.2f-%4.2f max error %g" %
+				  (lid, "flip" if flip else "", lo, hi, d))
+				worst = max(worst, d)
+
+	print("%s (worst %g, tolerance %g)" %
+	  ("OK" if worst <= tolerance else "FAIL", worst, tolerance))
+	sys.exit(0 if worst <= tolerance else 1)
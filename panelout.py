@@ -0,0 +1,349 @@
+#!/usr/bin/python
+
+# In-process output to the SPI screens, as an alternative to fbx2 (which
+# depends on Broadcom's dispmanx library to snapshot and scale the
+# framebuffer, so only runs on a Pi).  PanelOutput reads back each eye's
+# square of the rendered frame with glReadPixels, using the same geometry
+# as fbx2.c (one square per screen, side by side, each screen showing the
+# 80% inset), box-filters it down to screen size with numpy, and converts
+# it to 16-bit 5/6/5 color with ordered (Bayer) dithering, high byte first
+# as the screens expect.  The result goes to a sink: the screens
+# themselves over spidev (SpidevSink), a file (FileSink) or shared memory
+# for another process to pick up (SharedMemorySink).
+#
+# Readback is double-buffered: the render thread reads the current frame
+# into one buffer while a worker thread converts and sends the previous
+# frame from the other, so conversion overlaps rendering of the next
+# frame.  If the worker falls behind, frames are dropped rather than
+# making the renderer wait.
+
+import ctypes
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+
+# 4x4 Bayer matrix, as thresholds 0.0 to 1.0 (exclusive)
+BAYER4 = (np.array([[ 0,  8,  2, 10],
+                    [12,  4, 14,  6],
+                    [ 3, 11,  1,  9],
+                    [15,  7, 13,  5]]) + 0.5) / 16.0
+
+
+# Upper-left corners (x, y from top, pixels) and size of each screen's
+# square on a width x height display, left to right: 'count' squares
+# side-by-side, spanning the width (or height, if an exceptionally wide
+# aspect ratio), centered, each screen showing the 'inset' part of its
+# square.  Same as fbx2.c; eyes.py positions eyes to match.
+def insetRects(width, height, count=2, inset=0.8):
+	if width <= height * count: square = float(width) / count
+	else:                       square = float(height)
+	size  = int(square * inset)
+	left  = (width - square * count) * 0.5
+	y     = int((height - size) // 2)
+	return [(int(left + square * (i + 0.5) - size * 0.5), y, size)
+	  for i in range(count)]
+
+
+# Average each factor x factor block of img (rows, columns, channels;
+# 8-bit), returning float32 array.  Rows are summed first, as whole rows
+# of pixels, then columns within each; integer sums, a single multiply.
+def boxFilter(img, factor):
+	h, w, c = img.shape
+	n, m    = h // factor, w // factor
+	s = img.reshape(n, factor, m * factor * c).sum(axis=1, dtype=np.uint32)
+	s = s.reshape(n, m, factor, c).sum(axis=2, dtype=np.uint32)
+	return s * np.float32(1.0 / (factor * factor))
+
+
+# Convert RGB image (rows, columns, 3 or more; 0.0 to 255.0) to 16-bit
+# 5/6/5 pixels, high byte first, with ordered dithering.
+def rgb565(img):
+	h, w      = img.shape[:2]
+	threshold = np.tile(BAYER4.astype(np.float32),
+	  ((h + 3) // 4, (w + 3) // 4))[:h, :w, None]
+	# Scale each channel to its bit depth, add threshold, truncate
+	# (0 to 31.97 etc., so never overflows)
+	q = (img[:, :, :3] * np.array((31.0, 63.0, 31.0), np.float32) /
+	     np.float32(255.0) + threshold).astype(np.uint16)
+	return ((q[:, :, 0] << 11) | (q[:, :, 1] << 5) | q[:, :, 2]).astype(">u2")
+
+
+# Read RGBA pixels of rectangle (x, y from bottom) into array (rows,
+# columns, 4; bottom row first) from current GL framebuffer.
+def glRead(x, y, w, h, out):
+	from pi3d.constants import (opengles, GLint, GLsizei, GLubyte, GL_RGBA,
+	  GL_UNSIGNED_BYTE)
+	opengles.glReadPixels(GLint(x), GLint(y), GLsizei(w), GLsizei(h),
+	  GL_RGBA, GL_UNSIGNED_BYTE, out.ctypes.data_as(ctypes.POINTER(GLubyte)))
+
+
+# Sinks --------------------------------------------------------------------
+
+# Each sink's send() takes a list of per-screen frames (panel x panel
+# arrays of big-endian 16-bit pixels), left to right.
+
+# Appends frames to a file, screens one after another (e.g. for testing
+# off-Pi, or to feed another program through a FIFO).
+class FileSink(object):
+
+	def __init__(self, path):
+		self.file = open(path, "ab")
+
+	def send(self, frames):
+		for f in frames: self.file.write(f.tobytes())
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+
+# Latest frames in a memory-mapped file (in /dev/shm by default): an 8
+# byte header (sequence number, then frame count, little-endian 32-bit)
+# and then each screen's pixels.  The sequence number is odd while a
+# frame is being written; a reader should read it before and after
+# copying the pixels, and retry if it was odd or changed.
+class SharedMemorySink(object):
+
+	def __init__(self, path, count, panel):
+		size = 8 + count * panel * panel * 2
+		fd   = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			os.ftruncate(fd, size)
+			self.map = mmap.mmap(fd, size)
+		finally:
+			os.close(fd)
+		self.seq    = 0
+		self.frames = 0
+
+	def send(self, frames):
+		self.seq += 1
+		self.map[0:4] = struct.pack("<I", self.seq)
+		data = b"".join(f.tobytes() for f in frames)
+		self.map[8:8 + len(data)] = data
+		self.frames += 1
+		self.seq    += 1
+		self.map[0:8] = struct.pack("<II", self.seq, self.frames)
+
+	def close(self):
+		self.map.close()
+
+
+# Screen initialization commands: (command, arguments, milliseconds to
+# wait after), distilled from the Adafruit libraries; same as fbx2.c.
+SCREEN_INIT = {
+  "oled": ( # SSD1351
+    (0xFD, (0x12,), 0), (0xFD, (0xB1,), 0), # Unlock
+    (0xAE, (), 0),                          # Display off
+    (0xB3, (0xF0,), 0),                     # Clock div
+    (0xCA, (0x7F,), 0),                     # Duty cycle (128 lines)
+    (0xA2, (0x00,), 0),                     # Display offset
+    (0xA1, (0x00,), 0),                     # Start line
+    (0xA0, (0x74,), 0),                     # Remap, color depth (5/6/5)
+    (0xB5, (0x00,), 0),                     # GPIO (disable)
+    (0xAB, (0x01,), 0),                     # Internal regulator
+    (0xB4, (0xA0, 0xB5, 0x55), 0),          # VSL (external)
+    (0xC1, (0xFF, 0xA3, 0xFF), 0),          # Contrast A/B/C
+    (0xC7, (0x0F,), 0),                     # Contrast master
+    (0xB1, (0x32,), 0),                     # Precharge & discharge
+    (0xBB, (0x07,), 0),                     # Precharge voltage
+    (0xB2, (0xA4, 0x00, 0x00), 0),          # Display enhancement
+    (0xB6, (0x01,), 0),                     # Precharge period
+    (0xBE, (0x05,), 0),                     # VcomH
+    (0xA6, (), 0),                          # Normal display
+    (0xAF, (), 0),                          # Display on
+    (0xB8, tuple(int((i / 63.0) ** 0.75 * 179.0 + 0.5)
+      for i in range(64)), 0)),             # Gamma table
+  "tft": ( # ST7735 'green tab'
+    (0x01, (), 150),                        # Software reset
+    (0x11, (), 500),                        # Out of sleep mode
+    (0xB1, (0x01, 0x2C, 0x2D), 0),          # Frame rate, normal mode
+    (0xB2, (0x01, 0x2C, 0x2D), 0),          # Frame rate, idle mode
+    (0xB3, (0x01, 0x2C, 0x2D, 0x01, 0x2C, 0x2D), 0), # Partial mode
+    (0xB4, (0x07,), 0),                     # No inversion
+    (0xC0, (0xA2, 0x02, 0x84), 0),          # Power control 1
+    (0xC1, (0xC5,), 0),                     # Power control 2
+    (0xC2, (0x0A, 0x00), 0),                # Power control 3
+    (0xC3, (0x8A, 0x2A), 0),                # Power control 4
+    (0xC4, (0x8A, 0xEE), 0),                # Power control 5
+    (0xC5, (0x0E,), 0),                     # VCOM
+    (0x20, (), 0),                          # Don't invert display
+    (0x36, (0xC8,), 0),                     # MADCTL
+    (0x3A, (0x05,), 0),                     # 16-bit color
+    (0xE0, (0x02, 0x1c, 0x07, 0x12, 0x37, 0x32, 0x29, 0x2d,
+            0x29, 0x25, 0x2B, 0x39, 0x00, 0x01, 0x03, 0x10), 0),
+    (0xE1, (0x03, 0x1d, 0x07, 0x06, 0x2E, 0x2C, 0x29, 0x2D,
+            0x2E, 0x2E, 0x37, 0x3F, 0x00, 0x00, 0x02, 0x10), 0),
+    (0x13, (), 10),                         # Normal display on
+    (0x29, (), 100)) }                      # Main screen turn on
+
+DC_PIN    = 5 # These pins connect
+RESET_PIN = 6 # to all screens
+
+# Sends frames to the screens themselves, on the SPI devices given (e.g.
+# "/dev/spidev0.0", "/dev/spidev1.2"), with the spidev module (py-spidev)
+# and RPi.GPIO (passed in) for the shared D/C and reset pins.  Don't run
+# fbx2 at the same time.
+class SpidevSink(object):
+
+	def __init__(self, paths, gpio, screen="oled", panel=128,
+	  speed=14000000):
+		import spidev
+		self.gpio   = gpio
+		self.screen = screen
+		self.panel  = panel
+		self.spi    = []
+		for path in paths:
+			bus, cs = os.path.basename(path)[6:].split(".")
+			spi = spidev.SpiDev()
+			spi.open(int(bus), int(cs))
+			spi.mode         = 0
+			spi.max_speed_hz = speed
+			self.spi.append(spi)
+		gpio.setmode(gpio.BCM)
+		gpio.setup(DC_PIN   , gpio.OUT)
+		gpio.setup(RESET_PIN, gpio.OUT)
+		for level in (gpio.HIGH, gpio.LOW, gpio.HIGH): # Reset screens
+			gpio.output(RESET_PIN, level)
+			time.sleep(0.001)
+		for cmd, args, ms in SCREEN_INIT[screen]:
+			self.command(cmd, args)
+			if ms: time.sleep(ms / 1000.0)
+
+	# Issue command byte and its arguments to all screens
+	def command(self, cmd, args=()):
+		self.gpio.output(DC_PIN, self.gpio.LOW)
+		for spi in self.spi: spi.writebytes([cmd])
+		if not args: return
+		self.gpio.output(DC_PIN, self.gpio.HIGH)
+		for spi in self.spi: spi.writebytes(list(args))
+
+	def send(self, frames):
+		# Window is reset every frame, in case a screen missed a byte
+		n = self.panel - 1
+		if self.screen == "oled":
+			self.command(0x15, (0, n))
+			self.command(0x75, (0, n))
+			self.command(0x5C)
+		else: # colstart 2, rowstart 3
+			self.command(0x2A, (0, 2, (n + 2) >> 8, (n + 2) & 0xFF))
+			self.command(0x2B, (0, 3, (n + 3) >> 8, (n + 3) & 0xFF))
+			self.command(0x2C)
+		self.gpio.output(DC_PIN, self.gpio.HIGH)
+		for spi, f in zip(self.spi, frames): spi.writebytes2(f.tobytes())
+
+	def close(self):
+		for spi in self.spi: spi.close()
+
+
+# Output stage -------------------------------------------------------------
+
+class PanelOutput(object):
+
+	# width, height: display size.  count: number of screens.  panel:
+	# screen resolution (square).  sink: see above.  threaded: if False,
+	# convert and send in capture() (e.g. for testing).  read: readback
+	# function, see glRead().  targets: RenderTargets (see gfxutil.py)
+	# the eyes are drawn into, one per screen, left to right, if not
+	# drawn to the display.
+	def __init__(self, width, height, sink, count=2, panel=128,
+	  threaded=True, read=glRead, targets=None):
+		self.sink    = sink
+		self.panel   = panel
+		self.read    = read
+		self.targets = targets
+		if targets:
+			# Whole of each target, a multiple of the screen size
+			self.factor = max(targets[0].size // panel, 1)
+			self.rects  = [(0, 0)] * count
+		else:
+			# Readback size is the inset square, trimmed to a multiple
+			# of the screen size for an even box filter.
+			self.rects  = []
+			for x, y, size in insetRects(width, height, count):
+				self.factor = max(size // panel, 1)
+				trim        = size - panel * self.factor
+				self.rects.append((x + trim // 2,
+				  height - (y + trim // 2) - panel * self.factor))
+		n = panel * self.factor
+		self.buffers  = [np.zeros((count, n, n, 4), np.uint8)
+		                 for i in range(2)]
+		self.index    = 0    # Buffer to read next frame into
+		self.pending  = None # Buffer awaiting conversion
+		self.busy     = None # Buffer being converted
+		self.frames   = 0    # Frames captured
+		self.sent     = 0    # Frames sent
+		self.dropped  = 0    # Frames captured but not sent
+		self.threaded = threaded
+		if threaded:
+			self.cond   = threading.Condition()
+			thread      = threading.Thread(target=self.run)
+			thread.daemon = True
+			thread.start()
+
+	# Convert one frame's squares (each bottom row first, RGBA) for the
+	# screens and send them
+	def convert(self, buf):
+		self.sink.send([rgb565(boxFilter(img, self.factor)[::-1])
+		  for img in buf])
+		self.sent += 1
+
+	# Read each screen's square into buf
+	def readFrame(self, buf):
+		n = self.panel * self.factor
+		for i, (x, y) in enumerate(self.rects):
+			if self.targets: self.targets[i].bind()
+			self.read(x, y, n, n, buf[i])
+		if self.targets: self.targets[0].end()
+		self.frames += 1
+
+	# Read back the current frame; call after drawing, before the swap.
+	def capture(self):
+		if not self.threaded:
+			self.readFrame(self.buffers[0])
+			self.convert(self.buffers[0])
+			return
+		i = self.index
+		with self.cond:
+			while self.busy == i: self.cond.wait() # Worker still on it
+		self.readFrame(self.buffers[i])
+		with self.cond:
+			if self.pending is not None: self.dropped += 1 # Not started
+			self.pending = i
+			self.cond.notify_all()
+		self.index = 1 - i
+
+	# Worker thread: convert and send frames as they're captured
+	def run(self):
+		while True:
+			with self.cond:
+				while self.pending is None: self.cond.wait()
+				self.busy, self.pending = self.pending, None
+			self.convert(self.buffers[self.busy])
+			with self.cond:
+				self.busy = None
+				self.cond.notify_all()
+
+
+class NullOutput(object):
+	frames = sent = dropped = 0
+	def capture(self): pass
+
+
+# Return PanelOutput to the sink named by 'spec' (None: NullOutput, i.e.
+# fbx2 copies the framebuffer instead; "spi": SpidevSink on the usual
+# two devices, "shm": SharedMemorySink in /dev/shm/eyes; else a file
+# path for FileSink).
+def makeOutput(spec, width, height, count=2, panel=128, screen="oled",
+  gpio=None, targets=None):
+	if not spec: return NullOutput()
+	if spec == "spi":
+		sink = SpidevSink(("/dev/spidev0.0", "/dev/spidev1.2")[:count], gpio,
+		  screen, panel)
+	elif spec == "shm":
+		sink = SharedMemorySink("/dev/shm/eyes", count, panel)
+	else:
+		sink = FileSink(spec)
+	return PanelOutput(width, height, sink, count, panel, targets=targets)
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+# Per-stage frame profiler.  frame() marks the end of each stage of its
+# work (input, eye motion, blinks, geometry regen, drawing, etc.) and the
+# profiler keeps, per stage, the times of the last several hundred frames
+# (for percentiles) plus totals since start, along with counters such as
+# regens per mesh.  A summary is printed to stderr on SIGUSR1
+# (kill -USR1 <pid>) and at exit, and frames slower than a threshold are
+# logged as they happen with their per-stage breakdown.  Timing uses a
+# monotonic clock (see framepace.py).
+#
+# With profiling off, makeProfiler() returns a NullProfiler whose methods
+# do nothing, so the marks can stay in frame() at the cost of a few empty
+# method calls per frame.
+
+import atexit
+import signal
+import sys
+import numpy as np
+from framepace import monotonicClock
+
+
+# Gauges are still kept, for a Profiler swapped in later (headless.py)
+class NullProfiler(object):
+	def __init__(self): self.gauges = []
+	def begin(self): pass
+	def mark(self, stage): pass
+	def end(self): pass
+	def gauge(self, name, func): self.gauges.append((name, func))
+	def summary(self): return ""
+	def dump(self, *args): pass
+
+
+class Profiler(object):
+
+	# slow: frames taking longer than this (seconds) are logged; 0 = none.
+	# window: number of recent frames kept for percentiles.
+	def __init__(self, slow=0.0, window=600, clock=None, out=sys.stderr):
+		self.clock   = clock or monotonicClock()
+		self.out     = out
+		self.slow    = slow
+		self.window  = window
+		self.stages  = [] # Stage names, in order first marked
+		self.times   = {} # Stage: array of last 'window' times (seconds),
+		                  # NaN for frames that didn't reach the stage
+		self.totals  = {} # Stage: total time since start
+		self.counts  = {} # Stage: number of frames it was marked in
+		self.gauges  = [] # (name, function) pairs, read at summary time
+		self.frames  = 0
+		self.slowCount = 0
+		self.current = [] # (stage, seconds) this frame
+		self.start   = None
+		self.last    = None
+
+	# Call at start of frame
+	def begin(self):
+		self.start   = self.last = self.clock()
+		self.current = []
+
+	# Mark end of named stage (time since previous mark or begin())
+	def mark(self, stage):
+		now = self.clock()
+		self.current.append((stage, now - self.last))
+		self.last = now
+
+	# Call at end of frame.  Stages not marked this frame (e.g. drawing,
+	# in frames skipped as idle) get no time rather than a stale one.
+	def end(self):
+		i = self.frames % self.window
+		for stage in self.stages:
+			self.times[stage][i] = np.nan
+		for stage, t in self.current:
+			if stage not in self.times:
+				self.stages.append(stage)
+				self.times [stage] = np.full(self.window, np.nan)
+				self.totals[stage] = 0.0
+				self.counts[stage] = 0
+			self.times [stage][i]  = t
+			self.totals[stage]    += t
+			self.counts[stage]    += 1
+		self.frames += 1
+		total = self.last - self.start
+		if self.slow > 0 and total > self.slow:
+			self.slowCount += 1
+			self.out.write("slow frame %d: %.2f ms (%s)\n" % (self.frames,
+			  total * 1000.0, ", ".join("%s %.2f" % (stage, t * 1000.0)
+			  for stage, t in self.current)))
+
+	# Register a counter (e.g. regens, kept by the EyeRig), read by summary()
+	def gauge(self, name, func):
+		self.gauges.append((name, func))
+
+	# Per stage: mean since start and percentiles over the window, of the
+	# frames that reached the stage.
+	def summary(self):
+		n     = min(self.frames, self.window)
+		lines = ["%d frames, %d slow; last %d frames (ms):" %
+		  (self.frames, self.slowCount, n),
+		  "  %-10s %8s %8s %8s %8s %8s" %
+		  ("stage", "mean", "p50", "p95", "p99", "max")]
+		for stage in self.stages:
+			t  = self.times[stage][:n]
+			t  = t[~np.isnan(t)] * 1000.0
+			ms = np.percentile(t, (50, 95, 99)) if len(t) else (0, 0, 0)
+			lines.append("  %-10s %8.3f %8.3f %8.3f %8.3f %8.3f" % (stage,
+			  self.totals[stage] * 1000.0 / self.counts[stage], ms[0],
+			  ms[1], ms[2], t.max() if len(t) else 0))
+		for name, func in self.gauges:
+			lines.append("  %-20s %d" % (name, func()))
+		return "\n".join(lines)
+
+	def dump(self, *args): # Also a signal handler
+		self.out.write(self.summary() + "\n")
+		self.out.flush()
+
+	# Print summary on SIGUSR1 and at exit
+	def install(self):
+		signal.signal(signal.SIGUSR1, self.dump)
+		atexit.register(self.dump)
+
+
+# Return Profiler (installed, see above) if 'enabled', else NullProfiler.
+def makeProfiler(enabled, slow=0.0):
+	if not enabled: return NullProfiler()
+	profiler = Profiler(slow)
+	profiler.install()
+	return profiler
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+# Simulated pupil response when there's no analog light sensor.  Formerly
+# a recursive split() function subdivided each 4 second pupil move, at
+# random midpoints, and drew frames in a loop at the bottom of the
+# recursion, so the pupil simulation owned the render loop.  Here each
+# move is instead precomputed as a small array of evenly spaced
+# breakpoints (same subdivision, same random draws), and a generator
+# yields the pupil scale at the current time: the main loop draws frames
+# at its own pace (see framepace.py) and just asks for the value.
+
+import random
+import numpy as np
+
+
+# Breakpoints for one pupil move from startValue to endValue: the move is
+# halved, with the midpoint picked randomly within +/- range/2 of the
+# average, and each half subdivided likewise with half the range, down to
+# ranges below minRange.  Returns array of 2^levels + 1 pupil scales (17
+# for range 1.0), at even time steps.  rng is the random number source
+# (the random module, or a recording/replaying one; see inputtrace.py).
+def pupilSegment(startValue, endValue, range, minRange=0.125, rng=random):
+	levels = 0
+	r      = range
+	while r >= minRange:
+		r      *= 0.5
+		levels += 1
+	n          = 1 << levels
+	values     = np.empty(n + 1)
+	values[0]  = startValue
+	values[n]  = endValue
+	# Depth-first, left half first, as the recursive version did
+	stack = [(0, n, range * 0.5)]
+	while stack:
+		lo, hi, r = stack.pop()
+		if hi - lo < 2: continue
+		mid = (lo + hi) // 2
+		values[mid] = ((values[lo] + values[hi] - r) * 0.5 +
+		               rng.uniform(0.0, r))
+		stack.append((mid, hi, r * 0.5))
+		stack.append((lo, mid, r * 0.5))
+	return values
+
+
+# Generator yielding pupil scale (0.0 to 1.0, before clamping) at the time
+# returned by clock(), interpolating between breakpoints: O(1) per value.
+# Each 'duration' seconds a new move starts from the last one's end, to a
+# random scale.  If the generator isn't read for longer than a move, the
+# next move starts from the time it's read again rather than skipping
+# ahead.
+def pupilTrajectory(clock, startValue=0.5, duration=4.0, range=1.0,
+  rng=random):
+	t0 = clock()
+	while True:
+		values = pupilSegment(startValue, rng.random(), range, rng=rng)
+		step   = duration / (len(values) - 1)
+		while True:
+			t = clock() - t0
+			if t >= duration: break
+			i = int(t / step)
+			f = t / step - i
+			yield values[i] + (values[i + 1] - values[i]) * f
+		t0 += duration
+		if clock() - t0 >= duration: t0 = clock()
+		startValue = values[-1]
@@ -0,0 +1,83 @@
+#include std_head_vs.inc
+
+// Batched eye shader: as pi3d's uv_light (or morph.vs), for a BatchMesh
+// (see gfxutil.py) holding one copy of an iris, sclera or eyelid mesh per
+// eye, so every eye is drawn in one call.  A vertex's eye is the integer
+// part of its texture U / 4; that eye's transform is applied here, in the
+// same order as pi3d's Shape matrix (mirror, Y rotation, X rotation, then
+// position), from eye[] as set by BatchMesh:
+//   eye[i*3]     sin, cos of X rotation, sin, cos of Y rotation
+//   eye[i*3 + 1] X, Y position, X scale (-1 to mirror, 0 to hide),
+//                texture U offset
+//   eye[i*3 + 2] morph weight span lo, hi (as unif[16] in morph.vs)
+// If unif[16][2] is 1.0, 'vertex' and 'normal' are morph targets as in
+// morph.vs; otherwise they're the vertex position and normal.
+
+#define BATCH_EYES 8
+
+uniform vec4 eye[BATCH_EYES * 3];
+
+varying vec2 texcoordout;
+varying vec3 lightVector;
+varying float lightFactor;
+
+// Rotate about Y, then X, as pi3d's roy and rox matrices
+vec3 eyeRotate(vec3 v, vec4 r) {
+  v = vec3(v.x * r.w + v.z * r.z, v.y, v.z * r.w - v.x * r.z);
+  return vec3(v.x, v.y * r.y - v.z * r.x, v.y * r.x + v.z * r.y);
+}
+
+void main(void) {
+  vec3 normout;
+  float e = floor(texcoord.x * 0.25);
+  int i = int(e) * 3;
+  vec4 xform = eye[i + 1];
+  vec3 posn = vertex;
+  vec3 norm = normal;
+  if (unif[16][2] == 1.0) {
+    float weight = mix(eye[i + 2][0], eye[i + 2][1], normal.z);
+    posn = vec3(mix(vertex.xy, normal.xy, weight), vertex.z);
+    norm = vec3(0.0, 0.0, -1.0);
+  }
+  posn.x *= xform.z;
+  norm.x *= xform.z;
+  posn = eyeRotate(posn, eye[i]) + vec3(xform.xy, 0.0);
+  norm = eyeRotate(norm, eye[i]);
+
+  // ----- as std_main_vs.inc, with posn and norm for vertex and normal
+  vec4 relPosn = modelviewmatrix[0] * vec4(posn, 1.0);
+
+  if (unif[7][0] == 1.0) {                  // this is a point light and unif[8] is location
+    lightVector = vec3(relPosn) - unif[8];
+    lightFactor = pow(length(lightVector), -2.0);
+    lightVector = normalize(lightVector);
+    lightVector.z *= -1.0;
+  } else {                                  // this is directional light
+    lightVector = normalize(unif[8]);
+    lightFactor = 1.0;
+  }
+  lightVector.z *= -1.0;
+  vec3 uvec = normalize(cross(norm, vec3(0.0003, -1.0, 0.0003)));
+  vec3 vvec = normalize(cross(uvec, norm));
+  normout = normalize(vec3(modelviewmatrix[0] * vec4(norm, 0.0)));
+  uvec = vec3(modelviewmatrix[0] * vec4(uvec, 0.0));
+  vvec = vec3(modelviewmatrix[0] * vec4(vvec, 0.0));
+
+  lightVector = vec3(mat4(uvec.x, vvec.x, -normout.x, 0.0,
+                          uvec.y, vvec.y, -normout.y, 0.0,
+                          uvec.z, vvec.z, -normout.z, 0.0,
+                          0.0,    0.0,    0.0,        1.0) * vec4(lightVector, 0.0));
+
+  is_3d = abs(modelviewmatrix[0][3][3] - modelviewmatrix[1][3][3]);
+
+  vec3 inray = vec3(relPosn - vec4(unif[6], 0.0)); // ----- vector from the camera to this vertex
+  dist = length(inray);
+#include std_fog_start.inc
+
+  // Mirrored eyes' U runs backwards, as Mesh.draw() sets for pi3d's shader
+  float u = (texcoord.x - e * 4.0) * xform.z + 0.5 - 0.5 * xform.z + xform.w;
+  texcoordout = vec2(u, texcoord.y) * unib[2].xy + unib[3].xy;
+
+  gl_Position = modelviewmatrix[1] * vec4(posn, 1.0);
+  gl_PointSize = unib[2][2] / dist;
+}
@@ -0,0 +1,55 @@
+#include std_head_vs.inc
+
+// Morphing mesh shader for iris and eyelids: as pi3d's uv_light, but each
+// vertex position is interpolated between two morph targets here instead
+// of being regenerated on the CPU (see morphArrays() in gfxutil.py).
+// 'vertex' is one target; 'normal' X/Y is the other, normal Z the vertex
+// row's fraction of the way across the span of weights unif[16][0] to
+// unif[16][1] (set by Mesh.setMorph()).  Actual normal is fixed at
+// (0, 0, -1), as for all meshes from meshInit().
+
+varying vec2 texcoordout;
+varying vec3 lightVector;
+varying float lightFactor;
+
+void main(void) {
+  vec3 normout;
+  float weight = mix(unif[16][0], unif[16][1], normal.z);
+  vec3 posn = vec3(mix(vertex.xy, normal.xy, weight), vertex.z);
+  vec3 norm = vec3(0.0, 0.0, -1.0);
+
+  // ----- as std_main_vs.inc, with posn and norm for vertex and normal
+  vec4 relPosn = modelviewmatrix[0] * vec4(posn, 1.0);
+
+  if (unif[7][0] == 1.0) {                  // this is a point light and unif[8] is location
+    lightVector = vec3(relPosn) - unif[8];
+    lightFactor = pow(length(lightVector), -2.0);
+    lightVector = normalize(lightVector);
+    lightVector.z *= -1.0;
+  } else {                                  // this is directional light
+    lightVector = normalize(unif[8]);
+    lightFactor = 1.0;
+  }
+  lightVector.z *= -1.0;
+  vec3 uvec = normalize(cross(norm, vec3(0.0003, -1.0, 0.0003)));
+  vec3 vvec = normalize(cross(uvec, norm));
+  normout = normalize(vec3(modelviewmatrix[0] * vec4(norm, 0.0)));
+  uvec = vec3(modelviewmatrix[0] * vec4(uvec, 0.0));
+  vvec = vec3(modelviewmatrix[0] * vec4(vvec, 0.0));
+
+  lightVector = vec3(mat4(uvec.x, vvec.x, -normout.x, 0.0,
+                          uvec.y, vvec.y, -normout.y, 0.0,
+                          uvec.z, vvec.z, -normout.z, 0.0,
+                          0.0,    0.0,    0.0,        1.0) * vec4(lightVector, 0.0));
+
+  is_3d = abs(modelviewmatrix[0][3][3] - modelviewmatrix[1][3][3]);
+
+  vec3 inray = vec3(relPosn - vec4(unif[6], 0.0)); // ----- vector from the camera to this vertex
+  dist = length(inray);
+#include std_fog_start.inc
+
+  texcoordout = texcoord * unib[2].xy + unib[3].xy;
+
+  gl_Position = modelviewmatrix[1] * vec4(posn, 1.0);
+  gl_PointSize = unib[2][2] / dist;
+}
@@ -0,0 +1,149 @@
+// Check for spixfer.c, runs on any Linux box (no Pi or screens needed):
+//   make spitest
+// Sends data through spiWrite() to a plain file standing in for a spidev
+// device and reads it back: a large block must arrive byte-exact however
+// spiOpen()'s message size splits it into transfers and messages, and
+// each screen type's window commands (column set, row set, RAM write,
+// framed as fbx2's main loop sends them to each screen) must match the
+// bytes expected from the SSD1351 and ST7735 datasheets.  Exits with
+// status 1 if any check fails.
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include "spixfer.h"
+
+#define TEST_BYTES 100000
+
+static int failures = 0;
+
+// Create an empty temporary file, path in 'path' (at least 32 bytes)
+static int tempFile(char *path) {
+	int fd;
+	strcpy(path, "/tmp/spitestXXXXXX");
+	if((fd = mkstemp(path)) < 0) return -1;
+	close(fd);
+	return 0;
+}
+
+// Read up to 'max' bytes of file at 'path' into 'buf'; returns count
+static int readBack(const char *path, uint8_t *buf, int max) {
+	FILE *fp;
+	int   n = -1;
+	if((fp = fopen(path, "rb"))) {
+		n = fread(buf, 1, max, fp);
+		fclose(fp);
+	}
+	return n;
+}
+
+static void check(int ok, const char *what) {
+	(void)printf("%-52s %s\n", what, ok ? "ok" : "FAILED");
+	if(!ok) failures++;
+}
+
+// Send 'len' bytes of 'data' with messages of up to 'maxBytes', in
+// pieces of 'chunk' bytes (as fbx2 sends rows), and compare the file.
+static void roundTrip(const uint8_t *data, int len, int maxBytes,
+  int chunk) {
+	SPIDevice dev;
+	char      path[32], what[64];
+	uint8_t  *back;
+	int       i, n, ok = 0;
+
+	(void)sprintf(what, "%d bytes, %d-byte messages, %d-byte writes",
+	  len, maxBytes, chunk);
+	if(!(back = (uint8_t *)malloc(len + 1)) || tempFile(path) ||
+	  spiOpen(&dev, path, 8000000, maxBytes)) {
+		free(back);
+		check(0, what);
+		return;
+	}
+	ok = dev.isFile;
+	for(i=0; i<len; i+=n) {
+		n = (len - i < chunk) ? len - i : chunk;
+		if(spiWrite(&dev, &data[i], n)) ok = 0;
+	}
+	spiClose(&dev);
+	ok = ok && (readBack(path, back, len + 1) == len) &&
+	  !memcmp(data, back, len);
+	(void)unlink(path);
+	free(back);
+	check(ok, what);
+}
+
+// Send one frame's window commands and pixel rows 'first' to 'last' to
+// one screen of type 'screenType' (128x128), framed as fbx2 does (each
+// command byte, then its arguments), and compare against 'expect'
+// (commands only; 'len' bytes).
+static void window(int screenType, int first, int last,
+  const uint8_t *expect, int len) {
+	SPIDevice dev;
+	char      path[32], what[64];
+	uint8_t   cols[4], rows[4], pixels[128 * 128 * 2],
+	          back[sizeof(pixels) + 32];
+	int       i, n, rowBytes, ok;
+
+	(void)sprintf(what, "%s window, rows %d to %d",
+	  (screenType == SCREEN_OLED) ? "OLED" : "TFT", first, last);
+	if(tempFile(path) || spiOpen(&dev, path, 8000000, sizeof(pixels))) {
+		check(0, what);
+		return;
+	}
+	for(i=0; i<(int)sizeof(pixels); i++) pixels[i] = i * 7;
+	rowBytes = (first > last) ? 0 : (last - first + 1) * 128 * 2;
+	n  = spiWindow(screenType, 128, 128, first, last, cols, rows);
+	ok = !spiWrite(&dev, &spiWindowCmd[screenType][0], 1) &&
+	     !spiWrite(&dev, cols, n) &&
+	     !spiWrite(&dev, &spiWindowCmd[screenType][1], 1) &&
+	     !spiWrite(&dev, rows, n) &&
+	     !spiWrite(&dev, &spiWindowCmd[screenType][2], 1);
+	if(rowBytes) ok = ok && !spiWrite(&dev, &pixels[first * 256], rowBytes);
+	spiClose(&dev);
+	ok = ok && (readBack(path, back, sizeof(back)) == len + rowBytes) &&
+	  !memcmp(back, expect, len) &&
+	  !memcmp(&back[len], &pixels[first * 256], rowBytes);
+	(void)unlink(path);
+	check(ok, what);
+}
+
+int main(int argc, char *argv[]) {
+	uint8_t *data;
+	int      i;
+
+	if(!(data = (uint8_t *)malloc(TEST_BYTES))) return 1;
+	srand(1);
+	for(i=0; i<TEST_BYTES; i++) data[i] = rand();
+	roundTrip(data, TEST_BYTES, TEST_BYTES, TEST_BYTES);
+	roundTrip(data, TEST_BYTES, 65536, TEST_BYTES);
+	roundTrip(data, TEST_BYTES, SPI_XFER_MAX, TEST_BYTES);
+	roundTrip(data, TEST_BYTES, 5000, 32768);
+	roundTrip(data, TEST_BYTES, 333, 1000);
+	roundTrip(data, TEST_BYTES, TEST_BYTES, 1);
+	free(data);
+
+	window(SCREEN_OLED, 10, 20, (uint8_t[]) {
+	  0x15, 0x00, 0x7F,               // Column set: 0 to 127
+	  0x75, 0x0A, 0x14,               // Row set: 10 to 20
+	  0x5C }, 7);                     // RAM write
+	window(SCREEN_OLED, 1, 0, (uint8_t[]) { // Unchanged: all rows
+	  0x15, 0x00, 0x7F,
+	  0x75, 0x00, 0x7F,
+	  0x5C }, 7);
+	window(SCREEN_TFT_GREEN, 10, 20, (uint8_t[]) {
+	  0x2A, 0x00, 0x02, 0x00, 0x81,   // Column set: 2 to 129
+	  0x2B, 0x00, 0x0D, 0x00, 0x17,   // Row set: 13 to 23
+	  0x2C }, 11);                    // RAM write
+	window(SCREEN_TFT_GREEN, 0, 127, (uint8_t[]) {
+	  0x2A, 0x00, 0x02, 0x00, 0x81,
+	  0x2B, 0x00, 0x03, 0x00, 0x82,   // Row set: 3 to 130
+	  0x2C }, 11);
+	window(SCREEN_TFT_GREEN, 1, 0, (uint8_t[]) { // Unchanged: all rows
+	  0x2A, 0x00, 0x02, 0x00, 0x81,
+	  0x2B, 0x00, 0x03, 0x00, 0x82,
+	  0x2C }, 11);
+
+	(void)puts(failures ? "FAIL" : "OK");
+	return failures ? 1 : 0;
+}
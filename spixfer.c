@@ -0,0 +1,126 @@
+// SPI output for fbx2; see spixfer.h.
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <sys/stat.h>
+#include <sys/ioctl.h>
+#include "spixfer.h"
+
+// spidev rejects messages totalling more than its 'bufsiz' module
+// parameter, 4096 bytes by default; raising it (spidev.bufsiz=65536 in
+// /boot/cmdline.txt) lets a whole frame go out in one ioctl().  Returns
+// the current limit, or the default if it can't be read.
+int spiBufSize(void) {
+	FILE *fp;
+	int   n = SPI_XFER_MAX;
+	if((fp = fopen("/sys/module/spidev/parameters/bufsiz", "r"))) {
+		if((fscanf(fp, "%d", &n) != 1) || (n < 1)) n = SPI_XFER_MAX;
+		fclose(fp);
+	}
+	return n;
+}
+
+// Open SPI device at 'path' for writes at 'speed' Hz, mode 0, with room
+// for messages of up to 'maxBytes' (e.g. one screen's frame).  If 'path'
+// isn't a character device (e.g. an existing regular file or FIFO, for
+// testing elsewhere than a Pi), data sent to it is written there as-is,
+// one write() per transfer.  Returns 0 on success, -1 on error.
+int spiOpen(SPIDevice *dev, const char *path, uint32_t speed, int maxBytes) {
+	struct stat st;
+	uint8_t     mode = SPI_MODE_0;
+	int         i;
+
+	memset(dev, 0, sizeof(SPIDevice));
+	if((dev->fd = open(path, O_WRONLY)) < 0) return -1;
+	dev->isFile = (fstat(dev->fd, &st) < 0) || !S_ISCHR(st.st_mode);
+	if(!dev->isFile) {
+		(void)ioctl(dev->fd, SPI_IOC_WR_MODE, &mode);
+		(void)ioctl(dev->fd, SPI_IOC_WR_MAX_SPEED_HZ, &speed);
+	}
+	dev->maxMsg = dev->isFile ? maxBytes : spiBufSize();
+	if(dev->maxMsg > maxBytes) dev->maxMsg = maxBytes;
+	if(dev->maxMsg < 1)        dev->maxMsg = 1;
+	dev->maxXfers = (dev->maxMsg + SPI_XFER_MAX - 1) / SPI_XFER_MAX;
+	if(!(dev->xfer = (struct spi_ioc_transfer *)calloc(dev->maxXfers,
+	  sizeof(struct spi_ioc_transfer)))) {
+		close(dev->fd);
+		return -1;
+	}
+	for(i=0; i<dev->maxXfers; i++) {
+		dev->xfer[i].speed_hz      = speed;
+		dev->xfer[i].bits_per_word = 8;
+	}
+	return 0;
+}
+
+// Send 'len' bytes: split into transfers of up to SPI_XFER_MAX bytes,
+// batched into as few ioctl() messages as spidev's limit allows (all of
+// them in one, typically).  Returns 0 on success, -1 on error.
+int spiWrite(SPIDevice *dev, const void *data, int len) {
+	const uint8_t *ptr = (const uint8_t *)data;
+	int            i, n, msgLen, xfers;
+
+	while(len > 0) {
+		msgLen = (len < dev->maxMsg) ? len : dev->maxMsg;
+		for(xfers=0; msgLen > 0; xfers++) {
+			n = (msgLen < SPI_XFER_MAX) ? msgLen : SPI_XFER_MAX;
+			dev->xfer[xfers].tx_buf = (unsigned long)ptr;
+			dev->xfer[xfers].len    = n;
+			ptr    += n;
+			len    -= n;
+			msgLen -= n;
+		}
+		if(dev->isFile) {
+			for(i=0; i<xfers; i++) {
+				if(write(dev->fd, (void *)(unsigned long)
+				  dev->xfer[i].tx_buf, dev->xfer[i].len) !=
+				  (ssize_t)dev->xfer[i].len) return -1;
+			}
+		} else if(ioctl(dev->fd, SPI_IOC_MESSAGE(xfers), dev->xfer) < 0) {
+			return -1;
+		}
+	}
+	return 0;
+}
+
+// Column set, row set and RAM write commands per screen type, issued in
+// that order before each frame's pixel data.
+const uint8_t spiWindowCmd[2][3] = {
+	{ 0x15, 0x75, 0x5C }, // SCREEN_OLED (SSD1351)
+	{ 0x2A, 0x2B, 0x2C }  // SCREEN_TFT_GREEN (ST7735, 'green tab')
+};
+
+// Arguments for the column and row set commands above: all 'width'
+// columns and rows 'first' to 'last' (all 'height' rows if first > last,
+// e.g. an eye with nothing to send).  The TFT's RAM starts 2 columns and
+// 3 rows in, and takes 16-bit start and end values.  Fills cols[] and
+// rows[] (4 bytes each) and returns the number of bytes used in each.
+int spiWindow(int screenType, int width, int height, int first, int last,
+  uint8_t *cols, uint8_t *rows) {
+	if(first > last) {
+		first = 0;
+		last  = height - 1;
+	}
+	if(screenType == SCREEN_OLED) {
+		cols[0] = 0;     cols[1] = width - 1;
+		rows[0] = first; rows[1] = last;
+		return 2;
+	}
+	first += 3; // rowstart
+	last  += 3;
+	width += 2; // colstart
+	cols[0] = 0;                cols[1] = 2;
+	cols[2] = (width - 1) >> 8; cols[3] = (width - 1) & 0xFF;
+	rows[0] = first >> 8;       rows[1] = first & 0xFF;
+	rows[2] = last  >> 8;       rows[3] = last  & 0xFF;
+	return 4;
+}
+
+void spiClose(SPIDevice *dev) {
+	close(dev->fd);
+	free(dev->xfer);
+	dev->xfer = NULL;
+}
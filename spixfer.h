@@ -0,0 +1,36 @@
+// SPI output for fbx2: pixel and command data to one screen's spidev
+// device, as batched multi-transfer ioctl() messages.  Kept apart from
+// fbx2.c (no Raspberry Pi libraries needed) so it can be built and
+// exercised on any Linux box, e.g. against a plain file or FIFO standing
+// in for the spidev device; see spiOpen().
+
+#ifndef _SPIXFER_H_
+#define _SPIXFER_H_
+
+#include <stdint.h>
+#include <linux/spi/spidev.h>
+
+#define SPI_XFER_MAX 4096 // Max bytes per transfer within a message
+
+#define SCREEN_OLED      0 // Compatible screen types,
+#define SCREEN_TFT_GREEN 1 // just these two for now.
+
+typedef struct {
+	int       fd;       // File descriptor
+	int       isFile;   // Not a spidev device: data is write()n instead
+	int       maxMsg;   // Max bytes per ioctl() message (spidev bufsiz)
+	int       maxXfers; // Size of xfer[] array
+	struct spi_ioc_transfer *xfer; // Transfers of current message
+} SPIDevice;
+
+extern int  spiOpen(SPIDevice *dev, const char *path, uint32_t speed,
+              int maxBytes);
+extern int  spiWrite(SPIDevice *dev, const void *data, int len);
+extern void spiClose(SPIDevice *dev);
+extern int  spiBufSize(void);
+extern int  spiWindow(int screenType, int width, int height, int first,
+              int last, uint8_t *cols, uint8_t *rows);
+
+extern const uint8_t spiWindowCmd[2][3];
+
+#endif // _SPIXFER_H_
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+# Resolution-aware texture cache.  The texture maps are 512 to 1024 pixels
+# square, loaded at full size and PNG/JPEG-decoded on every start, which
+# is a visible share of boot time on a Pi Zero, though the eye is only
+# drawn at eyeRadius pixels.  loadTexture() picks a size from what's
+# actually drawn (textureSize(); see mapSizes() in eyeasset.py), resamples
+# the image once and caches the result as raw pixels, which later starts memory-map and hand to pi3d
+# without decoding.  Like the eye bundles (see eyeasset.py), a cache file
+# stores a content hash of its source image and is rebuilt when it no
+# longer matches.
+
+import hashlib
+import mmap
+import os
+import struct
+import numpy as np
+import pi3d
+
+# Cache file layout: header, then pixel rows (top first) as stored in the
+# array handed to pi3d.Texture, starting at offset TEXCACHE_ALIGN.
+TEXCACHE_MAGIC   = b"EYTX"
+TEXCACHE_VERSION = 1
+TEXCACHE_HEADER  = struct.Struct("<4sI20sIII") # magic, version, sha1, w,h,c
+TEXCACHE_ALIGN   = 64
+
+
+# Texture size (width, height) for a map spanning 'size' (width, height)
+# pixels on screen: each rounded up to a power of two, but not above the
+# source's 'sourceSize' (never upscaled), and a multiple of 4 as pi3d
+# would make it.
+def textureSize(size, sourceSize):
+	result = []
+	for n, source in zip(size, sourceSize):
+		t = 4
+		while t < n and t < source: t *= 2
+		t = min(t, source)
+		result.append(max(t - t % 4, 4))
+	return tuple(result)
+
+
+# Cache filename for an image at a given size, e.g. graphics/sclera.png
+# at 1024 x 256 -> graphics/sclera-1024x256.texcache
+def cachePathFor(path, width, height):
+	return "%s-%dx%d.texcache" % (os.path.splitext(path)[0], width, height)
+
+
+def imageHash(path):
+	h = hashlib.sha1()
+	with open(path, "rb") as f: h.update(f.read())
+	return h.digest()
+
+
+# Decode image and resample to 'width' x 'height' (multiples of 4, as
+# pi3d would make them).  Returns uint8 array (rows, columns, channels):
+# RGB, RGBA or L (1 channel), as pi3d.Texture uses.
+def resampleImage(path, width, height):
+	from PIL import Image
+	im = Image.open(path)
+	if im.mode not in ("RGB", "RGBA", "L"): im = im.convert("RGBA")
+	if (width, height) != im.size:
+		im = im.resize((width, height), Image.LANCZOS)
+	a = np.asarray(im, dtype=np.uint8)
+	if a.ndim == 2: a = a[:, :, None]
+	return np.ascontiguousarray(a)
+
+
+def writeCache(cachePath, pixels, digest):
+	h, w, c = pixels.shape
+	tmpPath = cachePath + ".tmp"
+	with open(tmpPath, "wb") as f:
+		f.write(TEXCACHE_HEADER.pack(TEXCACHE_MAGIC, TEXCACHE_VERSION,
+		  digest, w, h, c))
+		f.write(b"\0" * (TEXCACHE_ALIGN - f.tell()))
+		f.write(pixels.tobytes())
+	os.rename(tmpPath, cachePath) # Replace atomically
+
+
+# Memory-map a cache file and return its (read-only) pixel array, or None
+# if missing, malformed or not matching 'digest'.
+def readCache(cachePath, digest):
+	try:
+		with open(cachePath, "rb") as f:
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	except (IOError, OSError, ValueError):
+		return None
+	if len(m) < TEXCACHE_ALIGN: return None
+	magic, version, fileHash, w, h, c = TEXCACHE_HEADER.unpack_from(m, 0)
+	if ((magic != TEXCACHE_MAGIC) or (version != TEXCACHE_VERSION) or
+	    (fileHash != digest) or (len(m) < TEXCACHE_ALIGN + w * h * c)):
+		return None
+	return np.frombuffer(m, dtype=np.uint8, count=w * h * c,
+	  offset=TEXCACHE_ALIGN).reshape(h, w, c)
+
+
+# Load image at path as a pi3d.Texture no larger than needed for a map
+# spanning 'size' (width, height) pixels on screen (see textureSize();
+# None = full size), via the cache, (re)building it if needed (and the
+# directory is writable).  Other arguments are passed on to pi3d.Texture.
+def loadTexture(path, size=None, **kwargs):
+	digest = imageHash(path)
+	from PIL import Image
+	source = Image.open(path).size # Header only; not decoded
+	width, height = textureSize(size or source, source)
+	cachePath = cachePathFor(path, width, height)
+	pixels    = readCache(cachePath, digest)
+	if pixels is None:
+		pixels = resampleImage(path, width, height)
+		try:
+			writeCache(cachePath, pixels, digest)
+		except (IOError, OSError):
+			pass # Not writable; use resampled image as-is
+	return pi3d.Texture(pixels, **kwargs)
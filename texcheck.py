@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+# Check for texture sizing (texcache.py, mapSizes() in eyeasset.py): for
+# each renderer's default configuration, works out the size each texture
+# map is loaded at and checks none is larger than its source and, taken
+# together, they're smaller (so texture memory shrinks to what's drawn).
+# Then resamples each map and round-trips it through a cache file, which
+# must come back at that size.  Needs no display or GL:
+#   python texcheck.py
+# Exits with status 1 if any check fails.
+
+import os
+import shutil
+import sys
+import tempfile
+from PIL import Image
+from eyeasset import *
+from texcache import *
+
+# Renderer, eye design and eyeRadius as set up for a 640x480 display
+configs = (
+  ("eyes"   , "graphics/eye.svg"        , 640 / 5  ),
+  ("cyclops", "graphics/cyclops-eye.svg", 480 / 2.1))
+
+maps = (("iris", "graphics/iris.jpg"), ("sclera", "graphics/sclera.png"),
+        ("lid" , "graphics/lid.png"))
+
+
+if __name__ == "__main__":
+	ok     = True
+	tmpDir = tempfile.mkdtemp()
+	for renderer, svg, radius in configs:
+		mapSize = mapSizes(loadEye(svg), radius)
+		loaded  = sources = 0
+		for name, path in maps:
+			source = Image.open(path).size
+			size   = textureSize(mapSize[name], source)
+			copy   = os.path.join(tmpDir, os.path.basename(path))
+			shutil.copy(path, copy)
+			cached = cachePathFor(copy, *size)
+			digest = imageHash(copy)
+			writeCache(cached, resampleImage(copy, *size), digest)
+			pixels = readCache(cached, digest)
+			good   = (size[0] <= source[0] and size[1] <= source[1] and
+			  pixels is not None and pixels.shape[1::-1] == size)
+			print("%-8s %-7s %4dx%-4d (source %4dx%-4d) %s" % (renderer,
+			  name, size[0], size[1], source[0], source[1],
+			  "ok" if good else "FAILED"))
+			ok       = ok and good
+			loaded  += size[0] * size[1]
+			sources += source[0] * source[1]
+		print("%-8s %d of %d source pixels" % (renderer, loaded, sources))
+		ok = ok and loaded < sources
+	shutil.rmtree(tmpDir)
+	print("OK" if ok else "FAIL")
+	sys.exit(0 if ok else 1)
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+
+# Check for input traces recorded on the device (see inputtrace.py): runs
+# eyes.py (or cyclops.py) headless, as headless.py does, but with
+# TRACE_RECORD set in its configuration rather than headless.py --record,
+# so the trace has only the header the renderer itself writes.  Then
+# replays that trace with headless.py --replay and checks it runs to the
+# end and regenerates the same iris and eyelid geometry as the recording.
+# Records in real time (the renderer's own clock and frame pacing):
+#   python tracecheck.py [eyes|cyclops] [--frames N]
+# Exits with status 1 if the replay fails or its regen counts differ.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import types
+import headless
+
+# Load renderer script as a module, as headless.loadRenderer(), with
+# TRACE_RECORD set to 'path' as if edited in its configuration section.
+def loadRecording(name, path):
+	file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	  name + ".py")
+	with open(file) as f:
+		source = f.read()
+	config = "TRACE_RECORD    = None"
+	if config not in source:
+		raise SystemExit("%s: no '%s' line" % (file, config))
+	source = source.replace(config, "TRACE_RECORD    = %r" % path, 1)
+	mod = types.ModuleType(name)
+	mod.__file__ = file
+	sys.modules[name] = mod
+	exec(compile(source, file, "exec"), mod.__dict__)
+	return mod
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+	  description="Replay a trace recorded with TRACE_RECORD.")
+	parser.add_argument("renderer", nargs="?", default="eyes",
+	  choices=("eyes", "cyclops"))
+	parser.add_argument("--frames", type=int, default=120)
+	args = parser.parse_args()
+
+	fd, path = tempfile.mkstemp(suffix=".trace")
+	os.close(fd)
+	headless.installStubs()
+	headless.installNullDisplay(1280, 720)
+	mod = loadRecording(args.renderer, path)
+	headless.runFrames(mod, args.frames)
+	mod.time.trace.close()
+	recorded = (mod.rig.irisRegens(), mod.rig.lidRegens())
+	print("recorded %d frames: regens iris %d, eyelid %d" %
+	  ((args.frames,) + recorded))
+	sys.stdout.flush()
+
+	# Renderer left for the replay to find in the trace header
+	proc = subprocess.Popen([sys.executable,
+	  os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	  "headless.py"), "--replay", path, "--frames", str(args.frames),
+	  "--json"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	out = proc.communicate()[0].decode()
+	os.remove(path)
+	try:
+		result   = json.loads(out.strip().splitlines()[-1])
+		replayed = (result["iris_regens"], result["lid_regens"])
+	except (ValueError, IndexError, KeyError):
+		print(out)
+		print("FAIL (replay failed, status %d)" % proc.returncode)
+		os._exit(1)
+	print("replayed %d frames: regens iris %d, eyelid %d" %
+	  ((result["frames"],) + replayed))
+	ok = proc.returncode == 0 and result["renderer"] == args.renderer and \
+	  replayed == recorded
+	print("OK" if ok else "FAIL")
+	sys.stdout.flush()
+	os._exit(0 if ok else 1) # As headless.py; no GL context to free